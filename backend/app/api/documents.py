@@ -1,25 +1,33 @@
 """
 文档管理API端点
 """
+import os
+import re
 import uuid
 import asyncio
+import time
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Query
-from fastapi.responses import JSONResponse
+import httpx
+import orjson
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Query, Request, BackgroundTasks
+from fastapi.responses import JSONResponse, StreamingResponse
 from loguru import logger
 
 from app.core.config import get_settings
+from app.core.task_queue import enqueue_document_processing
 from app.models.document import (
-    Document, DocumentType, DocumentStatus, DocumentMetadata,
+    Document, ChunkRecord, ChunkMetadata, DocumentType, DocumentStatus, DocumentMetadata,
     DocumentUploadRequest, DocumentUploadResponse,
     DocumentListRequest, DocumentListResponse,
-    DocumentProcessRequest, DocumentProcessResponse
+    DocumentProcessRequest, DocumentProcessResponse,
+    BatchRequest, BatchSubRequest, BatchSubResponse, BatchResponse
 )
 from app.services.document_processor import DocumentProcessor
 from app.services.document_storage import DocumentStorage
+from app.services.document_classifier import document_classifier
 
 
 router = APIRouter(prefix="/api/documents", tags=["documents"])
@@ -28,9 +36,47 @@ router = APIRouter(prefix="/api/documents", tags=["documents"])
 document_processor = DocumentProcessor()
 document_storage = DocumentStorage()
 
+# 分类接口响应缓存: key -> (写入时间, 响应)
+_category_cache: Dict[Any, tuple] = {}
+CATEGORY_CACHE_TTL = 60  # 秒
 
-async def process_document_async(document_id: str, request: DocumentProcessRequest):
-    """异步处理文档"""
+# 批量重新分类的最大并发数
+RECLASSIFY_CONCURRENCY = 16
+
+# 批量接口子请求的最大并发数
+BATCH_CONCURRENCY = 8
+
+# 可合并为单次查询的文档详情子请求
+_DOCUMENT_DETAIL_URL_RE = re.compile(r'^/api/documents/([^/?#]+)$')
+
+# 中英文句末标点（含其后的空白）
+_SENTENCE_END_RE = re.compile(r'[.!?。！？]+\s*|\n+')
+
+
+def _get_category_cache(key) -> Optional[Dict[str, Any]]:
+    """获取未过期的分类缓存"""
+    cached = _category_cache.get(key)
+    if cached and time.monotonic() - cached[0] < CATEGORY_CACHE_TTL:
+        return cached[1]
+    return None
+
+
+def _set_category_cache(key, value: Dict[str, Any]):
+    """写入分类缓存"""
+    _category_cache[key] = (time.monotonic(), value)
+
+
+def invalidate_category_cache():
+    """文档增删或分类变化时清空分类缓存"""
+    _category_cache.clear()
+
+
+async def process_document_async(
+    document_id: str,
+    request: DocumentProcessRequest,
+    raise_on_error: bool = False
+):
+    """异步处理文档（raise_on_error 为 True 时记录失败状态后重新抛出异常，供任务队列重试）"""
     try:
         logger.info(f"开始异步处理文档: {document_id}")
 
@@ -46,22 +92,24 @@ async def process_document_async(document_id: str, request: DocumentProcessReque
         logger.info(f"文档 {document_id} 状态更新为处理中")
 
         # 处理文档
-        if document.file_path and Path(document.file_path).exists():
-            # 提取内容和元数据
-            content, metadata = await document_processor.extract_text_and_metadata(
+        file_exists = bool(document.file_path) and await asyncio.to_thread(Path(document.file_path).exists)
+        if file_exists:
+            # 提取内容、清理文本并生成预览
+            content, preview, metadata = await document_processor.extract_clean_and_preview(
                 Path(document.file_path),
                 document.document_type
             )
 
             # 更新文档
-            document.content = document_processor.clean_text(content)
-            document.content_preview = document_processor.create_content_preview(document.content)
+            document.content = content
+            document.content_preview = preview
             document.metadata = metadata
             document.status = DocumentStatus.PROCESSED
             document.processed_at = datetime.now()
 
             # 保存更新
             await document_storage.save_document(document)
+            invalidate_category_cache()
             logger.info(f"文档 {document_id} 处理完成")
 
             # 创建文档块（如果需要）
@@ -85,10 +133,34 @@ async def process_document_async(document_id: str, request: DocumentProcessReque
                 await document_storage.save_document(document)
         except Exception as save_error:
             logger.error(f"保存错误状态失败: {str(save_error)}")
+        if raise_on_error:
+            raise
+
+
+async def start_document_processing(document_id: str):
+    """启动上传文档的自动处理任务"""
+    try:
+        logger.info(f"文档 {document_id} 将进行自动处理")
+        # 创建处理请求
+        process_request = DocumentProcessRequest(
+            force_reprocess=False,
+            create_chunks=True,
+            extract_metadata=True
+        )
+
+        # 优先投递到任务队列，未启用时在当前进程内处理
+        if await enqueue_document_processing(document_id, process_request.model_dump()):
+            logger.info(f"文档 {document_id} 自动处理任务已投递")
+        else:
+            await process_document_async(document_id, process_request)
+
+    except Exception as e:
+        logger.error(f"启动文档自动处理失败: {str(e)}")
 
 
 @router.post("/upload", response_model=DocumentUploadResponse)
 async def upload_document(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     tags: str = Form(""),
     custom_metadata: str = Form("{}"),
@@ -101,32 +173,27 @@ async def upload_document(
         if not file.filename:
             raise HTTPException(status_code=400, detail="文件名不能为空")
         
-        # 读取文件内容
-        file_content = await file.read()
-        file_size = len(file_content)
-        
-        # 验证文件
-        is_valid, message = document_processor.validate_file(file.filename, file_size)
+        # 验证文件类型（大小在流式保存时校验）
+        is_valid, message = document_processor.validate_file(file.filename)
         if not is_valid:
             raise HTTPException(status_code=400, detail=message)
         
-        # 保存文件
-        file_id, file_path, mime_type = await document_processor.save_uploaded_file(
-            file_content, file.filename
-        )
-        
-        # 计算文件哈希
-        file_hash = document_processor.get_file_hash(Path(file_path))
+        # 流式保存文件，同时计算大小和哈希
+        try:
+            file_id, file_path, mime_type, file_size, file_hash = await document_processor.save_uploaded_file(
+                file, file.filename
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         # 检测文档类型
         document_type = document_processor.detect_document_type(file.filename, mime_type)
         
         # 解析标签和自定义元数据
-        import json
         try:
             tags_list = [tag.strip() for tag in tags.split(",") if tag.strip()] if tags else []
-            custom_metadata_dict = json.loads(custom_metadata) if custom_metadata else {}
-        except json.JSONDecodeError:
+            custom_metadata_dict = orjson.loads(custom_metadata) if custom_metadata else {}
+        except orjson.JSONDecodeError:
             custom_metadata_dict = {}
         
         # 创建文档对象
@@ -143,29 +210,29 @@ async def upload_document(
             metadata=DocumentMetadata(tags=tags_list, custom_fields=custom_metadata_dict)
         )
         
-        # 保存到数据库
-        success = await document_storage.save_document(document)
-        if not success:
-            raise HTTPException(status_code=500, detail="保存文档失败")
+        # 查重和入库在同一个写事务中完成，响应返回前文档记录即可查询
+        saved_id = await document_storage.insert_document_if_new(document)
+        if saved_id != file_id:
+            await asyncio.to_thread(Path(file_path).unlink, missing_ok=True)
+            if saved_id is None:
+                raise HTTPException(status_code=500, detail="保存文档记录失败")
+            
+            # 内容相同的文档已存在时直接复用，跳过后续处理流程
+            existing = await document_storage.get_document(saved_id)
+            logger.info(f"文档内容与已有文档 {saved_id} 相同，跳过保存")
+            return DocumentUploadResponse(
+                success=True,
+                document_id=saved_id,
+                filename=file.filename,
+                file_size=file_size,
+                status=existing.status if existing else DocumentStatus.UPLOADING,
+                message="文件已存在"
+            )
+        invalidate_category_cache()
         
-        # 如果需要自动处理，启动处理任务
+        # 只有处理流程在响应返回后执行
         if auto_process:
-            logger.info(f"文档 {file_id} 将进行自动处理")
-            try:
-                # 创建处理请求
-                process_request = DocumentProcessRequest(
-                    force_reprocess=False,
-                    create_chunks=True,
-                    extract_metadata=True
-                )
-
-                # 异步处理文档
-                import asyncio
-                asyncio.create_task(process_document_async(file_id, process_request))
-                logger.info(f"文档 {file_id} 自动处理任务已启动")
-
-            except Exception as e:
-                logger.error(f"启动文档自动处理失败: {str(e)}")
+            background_tasks.add_task(start_document_processing, file_id)
         
         return DocumentUploadResponse(
             success=True,
@@ -187,36 +254,20 @@ async def upload_document(
 async def get_category_stats():
     """获取文档分类统计信息"""
     try:
-        # 获取所有文档
-        documents, _ = await document_storage.list_documents(page=1, page_size=1000)
-
-        # 统计各分类的文档数量
-        category_stats = {}
-        for doc in documents:
-            # 使用数据库中的分类字段，如果没有则使用默认值
-            category = getattr(doc, 'category', None) or "未分类"
-
-            if category not in category_stats:
-                category_stats[category] = {
-                    "category": category,
-                    "count": 0,
-                    "total_size": 0,
-                    "latest_update": None
-                }
+        cached = _get_category_cache("stats")
+        if cached is not None:
+            return cached
 
-            category_stats[category]["count"] += 1
-            category_stats[category]["total_size"] += doc.file_size or 0
+        # 由数据库完成分组聚合
+        category_stats = await document_storage.get_category_stats()
 
-            # 更新最新更新时间
-            if doc.updated_at:
-                if not category_stats[category]["latest_update"] or doc.updated_at > category_stats[category]["latest_update"]:
-                    category_stats[category]["latest_update"] = doc.updated_at
-
-        return {
+        response = {
             "success": True,
-            "category_stats": list(category_stats.values()),
-            "total_documents": len(documents)
+            "category_stats": category_stats,
+            "total_documents": sum(stat["count"] for stat in category_stats)
         }
+        _set_category_cache("stats", response)
+        return response
     except Exception as e:
         logger.error(f"获取分类统计失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取分类统计失败: {str(e)}")
@@ -230,26 +281,21 @@ async def get_documents_by_category(
 ):
     """根据分类获取文档列表"""
     try:
-        # 获取所有文档
-        all_documents, _ = await document_storage.list_documents(page=1, page_size=1000)
+        cache_key = ("category", category, page, page_size)
+        cached = _get_category_cache(cache_key)
+        if cached is not None:
+            return cached
 
-        # 筛选指定分类的文档
-        filtered_documents = []
-        for doc in all_documents:
-            # 使用数据库中的分类字段，处理None值
-            doc_category = getattr(doc, 'category', None) or "未分类"
-            if doc_category == category:
-                filtered_documents.append(doc)
-
-        # 分页处理
-        total = len(filtered_documents)
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        page_documents = filtered_documents[start_idx:end_idx]
+        # 由数据库完成分类筛选和分页
+        page_documents, total = await document_storage.list_documents(
+            page=page,
+            page_size=page_size,
+            category=category
+        )
 
         total_pages = (total + page_size - 1) // page_size
 
-        return {
+        response = {
             "success": True,
             "documents": page_documents,
             "total": total,
@@ -258,6 +304,8 @@ async def get_documents_by_category(
             "total_pages": total_pages,
             "category": category
         }
+        _set_category_cache(cache_key, response)
+        return response
 
     except Exception as e:
         logger.error(f"获取分类文档失败: {str(e)}")
@@ -284,7 +332,8 @@ async def list_documents(
         
         total_pages = (total + page_size - 1) // page_size
         
-        return DocumentListResponse(
+        # 文档来自存储层，已经是校验过的 Document 实例，跳过重复校验
+        return DocumentListResponse.model_construct(
             success=True,
             documents=documents,
             total=total,
@@ -298,6 +347,34 @@ async def list_documents(
         raise HTTPException(status_code=500, detail=f"获取文档列表失败: {str(e)}")
 
 
+@router.get("/stream")
+async def stream_documents(
+    page: int = Query(1, ge=1),
+    page_size: int = Query(DocumentStorage.STREAM_MAX_PAGE_SIZE, ge=1, le=DocumentStorage.STREAM_MAX_PAGE_SIZE),
+    status: Optional[DocumentStatus] = Query(None),
+    document_type: Optional[DocumentType] = Query(None),
+    search_query: Optional[str] = Query(None),
+    category: Optional[str] = Query(None)
+):
+    """以NDJSON流式返回文档列表，逐条序列化，内存占用与结果集大小无关"""
+    async def generate():
+        try:
+            async for document in document_storage.iter_documents(
+                page=page,
+                page_size=page_size,
+                status=status,
+                document_type=document_type,
+                search_query=search_query,
+                category=category
+            ):
+                yield orjson.dumps(document.model_dump()) + b"\n"
+        except Exception as e:
+            logger.error(f"流式获取文档列表失败: {str(e)}")
+            raise
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
 @router.get("/{document_id}")
 async def get_document(document_id: str):
     """获取单个文档详情"""
@@ -318,6 +395,65 @@ async def get_document(document_id: str):
         raise HTTPException(status_code=500, detail=f"获取文档失败: {str(e)}")
 
 
+@router.post("/batch", response_model=BatchResponse)
+async def batch_documents(batch: BatchRequest, request: Request):
+    """批量执行文档子请求，一次往返完成多个操作"""
+    responses: Dict[str, BatchSubResponse] = {}
+    detail_requests: Dict[str, str] = {}
+    dispatch_requests: List[BatchSubRequest] = []
+    static_paths = {route.path for route in router.routes if "{" not in route.path}
+
+    for sub in batch.requests:
+        if not sub.url.startswith(router.prefix) or sub.url.rstrip("/").endswith("/batch"):
+            responses[sub.id] = BatchSubResponse(
+                id=sub.id, status=400, body={"detail": f"不支持的子请求地址: {sub.url}"}
+            )
+            continue
+        match = _DOCUMENT_DETAIL_URL_RE.match(sub.url) if sub.method == "GET" else None
+        # /stream 等静态子路由不是文档ID，交给路由分发
+        if match and sub.url not in static_paths:
+            detail_requests[sub.id] = match.group(1)
+        else:
+            dispatch_requests.append(sub)
+
+    # 文档详情请求合并为一次 IN 查询
+    if detail_requests:
+        documents = await document_storage.get_documents(list(detail_requests.values()))
+        for sub_id, document_id in detail_requests.items():
+            document = documents.get(document_id)
+            if document:
+                body = {"success": True, "document": document.model_dump(mode="json")}
+                responses[sub_id] = BatchSubResponse(id=sub_id, status=200, body=body)
+            else:
+                responses[sub_id] = BatchSubResponse(id=sub_id, status=404, body={"detail": "文档不存在"})
+
+    # 其余子请求在进程内通过 ASGI 分发，省去网络往返
+    if dispatch_requests:
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+        transport = httpx.ASGITransport(app=request.app)
+
+        async with httpx.AsyncClient(transport=transport, base_url=str(request.base_url)) as client:
+            async def dispatch(sub: BatchSubRequest) -> BatchSubResponse:
+                async with semaphore:
+                    try:
+                        response = await client.request(sub.method, sub.url, json=sub.body)
+                        body = response.json() if response.content else None
+                        return BatchSubResponse(id=sub.id, status=response.status_code, body=body)
+                    except Exception as e:
+                        logger.error(f"批量子请求失败 {sub.method} {sub.url}: {str(e)}")
+                        return BatchSubResponse(id=sub.id, status=500, body={"detail": str(e)})
+
+            results = await asyncio.gather(*(dispatch(sub) for sub in dispatch_requests))
+
+        for result in results:
+            responses[result.id] = result
+
+    return BatchResponse(
+        success=True,
+        responses=[responses[sub.id] for sub in batch.requests]
+    )
+
+
 @router.post("/{document_id}/process", response_model=DocumentProcessResponse)
 async def process_document(document_id: str, request: DocumentProcessRequest):
     """处理文档（提取文本、元数据等）"""
@@ -342,25 +478,20 @@ async def process_document(document_id: str, request: DocumentProcessRequest):
         try:
             # 提取文本和元数据
             if request.extract_metadata:
-                content, metadata = await document_processor.extract_text_and_metadata(
+                content, preview, metadata = await document_processor.extract_clean_and_preview(
                     Path(document.file_path), document.document_type
                 )
                 
                 # 更新文档
-                document.content = document_processor.clean_text(content)
-                document.content_preview = document_processor.create_content_preview(document.content)
+                document.content = content
+                document.content_preview = preview
                 document.metadata = metadata
                 document.status = DocumentStatus.PROCESSED
                 document.processed_at = datetime.now()
-                
-                # 保存更新
-                await document_storage.save_document(document)
             
             # 执行文档分类
             try:
-                from app.services.document_classifier import DocumentClassifier
-                classifier = DocumentClassifier()
-                classification_result = await classifier.classify_document(document)
+                classification_result = await document_classifier.classify_document(document)
 
                 # 更新文档分类信息
                 document.category = classification_result.category
@@ -371,10 +502,9 @@ async def process_document(document_id: str, request: DocumentProcessRequest):
 
                 # 设置标签和关键词
                 if classification_result.auto_tags:
-                    import json
-                    document.auto_tags = json.dumps(classification_result.auto_tags, ensure_ascii=False)
+                    document.auto_tags = orjson.dumps(classification_result.auto_tags).decode()
                 if classification_result.keywords:
-                    document.keywords = json.dumps(classification_result.keywords, ensure_ascii=False)
+                    document.keywords = orjson.dumps(classification_result.keywords).decode()
                 if classification_result.summary:
                     document.summary = classification_result.summary
 
@@ -396,10 +526,10 @@ async def process_document(document_id: str, request: DocumentProcessRequest):
                 if chunks:
                     await document_storage.save_document_chunks(chunks)
                     document.chunk_count = len(chunks)
-                    await document_storage.save_document(document)
 
-            # 保存最终的文档信息（包含分类结果）
+            # 一次性保存最终的文档信息（包含提取内容、分类结果和分块数）
             await document_storage.save_document(document)
+            invalidate_category_cache()
 
             return DocumentProcessResponse(
                 success=True,
@@ -438,8 +568,7 @@ async def delete_document(document_id: str):
         # 删除物理文件
         try:
             file_path = Path(document.file_path)
-            if file_path.exists():
-                file_path.unlink()
+            await asyncio.to_thread(file_path.unlink, missing_ok=True)
         except Exception as e:
             logger.warning(f"删除物理文件失败: {str(e)}")
         
@@ -447,6 +576,7 @@ async def delete_document(document_id: str):
         success = await document_storage.delete_document(document_id)
         if not success:
             raise HTTPException(status_code=500, detail="删除文档失败")
+        invalidate_category_cache()
         
         return {
             "success": True,
@@ -475,45 +605,49 @@ async def reclassify_all_documents():
                 "processed_count": 0
             }
 
-        # 导入分类器
-        from app.services.document_classifier import DocumentClassifier
-        classifier = DocumentClassifier()
-
-        processed_count = 0
-        failed_count = 0
-
-        for document in processed_documents:
-            try:
-                # 执行文档分类
-                classification_result = await classifier.classify_document(document)
-
-                # 更新文档分类信息
-                document.category = classification_result.category
-                document.subcategory = classification_result.subcategory
-                document.classification_confidence = classification_result.confidence
-                document.classification_method = "manual"  # 标记为手动触发
-                document.classification_at = datetime.now()
-
-                # 设置标签和关键词
-                if classification_result.auto_tags:
-                    import json
-                    document.auto_tags = json.dumps(classification_result.auto_tags, ensure_ascii=False)
-                if classification_result.keywords:
-                    document.keywords = json.dumps(classification_result.keywords, ensure_ascii=False)
-                if classification_result.summary:
-                    document.summary = classification_result.summary
-
-                document.language = classification_result.language
-
-                # 保存更新
-                await document_storage.save_document(document)
-                processed_count += 1
 
-                logger.info(f"文档重新分类完成: {document.filename} -> {classification_result.category}")
+        # 批量分类（限制并发，LLM调用按批合并）
+        results = await document_classifier.classify_documents(
+            processed_documents, max_concurrent=RECLASSIFY_CONCURRENCY
+        )
 
-            except Exception as e:
-                logger.error(f"文档重新分类失败: {document.filename} - {str(e)}")
+        # 应用分类结果
+        classified_documents = []
+        failed_count = 0
+        for document, classification_result in zip(processed_documents, results):
+            if isinstance(classification_result, Exception):
+                logger.error(f"文档重新分类失败: {document.filename} - {str(classification_result)}")
                 failed_count += 1
+                continue
+
+            # 更新文档分类信息
+            document.category = classification_result.category
+            document.subcategory = classification_result.subcategory
+            document.classification_confidence = classification_result.confidence
+            document.classification_method = "manual"  # 标记为手动触发
+            document.classification_at = datetime.now()
+
+            # 设置标签和关键词
+            if classification_result.auto_tags:
+                document.auto_tags = orjson.dumps(classification_result.auto_tags).decode()
+            if classification_result.keywords:
+                document.keywords = orjson.dumps(classification_result.keywords).decode()
+            if classification_result.summary:
+                document.summary = classification_result.summary
+
+            document.language = classification_result.language
+            classified_documents.append(document)
+
+            logger.info(f"文档重新分类完成: {document.filename} -> {classification_result.category}")
+
+        # 一次性批量写回分类字段
+        if await document_storage.update_classifications_bulk(classified_documents):
+            processed_count = len(classified_documents)
+        else:
+            processed_count = 0
+            failed_count += len(classified_documents)
+
+        invalidate_category_cache()
 
         return {
             "success": True,
@@ -540,12 +674,9 @@ async def reclassify_document(document_id: str):
         if document.status != DocumentStatus.PROCESSED:
             raise HTTPException(status_code=400, detail="只能对已处理的文档进行重新分类")
 
-        # 导入分类器
-        from app.services.document_classifier import DocumentClassifier
-        classifier = DocumentClassifier()
 
         # 执行文档分类
-        classification_result = await classifier.classify_document(document)
+        classification_result = await document_classifier.classify_document(document)
 
         # 更新文档分类信息
         old_category = document.category
@@ -557,10 +688,9 @@ async def reclassify_document(document_id: str):
 
         # 设置标签和关键词
         if classification_result.auto_tags:
-            import json
-            document.auto_tags = json.dumps(classification_result.auto_tags, ensure_ascii=False)
+            document.auto_tags = orjson.dumps(classification_result.auto_tags).decode()
         if classification_result.keywords:
-            document.keywords = json.dumps(classification_result.keywords, ensure_ascii=False)
+            document.keywords = orjson.dumps(classification_result.keywords).decode()
         if classification_result.summary:
             document.summary = classification_result.summary
 
@@ -568,6 +698,7 @@ async def reclassify_document(document_id: str):
 
         # 保存更新
         await document_storage.save_document(document)
+        invalidate_category_cache()
 
         logger.info(f"文档重新分类完成: {document.filename} {old_category} -> {classification_result.category}")
 
@@ -587,42 +718,94 @@ async def reclassify_document(document_id: str):
         raise HTTPException(status_code=500, detail=f"文档重新分类失败: {str(e)}")
 
 
-async def create_document_chunks(document: Document) -> List:
-    """创建文档分块"""
-    from app.models.document import DocumentChunk
-    
+def _fixed_window_boundaries(content_length: int, chunk_size: int, overlap: int) -> List[Tuple[int, int]]:
+    """固定窗口分块边界：上一块未到达末尾时才会产生下一块"""
+    return [
+        (start, min(start + chunk_size, content_length))
+        for start in range(0, max(content_length - overlap, 1), chunk_size - overlap)
+    ]
+
+
+def _sentence_chunk_boundaries(content: str, chunk_size: int, overlap: int) -> List[Tuple[int, int]]:
+    """按句子边界贪心打包分块，返回每块在原文中的 (start, end) 偏移"""
+    content_length = len(content)
+
+    # 一次扫描得到句子区间
+    sentence_ends = [m.end() for m in _SENTENCE_END_RE.finditer(content)]
+    if not sentence_ends or sentence_ends[-1] != content_length:
+        sentence_ends.append(content_length)
+    if len(sentence_ends) == 1:
+        # 没有句子边界，退回固定窗口
+        return _fixed_window_boundaries(content_length, chunk_size, overlap)
+
+    spans = []
+    sentence_start = 0
+    for sentence_end in sentence_ends:
+        if sentence_end <= sentence_start:
+            continue
+        # 超长句子按块大小硬切
+        for piece_start in range(sentence_start, sentence_end, chunk_size):
+            spans.append((piece_start, min(piece_start + chunk_size, sentence_end)))
+        sentence_start = sentence_end
+
+    boundaries = []
+    i = 0
+    while i < len(spans):
+        chunk_start = spans[i][0]
+        j = i + 1
+        while j < len(spans) and spans[j][1] - chunk_start <= chunk_size:
+            j += 1
+        chunk_end = spans[j - 1][1]
+        boundaries.append((chunk_start, chunk_end))
+        if j >= len(spans):
+            break
+
+        # 下一块从重叠范围内最早的句子边界开始
+        next_i = j
+        for k in range(i + 1, j):
+            if spans[k][0] >= chunk_end - overlap:
+                next_i = k
+                break
+        i = next_i
+
+    return boundaries
+
+
+async def create_document_chunks(document: Document) -> List[ChunkRecord]:
+    """创建文档分块（按句子边界切分）"""
     if not document.content:
         return []
     
-    chunks = []
     chunk_size = 1000  # 每块1000字符
     overlap = 200      # 重叠200字符
     
     content = document.content
-    start = 0
-    chunk_index = 0
+    boundaries = _sentence_chunk_boundaries(content, chunk_size, overlap)
     
-    while start < len(content):
-        end = min(start + chunk_size, len(content))
-        chunk_content = content[start:end]
-        
-        chunk = DocumentChunk(
-            chunk_id=str(uuid.uuid4()),
+    # 一次性生成所有块ID
+    random_bytes = os.urandom(16 * len(boundaries))
+    chunk_ids = [
+        str(uuid.UUID(bytes=random_bytes[i:i + 16], version=4))
+        for i in range(0, len(random_bytes), 16)
+    ]
+    
+    # 所有块共享同一份只读元数据和创建时间
+    metadata = ChunkMetadata(
+        document_type=document.document_type,
+        filename=document.original_filename
+    )
+    created_at = datetime.now()
+    
+    return [
+        ChunkRecord(
+            chunk_id=chunk_id,
             document_id=document.id,
-            content=chunk_content,
+            content=content[start:end],
             chunk_index=chunk_index,
             start_char=start,
             end_char=end,
-            metadata={
-                "document_type": document.document_type,
-                "filename": document.original_filename
-            }
+            metadata=metadata,
+            created_at=created_at
         )
-        
-        chunks.append(chunk)
-        chunk_index += 1
-        
-        # 计算下一个块的起始位置（考虑重叠）
-        start = end - overlap if end < len(content) else end
-    
-    return chunks
+        for chunk_index, (chunk_id, (start, end)) in enumerate(zip(chunk_ids, boundaries))
+    ]
@@ -2,42 +2,167 @@
 """
 RAG (检索增强生成) API端点
 """
-from typing import Dict, Any, Optional
+from types import MappingProxyType
+from typing import Dict, Any, List, AsyncIterator
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from fastapi.responses import StreamingResponse
 from loguru import logger
-import json
+import orjson
 import asyncio
+import time
 
 from app.models.rag import (
     ChatRequest, ChatResponse, StreamingChatResponse, 
     ConversationHistory, RAGMetrics, RAGConfig
 )
 from app.services.rag_service import RAGService
-from app.services.retrieval_service import RetrievalService
-from app.core.llm_factory import LLMFactory
-from app.core.dependencies import get_retrieval_service, get_llm_factory
+from app.core.dependencies import get_rag_service
 
 
 router = APIRouter(prefix="/api/rag", tags=["RAG"])
 
-# 全局RAG服务实例
-_rag_service: Optional[RAGService] = None
+# SSE帧的固定字节片段
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+_SSE_DONE = b"data: [DONE]\n\n"
+_SSE_HEADERS = MappingProxyType({
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive"
+})
 
+# 流式输出合并窗口：累计块数或等待时间任一达到即刷新
+STREAM_BUFFER_SIZE = 8
+STREAM_FLUSH_INTERVAL = 0.02  # 秒
+# 生成端可以领先编码端的最大块数
+STREAM_QUEUE_SIZE = 32
+_STREAM_END = object()
 
-async def get_rag_service(
-    retrieval_service: RetrievalService = Depends(get_retrieval_service),
-    llm_factory: LLMFactory = Depends(get_llm_factory)
-) -> RAGService:
-    """获取RAG服务实例"""
-    global _rag_service
-    if _rag_service is None:
-        _rag_service = RAGService(
-            retrieval_service=retrieval_service,
-            llm_factory=llm_factory
-        )
-        logger.info("RAG服务实例已创建")
-    return _rag_service
+
+def _encode_stream_chunk(chunk_response: StreamingChatResponse) -> bytes:
+    """将流式响应块编码为SSE帧"""
+    if chunk_response.is_final or chunk_response.retrieval_context is not None:
+        # 最终块包含检索上下文等嵌套模型，走完整序列化
+        payload = chunk_response.model_dump()
+    else:
+        # 中间块只有文本，直接构造字典，避免每个token都遍历模型
+        payload = {
+            "conversation_id": chunk_response.conversation_id,
+            "chunk": chunk_response.chunk,
+            "is_final": False,
+            "retrieval_context": None,
+            "sources_used": chunk_response.sources_used,
+            "total_tokens": chunk_response.total_tokens,
+            "finish_reason": chunk_response.finish_reason
+        }
+    return _SSE_PREFIX + orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS) + _SSE_SUFFIX
+
+
+def _encode_stream_error(conversation_id: str, message: str) -> bytes:
+    """直接编码错误帧，不构造响应模型"""
+    payload = {
+        "conversation_id": conversation_id,
+        "chunk": f"错误: {message}",
+        "is_final": True,
+        "retrieval_context": None,
+        "sources_used": [],
+        "total_tokens": None,
+        "finish_reason": None
+    }
+    return _SSE_PREFIX + orjson.dumps(payload) + _SSE_SUFFIX
+
+
+def _is_text_chunk(chunk_response: StreamingChatResponse) -> bool:
+    """是否为只包含文本的中间块（可以合并）"""
+    return (
+        not chunk_response.is_final
+        and chunk_response.retrieval_context is None
+        and not chunk_response.sources_used
+    )
+
+
+def _merge_text_chunks(buffer: List[StreamingChatResponse]) -> StreamingChatResponse:
+    """合并缓冲的文本块"""
+    if len(buffer) == 1:
+        return buffer[0]
+    return buffer[0].model_copy(update={"chunk": "".join(item.chunk for item in buffer)})
+
+
+async def _coalesce_stream_chunks(
+    chunks: AsyncIterator[StreamingChatResponse]
+) -> AsyncIterator[StreamingChatResponse]:
+    """按数量和时间窗口合并连续的文本块，减少SSE帧数"""
+    loop = asyncio.get_running_loop()
+    iterator = chunks.__aiter__()
+    buffer: List[StreamingChatResponse] = []
+    deadline = 0.0
+    next_chunk = None
+
+    try:
+        while True:
+            if next_chunk is None:
+                next_chunk = asyncio.ensure_future(iterator.__anext__())
+
+            # 缓冲区非空时最多等待到刷新时间点；超时不取消读取任务
+            timeout = max(deadline - loop.time(), 0) if buffer else None
+            done, _ = await asyncio.wait({next_chunk}, timeout=timeout)
+            if not done:
+                yield _merge_text_chunks(buffer)
+                buffer = []
+                continue
+
+            task, next_chunk = next_chunk, None
+            try:
+                chunk_response = task.result()
+            except StopAsyncIteration:
+                break
+
+            if not _is_text_chunk(chunk_response):
+                if buffer:
+                    yield _merge_text_chunks(buffer)
+                    buffer = []
+                yield chunk_response
+                continue
+
+            if not buffer:
+                deadline = loop.time() + STREAM_FLUSH_INTERVAL
+            buffer.append(chunk_response)
+            if len(buffer) >= STREAM_BUFFER_SIZE:
+                yield _merge_text_chunks(buffer)
+                buffer = []
+
+        if buffer:
+            yield _merge_text_chunks(buffer)
+    finally:
+        if next_chunk is not None:
+            next_chunk.cancel()
+
+
+async def _prefetch_stream_chunks(
+    chunks: AsyncIterator[StreamingChatResponse]
+) -> AsyncIterator[StreamingChatResponse]:
+    """由独立任务驱动生成端写入队列，使LLM输出不受SSE编码速度阻塞"""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+    async def produce():
+        try:
+            async for chunk_response in chunks:
+                await queue.put(chunk_response)
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(_STREAM_END)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
 
 
 @router.post("/chat", response_model=ChatResponse)
@@ -91,31 +216,22 @@ async def stream_chat(
         async def generate_stream():
             """生成流式响应"""
             try:
-                async for chunk_response in rag_service.stream_chat(request):
-                    # 将响应转换为JSON格式
-                    chunk_data = chunk_response.model_dump()
-                    yield f"data: {json.dumps(chunk_data, ensure_ascii=False)}\n\n"
+                async for chunk_response in _coalesce_stream_chunks(
+                    _prefetch_stream_chunks(rag_service.stream_chat(request))
+                ):
+                    yield _encode_stream_chunk(chunk_response)
                 
                 # 发送结束标记
-                yield "data: [DONE]\n\n"
+                yield _SSE_DONE
                 
             except Exception as e:
-                error_response = StreamingChatResponse(
-                    conversation_id=request.conversation_id or "error",
-                    chunk=f"错误: {str(e)}",
-                    is_final=True
-                )
-                yield f"data: {json.dumps(error_response.model_dump(), ensure_ascii=False)}\n\n"
-                yield "data: [DONE]\n\n"
+                yield _encode_stream_error(request.conversation_id or "error", str(e))
+                yield _SSE_DONE
         
         return StreamingResponse(
             generate_stream(),
-            media_type="text/plain",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "text/event-stream"
-            }
+            media_type="text/event-stream",
+            headers=_SSE_HEADERS
         )
         
     except Exception as e:
@@ -214,12 +330,13 @@ async def get_rag_metrics(
 @router.post("/config", response_model=Dict[str, Any])
 async def update_rag_config(
     config: RAGConfig,
+    echo: bool = False,
     rag_service: RAGService = Depends(get_rag_service)
 ) -> Dict[str, Any]:
     """
     更新RAG配置
     
-    动态更新RAG服务的配置参数
+    动态更新RAG服务的配置参数，echo=true 时在响应中回显新配置
     """
     try:
         logger.info("更新RAG配置")
@@ -228,11 +345,13 @@ async def update_rag_config(
         rag_service.config = config
         
         logger.info("RAG配置更新成功")
-        return {
+        response = {
             "success": True,
-            "message": "RAG配置已更新",
-            "config": config.model_dump()
+            "message": "RAG配置已更新"
         }
+        if echo:
+            response["config"] = config.model_dump(mode="json")
+        return response
         
     except Exception as e:
         error_msg = f"更新RAG配置失败: {str(e)}"
@@ -283,9 +402,9 @@ async def test_rag_system(
             response_mode="complete"
         )
         
-        start_time = asyncio.get_event_loop().time()
+        start_time = time.perf_counter()
         response = await rag_service.chat(test_request)
-        end_time = asyncio.get_event_loop().time()
+        end_time = time.perf_counter()
         
         test_result = {
             "success": response.success,
@@ -6,11 +6,12 @@ from typing import List, Optional
 from datetime import datetime
 from loguru import logger
 import asyncio
+import time
 
 from app.services.retrieval_service import retrieval_service
 from app.models.retrieval import (
     AdvancedSearchRequest, AdvancedSearchResponse,
-    SearchSuggestionRequest, SearchSuggestionResponse,
+    SearchSuggestionRequest, SearchSuggestionResponse, SearchSuggestion,
     SearchStatisticsResponse,
     BatchSearchRequest, BatchSearchResponse,
     DocumentClusterRequest, DocumentClusterResponse,
@@ -28,19 +29,9 @@ async def advanced_search(request: AdvancedSearchRequest):
     高级文档搜索
     支持语义搜索、关键词搜索和混合搜索模式
     """
-    start_time = datetime.now()
-    
     try:
         logger.info(f"开始高级搜索: 查询='{request.query}', 模式={request.search_mode}")
         
-        # 验证权重配置
-        if request.search_mode == SearchMode.HYBRID:
-            if abs(request.keyword_weight + request.semantic_weight - 1.0) > 0.01:
-                raise HTTPException(
-                    status_code=400, 
-                    detail="混合搜索模式下，关键词权重和语义权重之和必须等于1.0"
-                )
-        
         # 构建日期范围
         date_range = None
         if request.date_from or request.date_to:
@@ -85,9 +76,7 @@ async def advanced_search(request: AdvancedSearchRequest):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"高级搜索失败: {str(e)}")
-        import traceback
-        logger.error(f"详细错误: {traceback.format_exc()}")
+        logger.opt(exception=True).error(f"高级搜索失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"搜索失败: {str(e)}")
 
 
@@ -125,28 +114,28 @@ async def batch_search(request: BatchSearchRequest):
     批量搜索
     支持同时搜索多个查询
     """
-    start_time = datetime.now()
+    start_ns = time.perf_counter_ns()
     
     try:
-        logger.info(f"开始批量搜索: {len(request.queries)} 个查询")
+        total_queries = len(request.queries)
+        logger.info(f"开始批量搜索: {total_queries} 个查询")
         
-        if len(request.queries) > 50:
+        if total_queries > 50:
             raise HTTPException(status_code=400, detail="批量搜索最多支持50个查询")
         
-        # 创建搜索任务
-        search_tasks = []
-        for query in request.queries:
-            search_req = request.search_config.model_copy()
-            search_req.query = query
-            search_tasks.append(advanced_search(search_req))
+        # 构建搜索请求（模板已校验，浅拷贝时直接替换查询，不再重复校验）
+        search_requests = [
+            request.search_config.model_copy(update={"query": query})
+            for query in request.queries
+        ]
         
         # 并发执行搜索
         semaphore = asyncio.Semaphore(request.max_concurrent)
         
-        async def limited_search(task):
+        async def limited_search(search_req: AdvancedSearchRequest) -> AdvancedSearchResponse:
             async with semaphore:
                 try:
-                    return await task
+                    return await advanced_search(search_req)
                 except Exception as e:
                     logger.error(f"批量搜索中的单个查询失败: {str(e)}")
                     return AdvancedSearchResponse(
@@ -158,23 +147,26 @@ async def batch_search(request: BatchSearchRequest):
                         error=str(e)
                     )
         
-        results = await asyncio.gather(*[limited_search(task) for task in search_tasks])
+        # 单个查询的异常已在 limited_search 内转换为失败响应，不会取消其他任务
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(limited_search(search_req)) for search_req in search_requests]
+        results = [task.result() for task in tasks]
         
         # 统计结果
         successful_queries = sum(1 for r in results if r.success)
         failed_queries = len(results) - successful_queries
-        total_time = (datetime.now() - start_time).total_seconds()
+        total_time = (time.perf_counter_ns() - start_ns) / 1e9
         
         response = BatchSearchResponse(
             success=True,
             results=results,
-            total_queries=len(request.queries),
+            total_queries=total_queries,
             successful_queries=successful_queries,
             failed_queries=failed_queries,
             total_time=total_time
         )
         
-        logger.info(f"批量搜索完成: 总查询={len(request.queries)}, 成功={successful_queries}, 失败={failed_queries}, 耗时={total_time:.3f}s")
+        logger.info(f"批量搜索完成: 总查询={total_queries}, 成功={successful_queries}, 失败={failed_queries}, 耗时={total_time:.3f}s")
         return response
         
     except HTTPException:
@@ -270,15 +262,18 @@ async def clear_search_cache():
         raise HTTPException(status_code=500, detail=f"清空缓存失败: {str(e)}")
 
 
-def _get_history_suggestions(partial_query: str, max_suggestions: int) -> List:
+def _get_history_suggestions(partial_query: str, max_suggestions: int) -> List[SearchSuggestion]:
     """基于历史查询获取建议"""
-    # 简化实现，实际应该从搜索历史中匹配
-    suggestions = []
+    matches = retrieval_service.get_history_suggestions(partial_query.strip(), max_suggestions)
+    if not matches:
+        return []
     
-    # 这里可以实现更复杂的历史查询匹配逻辑
-    # 目前返回空列表
-    
-    return suggestions
+    # 以最高频次归一化分数
+    top_count = matches[0][1]
+    return [
+        SearchSuggestion(text=query, type="history", score=count / top_count, frequency=count)
+        for query, count in matches
+    ]
 
 
 def _get_content_suggestions(partial_query: str, max_suggestions: int) -> List:
@@ -4,12 +4,14 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
-from datetime import datetime
+import time
+from itertools import compress
 from loguru import logger
 
+from app.core.task_queue import enqueue_document_vectorization
 from app.services.vector_storage import vector_storage
 from app.services.embedding_service import embedding_service
-from app.services.chunking_service import chunking_service
+from app.services.chunking_service import ChunkBatch, chunking_service
 from app.services.document_storage import DocumentStorage
 from app.models.document import DocumentStatus
 
@@ -55,7 +57,7 @@ class SearchResponse(BaseModel):
 @router.post("/vectorize", response_model=VectorizeResponse)
 async def vectorize_document(request: VectorizeRequest, background_tasks: BackgroundTasks):
     """向量化文档"""
-    start_time = datetime.now()
+    start_ns = time.perf_counter_ns()
     
     try:
         # 获取文档
@@ -77,20 +79,26 @@ async def vectorize_document(request: VectorizeRequest, background_tasks: Backgr
                 embeddings_generated=document.chunk_count or 0
             )
         
-        # 启动后台向量化任务
-        background_tasks.add_task(
-            _vectorize_document_background,
+        # 优先投递到任务队列，未启用时在当前进程的后台任务中处理
+        if not await enqueue_document_vectorization(
             request.document_id,
             request.chunk_size,
             request.chunk_overlap,
             request.force_reprocess
-        )
+        ):
+            background_tasks.add_task(
+                _vectorize_document_background,
+                request.document_id,
+                request.chunk_size,
+                request.chunk_overlap,
+                request.force_reprocess
+            )
         
         return VectorizeResponse(
             success=True,
             document_id=request.document_id,
             message="向量化任务已启动，正在后台处理",
-            processing_time=(datetime.now() - start_time).total_seconds()
+            processing_time=(time.perf_counter_ns() - start_ns) / 1e9
         )
         
     except HTTPException:
@@ -104,9 +112,10 @@ async def _vectorize_document_background(
     document_id: str, 
     chunk_size: int, 
     chunk_overlap: int, 
-    force_reprocess: bool
+    force_reprocess: bool,
+    raise_on_error: bool = False
 ):
-    """后台向量化任务"""
+    """后台向量化任务（raise_on_error 为 True 时向外抛出失败，供任务队列重试）"""
     try:
         logger.info(f"开始向量化文档: {document_id}")
         
@@ -120,40 +129,35 @@ async def _vectorize_document_background(
         if force_reprocess and document.is_vectorized:
             vector_storage.delete_document_chunks(document_id)
         
-        # 文档分块
-        chunks_data = chunking_service.chunk_text(
-            text=document.content,
-            chunk_size=chunk_size,
-            overlap=chunk_overlap,
-            document_id=document_id,
-            document_type=document.document_type
-        )
+        # 文档分块与嵌入生成流水线进行：每产出一个分块就提交嵌入请求
+        chunks = ChunkBatch([], [])
         
-        if not chunks_data:
-            logger.warning(f"文档 {document_id} 分块结果为空")
-            return
+        def iter_chunk_texts():
+            for text, metadata in chunking_service.iter_chunks(
+                text=document.content,
+                chunk_size=chunk_size,
+                overlap=chunk_overlap,
+                document_id=document_id,
+                document_type=document.document_type
+            ):
+                chunks.texts.append(text)
+                chunks.metadatas.append(metadata)
+                yield text
         
-        # 提取文本和元数据
-        chunk_texts = [chunk["text"] for chunk in chunks_data]
-        chunk_metadata = [chunk["metadata"] for chunk in chunks_data]
+        embeddings = await embedding_service.generate_embeddings_batch(iter_chunk_texts())
         
-        # 生成嵌入向量
-        embeddings = await embedding_service.generate_embeddings_batch(chunk_texts)
-        
-        # 过滤成功的嵌入
-        valid_chunks = []
-        valid_embeddings = []
-        valid_metadata = []
+        if not chunks.texts:
+            logger.warning(f"文档 {document_id} 分块结果为空")
+            return
         
-        for i, embedding in enumerate(embeddings):
-            if embedding is not None:
-                valid_chunks.append(chunk_texts[i])
-                valid_embeddings.append(embedding)
-                valid_metadata.append(chunk_metadata[i])
+        # 过滤成功的嵌入（按掩码一次性筛选三个并行列表）
+        valid_mask = [embedding is not None for embedding in embeddings]
+        valid_chunks = list(compress(chunks.texts, valid_mask))
+        valid_embeddings = list(compress(embeddings, valid_mask))
+        valid_metadata = list(compress(chunks.metadatas, valid_mask))
         
         if not valid_embeddings:
-            logger.error(f"文档 {document_id} 没有生成有效的嵌入向量")
-            return
+            raise RuntimeError(f"文档 {document_id} 没有生成有效的嵌入向量")
         
         # 存储到向量数据库
         success = vector_storage.add_document_chunks(
@@ -172,22 +176,22 @@ async def _vectorize_document_background(
             
             logger.info(f"文档 {document_id} 向量化完成: {len(valid_chunks)} 个分块")
         else:
-            logger.error(f"文档 {document_id} 向量存储失败")
+            raise RuntimeError(f"文档 {document_id} 向量存储失败")
             
     except Exception as e:
-        logger.error(f"后台向量化任务失败: {str(e)}")
-        import traceback
-        logger.error(f"详细错误信息: {traceback.format_exc()}")
+        logger.opt(exception=True).error(f"后台向量化任务失败: {str(e)}")
+        if raise_on_error:
+            raise
 
 
 @router.post("/search", response_model=SearchResponse)
 async def search_documents(request: SearchRequest):
     """向量搜索文档"""
-    start_time = datetime.now()
+    start_ns = time.perf_counter_ns()
     
     try:
         # 生成查询嵌入
-        query_embedding = await embedding_service.generate_embedding(request.query)
+        query_embedding = await embedding_service.generate_query_embedding(request.query)
         if not query_embedding:
             raise HTTPException(status_code=500, detail="查询向量生成失败")
         
@@ -199,22 +203,25 @@ async def search_documents(request: SearchRequest):
         )
         
         # 格式化结果
-        formatted_results = []
-        for i in range(len(search_results["chunks"])):
-            result = {
-                "text": search_results["chunks"][i],
-                "metadata": search_results["metadata"][i],
-                "similarity_score": 1 - search_results["distances"][i],  # 转换为相似度分数
-                "distance": search_results["distances"][i]
+        formatted_results = [
+            {
+                "text": text,
+                "metadata": metadata,
+                "similarity_score": similarity,
+                "distance": distance
             }
-            formatted_results.append(result)
+            for text, metadata, distance, similarity in zip(
+                search_results["chunks"], search_results["metadata"],
+                search_results["distances"], search_results["similarities"]
+            )
+        ]
         
         return SearchResponse(
             success=True,
             query=request.query,
             results=formatted_results,
             total_results=search_results["total_results"],
-            processing_time=(datetime.now() - start_time).total_seconds()
+            processing_time=(time.perf_counter_ns() - start_ns) / 1e9
         )
         
     except HTTPException:
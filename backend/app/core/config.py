@@ -2,11 +2,17 @@
 应用配置管理
 """
 import os
-from typing import List, Optional
+import re
+from typing import Optional, Tuple
 from pydantic_settings import BaseSettings
 from pydantic import validator
 
 
+# 文件大小配置解析，例如 "100MB"、"512 KB"、"1048576"
+_SIZE_RE = re.compile(r"^(\d+)\s*(KB|MB|GB)?$")
+_SIZE_UNITS = {"KB": 1024, "MB": 1024 * 1024, "GB": 1024 * 1024 * 1024}
+
+
 class Settings(BaseSettings):
     """应用设置"""
     
@@ -36,8 +42,10 @@ class Settings(BaseSettings):
     
     # 文件存储配置
     UPLOAD_DIR: str = "../uploads"
-    MAX_FILE_SIZE: str = "100MB"
-    ALLOWED_EXTENSIONS: List[str] = ["pdf", "docx", "doc", "txt", "md", "png", "jpg", "jpeg"]
+    MAX_FILE_SIZE: int = 100 * 1024 * 1024  # 字节，环境变量支持 "100MB" 形式
+    ALLOWED_EXTENSIONS: Tuple[str, ...] = ("pdf", "docx", "doc", "txt", "md", "png", "jpg", "jpeg")
+    # PDF文本并行提取的进程数（0 表示不启用进程池）
+    PDF_EXTRACT_WORKERS: int = 2
     
     # Embedding模型配置
     EMBEDDING_PROVIDER: str = "lm_studio"  # 可选: "lm_studio", "ollama"
@@ -45,6 +53,8 @@ class Settings(BaseSettings):
     EMBEDDING_DEVICE: str = "cuda"  # 使用GPU加速
     # 备用Ollama embedding模型
     OLLAMA_EMBEDDING_MODEL: str = "dengcao/Qwen3-Embedding-8B:Q8_0"
+    # LLMManager.get_embedding 单次合并的最大调用数
+    LLM_EMBEDDING_BATCH_SIZE: int = 64
     
     # OCR配置
     OCR_ENABLED: bool = True
@@ -54,6 +64,12 @@ class Settings(BaseSettings):
     # Redis配置
     REDIS_URL: str = "redis://localhost:6379/0"
     
+    # 任务队列配置（启用后文档处理和向量化交由Celery worker执行）
+    TASK_QUEUE_ENABLED: bool = False
+    DOCUMENT_TASK_QUEUE: str = "doc_process"
+    VECTORIZE_TASK_QUEUE: str = "doc_vectorize"
+    DOCUMENT_TASK_MAX_RETRIES: int = 3
+    
     # 日志配置
     LOG_LEVEL: str = "INFO"
     LOG_FILE: str = "logs/app.log"
@@ -61,20 +77,17 @@ class Settings(BaseSettings):
     @validator("ALLOWED_EXTENSIONS", pre=True)
     def parse_extensions(cls, v):
         if isinstance(v, str):
-            return [ext.strip() for ext in v.split(",")]
+            return tuple(ext.strip() for ext in v.split(","))
         return v
     
-    @validator("MAX_FILE_SIZE")
+    @validator("MAX_FILE_SIZE", pre=True)
     def parse_file_size(cls, v):
         """解析文件大小配置"""
         if isinstance(v, str):
-            v = v.upper()
-            if v.endswith("MB"):
-                return int(v[:-2]) * 1024 * 1024
-            elif v.endswith("GB"):
-                return int(v[:-2]) * 1024 * 1024 * 1024
-            elif v.endswith("KB"):
-                return int(v[:-2]) * 1024
+            match = _SIZE_RE.match(v.strip().upper())
+            if not match:
+                raise ValueError(f"无效的文件大小配置: {v}")
+            return int(match.group(1)) * _SIZE_UNITS.get(match.group(2), 1)
         return int(v)
     
     class Config:
@@ -2,72 +2,48 @@
 """
 FastAPI依赖注入
 """
-from typing import Optional
-from fastapi import Depends
+from fastapi import FastAPI, Request
 
 from app.services.document_storage import DocumentStorage
-from app.services.vector_storage import VectorStorage
-from app.services.embedding_service import EmbeddingService
-from app.services.retrieval_service import RetrievalService
+from app.services.vector_storage import VectorStorage, vector_storage
+from app.services.embedding_service import EmbeddingService, embedding_service
+from app.services.retrieval_service import RetrievalService, retrieval_service
 from app.services.rag_service import RAGService
-from app.core.llm_factory import LLMFactory
+from app.core.llm_factory import get_llm_factory
 
 
-# 全局服务实例
-_document_storage: Optional[DocumentStorage] = None
-_vector_storage: Optional[VectorStorage] = None
-_embedding_service: Optional[EmbeddingService] = None
-_retrieval_service: Optional[RetrievalService] = None
-_rag_service: Optional[RAGService] = None
+def init_services(app: FastAPI) -> None:
+    """在应用生命周期开始时创建服务实例，保存到 app.state"""
+    app.state.document_storage = DocumentStorage()
+    app.state.vector_storage = vector_storage
+    app.state.embedding_service = embedding_service
+    app.state.retrieval_service = retrieval_service
+    app.state.rag_service = RAGService(
+        retrieval_service=retrieval_service,
+        llm_factory=get_llm_factory()
+    )
 
 
-def get_document_storage() -> DocumentStorage:
+async def get_document_storage(request: Request) -> DocumentStorage:
     """获取文档存储服务"""
-    global _document_storage
-    if _document_storage is None:
-        _document_storage = DocumentStorage()
-    return _document_storage
+    return request.app.state.document_storage
 
 
-def get_vector_storage() -> VectorStorage:
+async def get_vector_storage(request: Request) -> VectorStorage:
     """获取向量存储服务"""
-    global _vector_storage
-    if _vector_storage is None:
-        _vector_storage = VectorStorage()
-    return _vector_storage
+    return request.app.state.vector_storage
 
 
-def get_embedding_service() -> EmbeddingService:
+async def get_embedding_service(request: Request) -> EmbeddingService:
     """获取嵌入服务"""
-    global _embedding_service
-    if _embedding_service is None:
-        _embedding_service = EmbeddingService()
-    return _embedding_service
+    return request.app.state.embedding_service
 
 
-def get_retrieval_service() -> RetrievalService:
+async def get_retrieval_service(request: Request) -> RetrievalService:
     """获取检索服务"""
-    global _retrieval_service
-    if _retrieval_service is None:
-        _retrieval_service = RetrievalService()
-    return _retrieval_service
+    return request.app.state.retrieval_service
 
 
-def get_llm_factory() -> LLMFactory:
-    """获取LLM工厂"""
-    from app.core.llm_factory import llm_factory
-    return llm_factory
-
-
-def get_rag_service(
-    retrieval_service: RetrievalService = Depends(get_retrieval_service),
-    llm_factory: LLMFactory = Depends(get_llm_factory)
-) -> RAGService:
+async def get_rag_service(request: Request) -> RAGService:
     """获取RAG服务"""
-    global _rag_service
-    if _rag_service is None:
-        _rag_service = RAGService(
-            retrieval_service=retrieval_service,
-            llm_factory=llm_factory
-        )
-    return _rag_service
+    return request.app.state.rag_service
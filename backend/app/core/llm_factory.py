@@ -1,12 +1,23 @@
 """
 LLM工厂和管理器
 """
-from typing import Dict, Optional, AsyncGenerator
+import asyncio
+from contextvars import ContextVar
+from typing import Dict, List, Optional, AsyncGenerator, Tuple
 from loguru import logger
 
 from app.core.config import get_settings
+from app.core.micro_batcher import MicroBatcher
 from app.services.llm_providers import BaseLLMProvider, LMStudioProvider, OllamaProvider
-from app.services.llm_providers.base import LLMResponse
+from app.services.llm_providers.base import LLMResponse, EmbeddingResponse
+
+
+# 嵌入请求合并窗口（秒）
+EMBEDDING_BATCH_WAIT = 0.01
+
+
+# 当前请求/任务生效的提供者，未设置时使用管理器的默认提供者
+_current_provider: ContextVar[Optional[str]] = ContextVar("llm_current_provider", default=None)
 
 
 class LLMManager:
@@ -16,6 +27,8 @@ class LLMManager:
         self.settings = get_settings()
         self.providers: Dict[str, BaseLLMProvider] = {}
         self.current_provider_name = self.settings.DEFAULT_LLM_PROVIDER
+        # 按 (提供者, 模型) 合并并发的嵌入请求
+        self._embedding_batchers: Dict[Tuple[str, Optional[str]], MicroBatcher] = {}
         self._initialize_providers()
     
     def _initialize_providers(self):
@@ -40,25 +53,42 @@ class LLMManager:
     async def get_current_provider(self) -> BaseLLMProvider:
         """获取当前可用的提供者"""
         # 首先尝试当前设置的提供者
-        current_provider = self.providers.get(self.current_provider_name)
+        current_name = self.get_current_provider_name()
+        current_provider = self.providers.get(current_name)
         if current_provider and await current_provider.is_available():
             return current_provider
         
-        # 如果当前提供者不可用，尝试其他提供者
-        logger.warning(f"当前提供者 {self.current_provider_name} 不可用，尝试切换到其他提供者")
+        # 如果当前提供者不可用，并发探测其他提供者，采用最先确认可用的一个
+        logger.warning(f"当前提供者 {current_name} 不可用，尝试切换到其他提供者")
         
-        for name, provider in self.providers.items():
-            if name != self.current_provider_name:
-                if await provider.is_available():
-                    logger.info(f"自动切换到提供者: {name}")
-                    self.current_provider_name = name
-                    return provider
+        pending = {
+            asyncio.create_task(provider.is_available()): name
+            for name, provider in self.providers.items()
+            if name != current_name
+        }
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = pending.pop(task)
+                    if not task.cancelled() and task.exception() is None and task.result():
+                        # 故障切换只作用于当前请求，不改动其他请求看到的默认提供者
+                        logger.info(f"自动切换到提供者: {name}")
+                        self.set_current_provider(name)
+                        return self.providers[name]
+        finally:
+            for task in pending:
+                task.cancel()
         
         # 如果所有提供者都不可用
         raise Exception("所有LLM提供者都不可用，请检查服务状态")
     
+    def set_current_provider(self, provider_name: Optional[str]):
+        """设置当前请求/任务使用的提供者，传入 None 恢复默认提供者"""
+        _current_provider.set(provider_name)
+    
     async def switch_provider(self, provider_name: str) -> bool:
-        """手动切换提供者"""
+        """手动切换默认提供者（对所有请求生效）"""
         if provider_name not in self.providers:
             logger.error(f"未知的提供者: {provider_name}")
             return False
@@ -78,22 +108,14 @@ class LLMManager:
         max_tokens: int = 1000,
         temperature: float = 0.7,
         stream: bool = False,
-        provider_name: Optional[str] = None
+        provider_name: Optional[str] = None,
+        system: Optional[str] = None
     ) -> Dict:
         """生成文本 - 返回字典格式以兼容RAG服务"""
-        if provider_name:
-            # 使用指定的提供者
-            provider = self.providers.get(provider_name)
-            if not provider:
-                raise Exception(f"未知的提供者: {provider_name}")
-            if not await provider.is_available():
-                raise Exception(f"提供者 {provider_name} 不可用")
-        else:
-            # 使用当前可用的提供者
-            provider = await self.get_current_provider()
+        provider = await self._resolve_provider(provider_name)
 
         try:
-            response = await provider.generate(prompt, max_tokens, temperature, stream)
+            response = await provider.generate(prompt, max_tokens, temperature, stream, system=system)
             # 转换为字典格式
             return {
                 'text': response.content,
@@ -107,6 +129,18 @@ class LLMManager:
             provider.reset_availability()
             raise
     
+    async def _resolve_provider(self, provider_name: Optional[str]) -> BaseLLMProvider:
+        """解析要使用的提供者：指定名称时校验其可用性，否则使用当前可用的提供者"""
+        if not provider_name:
+            return await self.get_current_provider()
+        
+        provider = self.providers.get(provider_name)
+        if not provider:
+            raise Exception(f"未知的提供者: {provider_name}")
+        if not await provider.is_available():
+            raise Exception(f"提供者 {provider_name} 不可用")
+        return provider
+    
     async def stream_generate(
         self,
         prompt: str,
@@ -115,22 +149,8 @@ class LLMManager:
         provider_name: Optional[str] = None
     ) -> AsyncGenerator[Dict, None]:
         """流式生成文本 - 返回字典格式以兼容RAG服务"""
-        if provider_name:
-            provider = self.providers.get(provider_name)
-            if not provider:
-                raise Exception(f"未知的提供者: {provider_name}")
-            if not await provider.is_available():
-                raise Exception(f"提供者 {provider_name} 不可用")
-        else:
-            provider = await self.get_current_provider()
-
-        try:
-            async for chunk in provider.generate_stream(prompt, max_tokens, temperature):
-                yield {'text': chunk}
-        except Exception as e:
-            logger.error(f"流式文本生成失败: {str(e)}")
-            provider.reset_availability()
-            raise
+        async for chunk in self.generate_stream(prompt, max_tokens, temperature, provider_name):
+            yield {'text': chunk}
 
     async def generate_stream(
         self,
@@ -140,14 +160,7 @@ class LLMManager:
         provider_name: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
         """流式生成文本 - 保持原有接口兼容性"""
-        if provider_name:
-            provider = self.providers.get(provider_name)
-            if not provider:
-                raise Exception(f"未知的提供者: {provider_name}")
-            if not await provider.is_available():
-                raise Exception(f"提供者 {provider_name} 不可用")
-        else:
-            provider = await self.get_current_provider()
+        provider = await self._resolve_provider(provider_name)
 
         try:
             async for chunk in provider.generate_stream(prompt, max_tokens, temperature):
@@ -164,42 +177,87 @@ class LLMManager:
         provider_name: Optional[str] = None
     ):
         """获取文本嵌入向量"""
-        if provider_name:
-            provider = self.providers.get(provider_name)
-            if not provider:
-                raise Exception(f"未知的提供者: {provider_name}")
-            if not await provider.is_available():
-                raise Exception(f"提供者 {provider_name} 不可用")
-        else:
-            provider = await self.get_current_provider()
+        provider = await self._resolve_provider(provider_name)
         
+        batcher = self._get_embedding_batcher(provider_name or self.get_current_provider_name(), model)
         try:
-            return await provider.get_embedding(texts, model)
+            return await batcher.submit(texts)
         except Exception as e:
             logger.error(f"获取嵌入向量失败: {str(e)}")
             provider.reset_availability()
             raise
     
+    def _get_embedding_batcher(self, provider_name: str, model: Optional[str]) -> MicroBatcher:
+        """获取指定提供者和模型的嵌入请求合并器"""
+        key = (provider_name, model)
+        batcher = self._embedding_batchers.get(key)
+        if batcher is None:
+            provider = self.providers[provider_name]
+            
+            async def embed_batch(text_lists: List[list]) -> List[EmbeddingResponse]:
+                """合并多次调用的文本为一次请求，再按调用切分结果"""
+                try:
+                    response = await provider.get_embedding(
+                        [text for texts in text_lists for text in texts], model
+                    )
+                except Exception:
+                    if len(text_lists) == 1:
+                        raise
+                    # 合并请求失败时逐个调用重试，只让出错的调用收到异常
+                    return await asyncio.gather(
+                        *(provider.get_embedding(texts, model) for texts in text_lists),
+                        return_exceptions=True
+                    )
+                results = []
+                offset = 0
+                for texts in text_lists:
+                    results.append(response.model_copy(update={
+                        "embeddings": response.embeddings[offset:offset + len(texts)],
+                        "usage": response.usage if len(text_lists) == 1 else None
+                    }))
+                    offset += len(texts)
+                return results
+            
+            # 按合并后的文本总数限制单次请求大小
+            batcher = MicroBatcher(
+                embed_batch, self.settings.LLM_EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WAIT,
+                max_batch_weight=self.settings.LLM_EMBEDDING_BATCH_SIZE, weight=len
+            )
+            self._embedding_batchers[key] = batcher
+        return batcher
+    
     async def get_provider_status(self) -> Dict[str, bool]:
-        """获取所有提供者的状态"""
-        status = {}
-        for name, provider in self.providers.items():
-            status[name] = await provider.health_check()
-        return status
+        """获取所有提供者的状态（复用可用性缓存，并发探测）"""
+        results = await asyncio.gather(
+            *(provider.is_available() for provider in self.providers.values()),
+            return_exceptions=True
+        )
+        return {
+            name: result is True
+            for name, result in zip(self.providers, results)
+        }
     
     async def list_available_models(self) -> Dict[str, list]:
         """列出所有提供者的可用模型"""
-        models = {}
-        for name, provider in self.providers.items():
-            if await provider.is_available():
-                models[name] = await provider.list_models()
+        status = await self.get_provider_status()
+        available = [name for name, is_available in status.items() if is_available]
+        
+        # 可用提供者的模型列表并发获取
+        results = await asyncio.gather(
+            *(self.providers[name].list_models() for name in available),
+            return_exceptions=True
+        )
+        models = {name: [] for name in self.providers}
+        for name, result in zip(available, results):
+            if isinstance(result, Exception):
+                logger.error(f"获取提供者 {name} 模型列表失败: {str(result)}")
             else:
-                models[name] = []
+                models[name] = result
         return models
     
     def get_current_provider_name(self) -> str:
         """获取当前提供者名称"""
-        return self.current_provider_name
+        return _current_provider.get() or self.current_provider_name
 
 
 class LLMFactory:
@@ -223,18 +281,22 @@ class LLMFactory:
         return list(self.llm_manager.providers.keys())
 
 
-# 创建全局LLM管理器实例
-llm_manager = LLMManager()
-
-# 创建全局LLM工厂实例
-llm_factory = LLMFactory(llm_manager)
+# 全局LLM管理器和工厂实例，首次使用时创建，避免导入模块时就初始化提供者
+_llm_manager: Optional[LLMManager] = None
+_llm_factory: Optional[LLMFactory] = None
 
 
 def get_llm_manager() -> LLMManager:
     """获取LLM管理器实例"""
-    return llm_manager
+    global _llm_manager
+    if _llm_manager is None:
+        _llm_manager = LLMManager()
+    return _llm_manager
 
 
 def get_llm_factory() -> LLMFactory:
     """获取LLM工厂实例"""
-    return llm_factory
+    global _llm_factory
+    if _llm_factory is None:
+        _llm_factory = LLMFactory(get_llm_manager())
+    return _llm_factory
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+微批处理器
+将短时间内并发提交的请求合并为一次批量调用
+"""
+import asyncio
+from typing import Awaitable, Callable, Generic, List, Optional, Tuple, TypeVar
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """按数量、总大小或等待时间合并并发请求，批量调用后把结果分发给各个等待者
+
+    process_batch 返回的结果为异常实例时，对应的等待者收到该异常
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[T]], Awaitable[List[R]]],
+        max_batch_size: int,
+        max_wait: float,
+        max_batch_weight: Optional[int] = None,
+        weight: Optional[Callable[[T], int]] = None
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        # 可选的单批总大小上限（如文本总字符数），weight 计算单个请求的大小
+        self.max_batch_weight = max_batch_weight
+        self.weight = weight or (lambda item: 1)
+        self._pending: List[Tuple[T, asyncio.Future]] = []
+        self._pending_weight = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._running_tasks: set = set()
+
+    async def submit(self, item: T) -> R:
+        """提交单个请求，等待所在批次的结果"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if self.max_batch_weight is not None:
+            self._pending_weight += self.weight(item)
+
+        if len(self._pending) >= self.max_batch_size or (
+            self.max_batch_weight is not None and self._pending_weight >= self.max_batch_weight
+        ):
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """将待处理请求按批次大小和总大小切分并发起调用"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        pending, self._pending = self._pending, []
+        self._pending_weight = 0
+
+        batch: List[Tuple[T, asyncio.Future]] = []
+        batch_weight = 0
+        for entry in pending:
+            item_weight = self.weight(entry[0]) if self.max_batch_weight is not None else 0
+            # 加入后会超过数量或大小上限时先发出当前批次（单个超大请求单独成批）
+            over_weight = self.max_batch_weight is not None and batch_weight + item_weight > self.max_batch_weight
+            if batch and (len(batch) >= self.max_batch_size or over_weight):
+                self._start(batch)
+                batch, batch_weight = [], 0
+            batch.append(entry)
+            batch_weight += item_weight
+        if batch:
+            self._start(batch)
+
+    def _start(self, batch: List[Tuple[T, asyncio.Future]]):
+        """发起一个批次的调用"""
+        task = asyncio.ensure_future(self._run(batch))
+        self._running_tasks.add(task)
+        task.add_done_callback(self._running_tasks.discard)
+
+    async def _run(self, batch: List[Tuple[T, asyncio.Future]]):
+        """执行一个批次并分发结果"""
+        try:
+            results = await self.process_batch([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"批处理返回 {len(results)} 个结果，期望 {len(batch)} 个")
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        except asyncio.CancelledError:
+            # 批次任务被取消时等待者一并取消，不会一直挂起
+            for _, future in batch:
+                future.cancel()
+            raise
+        except BaseException as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
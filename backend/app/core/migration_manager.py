@@ -5,13 +5,24 @@
 """
 import sqlite3
 import os
+import hashlib
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator
 from loguru import logger
 
 from app.core.config import get_settings
 
 
+# 迁移连接的PRAGMA设置：WAL避免迁移期间写阻塞读，NORMAL同步减少fsync
+_CONNECTION_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=268435456;
+"""
+
+
 class MigrationManager:
     """数据库迁移管理器"""
     
@@ -20,45 +31,100 @@ class MigrationManager:
         self.db_path = Path(self.settings.UPLOAD_DIR).parent / "documents.db"
         self.migrations_dir = Path(__file__).parent.parent.parent / "migrations"
         self.migrations_dir.mkdir(exist_ok=True)
-        
+        self._conn: Optional[sqlite3.Connection] = None
+        self._migration_files_cache: Optional[Tuple[int, List[str]]] = None  # (目录mtime, 迁移名列表)
+    
+    def _get_connection(self) -> sqlite3.Connection:
+        """获取复用的数据库连接（首次使用时创建并设置PRAGMA）"""
+        if self._conn is None:
+            # 自动提交模式，事务由 BEGIN/COMMIT 显式控制
+            self._conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            self._conn.executescript(_CONNECTION_PRAGMAS)
+            self._init_migration_table()
+        return self._conn
+    
     def _init_migration_table(self):
         """初始化迁移记录表"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS migration_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    migration_name TEXT NOT NULL UNIQUE,
-                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    success BOOLEAN DEFAULT TRUE,
-                    error_message TEXT
-                )
-            """)
-            conn.commit()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS migration_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                migration_name TEXT NOT NULL UNIQUE,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                success BOOLEAN DEFAULT TRUE,
+                error_message TEXT,
+                content_hash TEXT
+            )
+        """)
+        
+        # 旧版本创建的表没有内容哈希列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(migration_history)")}
+        if "content_hash" not in columns:
+            self._conn.execute("ALTER TABLE migration_history ADD COLUMN content_hash TEXT")
+    
+    @staticmethod
+    def _iter_sql_statements(sql_file: Path, digest: Optional["hashlib._Hash"] = None) -> Iterator[str]:
+        """逐行读取SQL文件，按完整语句依次产出，不把整个文件读入内存；传入 digest 时同时计算内容哈希"""
+        pending = ""
+        with open(sql_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if digest is not None:
+                    digest.update(line.encode('utf-8'))
+                pending += line
+                pos = pending.find(";")
+                while pos != -1:
+                    # 字符串、注释或触发器体内的分号不构成语句结束
+                    if sqlite3.complete_statement(pending[:pos + 1]):
+                        statement, pending = pending[:pos + 1], pending[pos + 1:]
+                        yield statement
+                        pos = pending.find(";")
+                    else:
+                        pos = pending.find(";", pos + 1)
+        
+        # 文件末尾可能有未以分号结尾的最后一条语句
+        if pending.strip():
+            yield pending
+    
+    @staticmethod
+    def _hash_sql_file(sql_file: Path) -> str:
+        """计算SQL文件内容哈希（与执行迁移时的计算方式一致）"""
+        digest = hashlib.sha256()
+        with open(sql_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                digest.update(line.encode('utf-8'))
+        return digest.hexdigest()
+    
+    def _run_script_in_transaction(self, conn: sqlite3.Connection, statements: Iterable[str], sql: str, params_seq: Iterable[tuple]):
+        """在同一个事务中逐条执行迁移语句和历史记录语句"""
+        conn.execute("BEGIN")
+        for statement in statements:
+            conn.execute(statement)
+        conn.executemany(sql, params_seq)
+        conn.execute("COMMIT")
     
     def get_applied_migrations(self) -> List[str]:
         """获取已应用的迁移列表"""
-        self._init_migration_table()
-        
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                SELECT migration_name FROM migration_history 
-                WHERE success = TRUE 
-                ORDER BY applied_at
-            """)
-            return [row[0] for row in cursor.fetchall()]
+        cursor = self._get_connection().execute("""
+            SELECT migration_name FROM migration_history 
+            WHERE success = TRUE 
+            ORDER BY applied_at
+        """)
+        return [row[0] for row in cursor.fetchall()]
+    
+    def _list_migration_files(self) -> List[str]:
+        """扫描迁移文件名，目录未变化时复用上次结果"""
+        mtime = self.migrations_dir.stat().st_mtime_ns
+        if self._migration_files_cache is None or self._migration_files_cache[0] != mtime:
+            names = [file_path.stem for file_path in sorted(self.migrations_dir.glob("*.sql"))]
+            self._migration_files_cache = (mtime, names)
+        return self._migration_files_cache[1]
     
-    def get_pending_migrations(self) -> List[str]:
+    def get_pending_migrations(self, applied_migrations: Optional[List[str]] = None) -> List[str]:
         """获取待应用的迁移列表"""
-        applied = set(self.get_applied_migrations())
-        all_migrations = []
-        
-        # 扫描迁移文件
-        for file_path in sorted(self.migrations_dir.glob("*.sql")):
-            migration_name = file_path.stem
-            if migration_name not in applied:
-                all_migrations.append(migration_name)
+        if applied_migrations is None:
+            applied_migrations = self.get_applied_migrations()
+        applied = set(applied_migrations)
         
-        return all_migrations
+        return [name for name in self._list_migration_files() if name not in applied]
     
     def apply_migration(self, migration_name: str) -> bool:
         """应用单个迁移"""
@@ -69,54 +135,65 @@ class MigrationManager:
             return False
         
         try:
-            # 读取迁移SQL
-            with open(migration_file, 'r', encoding='utf-8') as f:
-                migration_sql = f.read()
-            
             # 执行迁移
-            with sqlite3.connect(self.db_path) as conn:
-                # 开启事务
-                conn.execute("BEGIN TRANSACTION")
+            conn = self._get_connection()
+            
+            try:
+                # 逐条执行迁移SQL（可能包含多个语句），同一事务中记录迁移历史和内容哈希
+                digest = hashlib.sha256()
+                conn.execute("BEGIN")
+                for statement in self._iter_sql_statements(migration_file, digest):
+                    conn.execute(statement)
+                # 语句全部读取后哈希才完整
+                conn.execute("""
+                    INSERT INTO migration_history (migration_name, success, content_hash) 
+                    VALUES (?, TRUE, ?)
+                """, (migration_name, digest.hexdigest()))
+                conn.execute("COMMIT")
                 
-                try:
-                    # 执行迁移SQL（可能包含多个语句）
-                    conn.executescript(migration_sql)
-                    
-                    # 记录迁移历史
-                    conn.execute("""
-                        INSERT INTO migration_history (migration_name, success) 
-                        VALUES (?, TRUE)
-                    """, (migration_name,))
-                    
-                    conn.commit()
-                    logger.info(f"迁移应用成功: {migration_name}")
-                    return True
-                    
-                except Exception as e:
-                    conn.rollback()
-                    
-                    # 记录失败的迁移
-                    conn.execute("""
-                        INSERT INTO migration_history (migration_name, success, error_message) 
-                        VALUES (?, FALSE, ?)
-                    """, (migration_name, str(e)))
-                    conn.commit()
-                    
-                    logger.error(f"迁移应用失败: {migration_name}, 错误: {str(e)}")
-                    return False
+                logger.info(f"迁移应用成功: {migration_name}")
+                return True
+                
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                
+                # 记录失败的迁移
+                conn.execute("""
+                    INSERT INTO migration_history (migration_name, success, error_message) 
+                    VALUES (?, FALSE, ?)
+                """, (migration_name, str(e)))
+                
+                logger.error(f"迁移应用失败: {migration_name}, 错误: {str(e)}")
+                return False
                     
         except Exception as e:
-            logger.error(f"读取迁移文件失败: {migration_file}, 错误: {str(e)}")
+            logger.error(f"应用迁移失败: {migration_file}, 错误: {str(e)}")
             return False
     
     def apply_all_pending_migrations(self) -> Dict[str, Any]:
         """应用所有待处理的迁移"""
+        for migration_name in self.get_drifted_migrations():
+            logger.warning(f"迁移文件在应用后被修改，不会自动重新执行: {migration_name}")
+        
         pending = self.get_pending_migrations()
         
         if not pending:
             logger.info("没有待应用的迁移")
             return {"success": True, "applied": [], "message": "没有待应用的迁移"}
         
+        # 快速路径：所有待处理迁移合并为一个事务执行，只提交一次
+        if self._apply_migrations_batch(pending):
+            result = {
+                "success": True,
+                "applied": pending,
+                "failed": [],
+                "message": f"成功应用 {len(pending)} 个迁移"
+            }
+            logger.info(f"迁移结果: {result}")
+            return result
+        
+        # 批量失败时已整体回滚，逐个应用以定位并记录失败的迁移
         applied = []
         failed = []
         
@@ -138,16 +215,71 @@ class MigrationManager:
         logger.info(f"迁移结果: {result}")
         return result
     
+    def _apply_migrations_batch(self, pending: List[str]) -> bool:
+        """在单个事务中应用全部待处理迁移，失败时整体回滚"""
+        conn = self._get_connection()
+        
+        try:
+            digests = {migration_name: hashlib.sha256() for migration_name in pending}
+            
+            conn.execute("BEGIN")
+            for migration_name in pending:
+                migration_file = self.migrations_dir / f"{migration_name}.sql"
+                for statement in self._iter_sql_statements(migration_file, digests[migration_name]):
+                    conn.execute(statement)
+            # 所有语句执行完后哈希才完整，再统一记录迁移历史
+            conn.executemany("""
+                INSERT INTO migration_history (migration_name, success, content_hash) 
+                VALUES (?, TRUE, ?)
+            """, [(migration_name, digests[migration_name].hexdigest()) for migration_name in pending])
+            conn.execute("COMMIT")
+            
+            for migration_name in pending:
+                logger.info(f"迁移应用成功: {migration_name}")
+            return True
+            
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.warning(f"批量应用迁移失败，改为逐个应用: {str(e)}")
+            return False
+    
+    def get_drifted_migrations(self) -> List[str]:
+        """找出应用后文件内容又被修改过的迁移"""
+        cursor = self._get_connection().execute("""
+            SELECT migration_name, content_hash, applied_at FROM migration_history 
+            WHERE success = TRUE AND content_hash IS NOT NULL
+        """)
+        
+        drifted = []
+        for migration_name, content_hash, applied_at in cursor.fetchall():
+            migration_file = self.migrations_dir / f"{migration_name}.sql"
+            try:
+                mtime = migration_file.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            
+            # 应用之后没有修改过的文件无需读取内容（applied_at 为UTC时间）
+            applied_ts = datetime.fromisoformat(applied_at).replace(tzinfo=timezone.utc).timestamp()
+            if mtime < applied_ts:
+                continue
+            
+            if self._hash_sql_file(migration_file) != content_hash:
+                drifted.append(migration_name)
+        
+        return drifted
+    
     def get_migration_status(self) -> Dict[str, Any]:
         """获取迁移状态"""
         applied = self.get_applied_migrations()
-        pending = self.get_pending_migrations()
+        pending = self.get_pending_migrations(applied)
         
         return {
             "applied_count": len(applied),
             "pending_count": len(pending),
             "applied_migrations": applied,
             "pending_migrations": pending,
+            "drifted_migrations": self.get_drifted_migrations(),
             "last_migration": applied[-1] if applied else None
         }
     
@@ -160,32 +292,26 @@ class MigrationManager:
             return False
         
         try:
-            with open(rollback_file, 'r', encoding='utf-8') as f:
-                rollback_sql = f.read()
+            conn = self._get_connection()
             
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("BEGIN TRANSACTION")
+            try:
+                # 逐条执行回滚脚本并删除迁移记录
+                self._run_script_in_transaction(conn, self._iter_sql_statements(rollback_file), """
+                    DELETE FROM migration_history 
+                    WHERE migration_name = ?
+                """, [(migration_name,)])
                 
-                try:
-                    conn.executescript(rollback_sql)
-                    
-                    # 删除迁移记录
-                    conn.execute("""
-                        DELETE FROM migration_history 
-                        WHERE migration_name = ?
-                    """, (migration_name,))
-                    
-                    conn.commit()
-                    logger.info(f"迁移回滚成功: {migration_name}")
-                    return True
-                    
-                except Exception as e:
-                    conn.rollback()
-                    logger.error(f"迁移回滚失败: {migration_name}, 错误: {str(e)}")
-                    return False
+                logger.info(f"迁移回滚成功: {migration_name}")
+                return True
+                
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                logger.error(f"迁移回滚失败: {migration_name}, 错误: {str(e)}")
+                return False
                     
         except Exception as e:
-            logger.error(f"读取回滚文件失败: {rollback_file}, 错误: {str(e)}")
+            logger.error(f"回滚迁移失败: {rollback_file}, 错误: {str(e)}")
             return False
     
     def create_migration_template(self, name: str) -> str:
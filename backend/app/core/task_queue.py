@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+文档处理任务队列
+将上传后的文档处理和向量化交给独立的Celery worker执行，worker重启时任务不会丢失
+
+启动worker:
+    celery -A app.core.task_queue worker -Q doc_process,doc_vectorize
+
+重试耗尽的任务会转入对应的死信队列（doc_process.dead / doc_vectorize.dead）保留，
+排查后可启动消费死信队列的worker重新执行:
+    celery -A app.core.task_queue worker -Q doc_process.dead,doc_vectorize.dead
+"""
+import asyncio
+from typing import Any, Dict
+
+from loguru import logger
+
+from app.core.config import get_settings
+
+try:
+    from celery import Celery
+except ImportError:
+    Celery = None
+
+
+settings = get_settings()
+
+PROCESS_DOCUMENT_TASK = "process_document"
+VECTORIZE_DOCUMENT_TASK = "vectorize_document"
+# 死信队列名后缀
+DEAD_LETTER_QUEUE_SUFFIX = ".dead"
+
+celery_app = None
+if Celery is not None:
+    celery_app = Celery("doc_assistant", broker=settings.REDIS_URL)
+    celery_app.conf.update(
+        task_default_queue=settings.DOCUMENT_TASK_QUEUE,
+        task_serializer="json",
+        accept_content=["json"],
+        # 任务执行完成后才确认，worker中途退出时任务会重新投递
+        task_acks_late=True,
+        task_reject_on_worker_lost=True,
+        worker_prefetch_multiplier=1,
+    )
+
+    class DeadLetterTask(celery_app.Task):
+        """最终失败（重试耗尽或不再重试）时把任务转入死信队列，避免任务被丢弃"""
+
+        def on_failure(self, exc, task_id, args, kwargs, einfo):
+            dead_letter_queue = f"{self.queue}{DEAD_LETTER_QUEUE_SUFFIX}"
+            try:
+                self.app.send_task(self.name, args=args, kwargs=kwargs, queue=dead_letter_queue)
+                logger.error(f"任务 {self.name}[{task_id}] 最终失败，已转入死信队列 {dead_letter_queue}: {str(exc)}")
+            except Exception as e:
+                logger.error(f"任务 {self.name}[{task_id}] 转入死信队列失败: {str(e)}")
+
+    @celery_app.task(
+        name=PROCESS_DOCUMENT_TASK,
+        base=DeadLetterTask,
+        queue=settings.DOCUMENT_TASK_QUEUE,
+        bind=True,
+        max_retries=settings.DOCUMENT_TASK_MAX_RETRIES,
+        default_retry_delay=10,
+    )
+    def process_document_task(self, document_id: str, request_data: Dict[str, Any]):
+        """处理文档任务（在worker进程中运行）"""
+        # 延迟导入以避免循环依赖
+        from app.api.documents import process_document_async
+        from app.models.document import DocumentProcessRequest
+
+        try:
+            asyncio.run(process_document_async(
+                document_id, DocumentProcessRequest(**request_data), raise_on_error=True
+            ))
+        except Exception as e:
+            logger.error(f"文档处理任务失败 {document_id}: {str(e)}")
+            raise self.retry(exc=e)
+
+    @celery_app.task(
+        name=VECTORIZE_DOCUMENT_TASK,
+        base=DeadLetterTask,
+        queue=settings.VECTORIZE_TASK_QUEUE,
+        bind=True,
+        max_retries=settings.DOCUMENT_TASK_MAX_RETRIES,
+        default_retry_delay=10,
+    )
+    def vectorize_document_task(
+        self,
+        document_id: str,
+        chunk_size: int,
+        chunk_overlap: int,
+        force_reprocess: bool
+    ):
+        """文档向量化任务（在worker进程中运行）"""
+        from app.api.vectorization import _vectorize_document_background
+
+        try:
+            asyncio.run(_vectorize_document_background(
+                document_id, chunk_size, chunk_overlap, force_reprocess, raise_on_error=True
+            ))
+        except Exception as e:
+            logger.error(f"文档向量化任务失败 {document_id}: {str(e)}")
+            raise self.retry(exc=e)
+
+
+def is_task_queue_enabled() -> bool:
+    """任务队列是否可用"""
+    return settings.TASK_QUEUE_ENABLED and celery_app is not None
+
+
+async def enqueue_document_processing(document_id: str, request_data: Dict[str, Any]) -> bool:
+    """投递文档处理任务，成功返回True"""
+    if not is_task_queue_enabled():
+        return False
+
+    try:
+        # send_task 是阻塞的broker调用，放到线程中执行避免阻塞事件循环
+        await asyncio.to_thread(
+            celery_app.send_task,
+            PROCESS_DOCUMENT_TASK,
+            args=[document_id, request_data],
+            queue=settings.DOCUMENT_TASK_QUEUE,
+        )
+        logger.info(f"文档处理任务已入队: {document_id}")
+        return True
+    except Exception as e:
+        logger.error(f"文档处理任务入队失败 {document_id}: {str(e)}")
+        return False
+
+
+async def enqueue_document_vectorization(
+    document_id: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    force_reprocess: bool
+) -> bool:
+    """投递文档向量化任务，成功返回True"""
+    if not is_task_queue_enabled():
+        return False
+
+    try:
+        await asyncio.to_thread(
+            celery_app.send_task,
+            VECTORIZE_DOCUMENT_TASK,
+            args=[document_id, chunk_size, chunk_overlap, force_reprocess],
+            queue=settings.VECTORIZE_TASK_QUEUE,
+        )
+        logger.info(f"文档向量化任务已入队: {document_id}")
+        return True
+    except Exception as e:
+        logger.error(f"文档向量化任务入队失败 {document_id}: {str(e)}")
+        return False
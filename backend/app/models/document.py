@@ -1,11 +1,28 @@
 """
 文档相关数据模型
 """
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, Field, ConfigDict
+from typing import List, Optional, Dict, Any, Annotated, Literal
+from pydantic import BaseModel, Field, ConfigDict, BeforeValidator, PlainSerializer, model_validator
 from pathlib import Path
+import numpy as np
+
+
+def _to_float32_array(value: Any) -> np.ndarray:
+    """将浮点列表或原始字节缓冲转换为连续的 float32 数组"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return np.frombuffer(value, dtype=np.float32)
+    return np.ascontiguousarray(value, dtype=np.float32)
+
+
+# 嵌入向量：内存中为紧凑的 float32 数组，JSON 输出时仍为浮点列表
+Embedding = Annotated[
+    np.ndarray,
+    BeforeValidator(_to_float32_array),
+    PlainSerializer(lambda array: array.tolist(), return_type=List[float], when_used="json")
+]
 
 
 class DocumentStatus(str, Enum):
@@ -44,17 +61,69 @@ class DocumentMetadata(BaseModel):
     custom_fields: Dict[str, Any] = Field(default_factory=dict)
 
 
+class ChunkMetadata(BaseModel):
+    """文档分块元数据"""
+    model_config = ConfigDict(extra="allow")
+    
+    document_type: Optional[str] = None
+    filename: Optional[str] = None
+
+
 class DocumentChunk(BaseModel):
     """文档分块"""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    
     chunk_id: str
     document_id: str
     content: str
     chunk_index: int
     start_char: int
     end_char: int
-    metadata: Dict[str, Any] = Field(default_factory=dict)
-    embedding: Optional[List[float]] = None
+    metadata: ChunkMetadata = Field(default_factory=ChunkMetadata)
+    embedding: Optional[Embedding] = None
     created_at: datetime = Field(default_factory=datetime.now)
+    
+    def to_record(self) -> "ChunkRecord":
+        """转换为内部流水线使用的轻量分块记录"""
+        return ChunkRecord(
+            chunk_id=self.chunk_id,
+            document_id=self.document_id,
+            content=self.content,
+            chunk_index=self.chunk_index,
+            start_char=self.start_char,
+            end_char=self.end_char,
+            metadata=self.metadata,
+            embedding=self.embedding,
+            created_at=self.created_at
+        )
+
+
+@dataclass(slots=True)
+class ChunkRecord:
+    """内部流水线使用的文档分块记录（不做校验，仅在API边界转换为 DocumentChunk）"""
+    chunk_id: str
+    document_id: str
+    content: str
+    chunk_index: int
+    start_char: int
+    end_char: int
+    metadata: ChunkMetadata = field(default_factory=ChunkMetadata)
+    embedding: Optional[np.ndarray] = None
+    created_at: datetime = field(default_factory=datetime.now)
+    
+    def to_pydantic(self) -> DocumentChunk:
+        """转换为API层使用的 DocumentChunk"""
+        return DocumentChunk(
+            chunk_id=self.chunk_id,
+            document_id=self.document_id,
+            content=self.content,
+            chunk_index=self.chunk_index,
+            start_char=self.start_char,
+            end_char=self.end_char,
+            metadata=self.metadata,
+            embedding=self.embedding,
+            created_at=self.created_at
+        )
 
 
 class Document(BaseModel):
@@ -86,7 +155,7 @@ class Document(BaseModel):
     chunk_count: int = 0
 
     # 分类信息
-    category: Optional[str] = None  # 主分类
+    category: str = "未分类"  # 主分类
     subcategory: Optional[str] = None  # 子分类
     auto_tags: Optional[str] = None  # JSON格式存储自动生成的标签
     manual_tags: Optional[str] = None  # JSON格式存储用户手动添加的标签
@@ -131,12 +200,14 @@ class DocumentListRequest(BaseModel):
     document_type: Optional[DocumentType] = None
     search_query: Optional[str] = None
     tags: List[str] = Field(default_factory=list)
-    sort_by: str = Field(default="created_at")
-    sort_order: str = Field(default="desc", pattern="^(asc|desc)$")
+    sort_by: Literal["created_at", "updated_at", "filename", "file_size"] = "created_at"
+    sort_order: Literal["asc", "desc"] = "desc"
 
 
 class DocumentListResponse(BaseModel):
     """文档列表响应"""
+    model_config = ConfigDict(frozen=True)
+    
     success: bool
     documents: List[Document]
     total: int
@@ -177,6 +248,8 @@ class DocumentSearchRequest(BaseModel):
 
 class DocumentSearchResult(BaseModel):
     """文档搜索结果"""
+    model_config = ConfigDict(frozen=True)
+    
     document_id: str
     chunk_id: Optional[str] = None
     filename: str
@@ -187,8 +260,44 @@ class DocumentSearchResult(BaseModel):
 
 class DocumentSearchResponse(BaseModel):
     """文档搜索响应"""
+    model_config = ConfigDict(frozen=True)
+    
     success: bool
     query: str
     results: List[DocumentSearchResult]
     total_results: int
     search_time: float
+
+
+class BatchSubRequest(BaseModel):
+    """批量请求中的单个子请求"""
+    id: str
+    method: str = Field(default="GET", pattern="^(GET|POST|PUT|DELETE)$")
+    url: str
+    body: Optional[Any] = None
+
+
+class BatchRequest(BaseModel):
+    """批量请求"""
+    requests: List[BatchSubRequest] = Field(..., min_length=1, max_length=100)
+
+    @model_validator(mode="after")
+    def check_unique_ids(self) -> "BatchRequest":
+        """子请求ID用于对应响应，不允许重复"""
+        ids = [sub.id for sub in self.requests]
+        if len(set(ids)) != len(ids):
+            raise ValueError("子请求ID不能重复")
+        return self
+
+
+class BatchSubResponse(BaseModel):
+    """批量请求中的单个子响应"""
+    id: str
+    status: int
+    body: Optional[Any] = None
+
+
+class BatchResponse(BaseModel):
+    """批量响应"""
+    success: bool
+    responses: List[BatchSubResponse]
@@ -2,7 +2,8 @@
 """
 RAG (检索增强生成) 相关数据模型
 """
-from typing import List, Optional, Dict, Any, Union
+from dataclasses import dataclass, field
+from typing import Deque, List, Optional, Dict, Any, Union
 from pydantic import BaseModel, Field
 from datetime import datetime
 from enum import Enum
@@ -122,30 +123,55 @@ class ConversationHistory(BaseModel):
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
     metadata: Optional[Dict[str, Any]] = None
+    user_msg_count: int = 0
+    assistant_msg_count: int = 0
 
 
-class RAGConfig(BaseModel):
-    """RAG配置模型"""
-    # 检索配置
-    default_retrieval_count: int = Field(default=5, description="默认检索文档数")
-    default_similarity_threshold: float = Field(default=0.3, description="默认相似度阈值(降低以获得更多结果)")
-    enable_hybrid_search: bool = Field(default=True, description="启用混合搜索")
-    
-    # 上下文配置
-    max_context_tokens: int = Field(default=4000, description="最大上下文token数")
-    context_overlap_ratio: float = Field(default=0.1, description="上下文重叠比例")
-    
-    # 生成配置
-    default_temperature: float = Field(default=0.7, description="默认生成温度")
-    default_max_tokens: int = Field(default=1000, description="默认最大生成token数")
+@dataclass(slots=True)
+class ChatMessageRecord:
+    """对话管理器内部保存的消息记录（不做校验，仅在API边界转换为 ChatMessage）"""
+    role: ChatRole
+    content: str
+    timestamp: datetime
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    token_count: Optional[int] = None  # 估算的token数，首次计算后缓存（消息添加后内容不再变化）
     
-    # 对话配置
-    max_conversation_history: int = Field(default=50, description="最大对话历史数")
-    conversation_timeout_hours: int = Field(default=24, description="对话超时时间(小时)")
+    def to_pydantic(self) -> ChatMessage:
+        """转换为API层使用的 ChatMessage"""
+        return ChatMessage(
+            role=self.role,
+            content=self.content,
+            timestamp=self.timestamp,
+            metadata=self.metadata
+        )
+
+
+@dataclass(slots=True)
+class ConversationRecord:
+    """对话管理器内部保存的对话记录，消息队列带长度上限"""
+    conversation_id: str
+    messages: Deque[ChatMessageRecord]
+    created_at: datetime
+    updated_at: datetime
+    metadata: Optional[Dict[str, Any]] = None
+    user_msg_count: int = 0
+    assistant_msg_count: int = 0
     
-    # 系统提示词
-    system_prompt: str = Field(
-        default="""你是一个专业的智能文档助理。请严格按照以下要求回答用户问题：
+    def to_pydantic(self) -> ConversationHistory:
+        """转换为API层使用的 ConversationHistory"""
+        return ConversationHistory(
+            conversation_id=self.conversation_id,
+            messages=[message.to_pydantic() for message in self.messages],
+            created_at=self.created_at,
+            updated_at=self.updated_at,
+            metadata=self.metadata,
+            user_msg_count=self.user_msg_count,
+            assistant_msg_count=self.assistant_msg_count
+        )
+
+
+# 默认系统提示词（模块级常量，所有配置实例共享同一字符串）
+DEFAULT_SYSTEM_PROMPT = """你是一个专业的智能文档助理。请严格按照以下要求回答用户问题：
 
 ## 🎯 核心要求
 1. **仅基于提供的文档内容回答**，不要添加文档外的信息
@@ -170,9 +196,31 @@ class RAGConfig(BaseModel):
 - 添加文档中不存在的信息
 - 使用过于复杂的表述
 
-请基于以下文档内容简洁准确地回答用户问题：""",
-        description="简化优化的系统提示词"
-    )
+请基于以下文档内容简洁准确地回答用户问题："""
+
+
+class RAGConfig(BaseModel):
+    """RAG配置模型"""
+    # 检索配置
+    default_retrieval_count: int = Field(default=5, description="默认检索文档数")
+    default_similarity_threshold: float = Field(default=0.3, description="默认相似度阈值(降低以获得更多结果)")
+    enable_hybrid_search: bool = Field(default=True, description="启用混合搜索")
+    
+    # 上下文配置
+    max_context_tokens: int = Field(default=4000, description="最大上下文token数")
+    context_overlap_ratio: float = Field(default=0.1, description="上下文重叠比例")
+    
+    # 生成配置
+    default_temperature: float = Field(default=0.7, description="默认生成温度")
+    default_max_tokens: int = Field(default=1000, description="默认最大生成token数")
+    
+    # 对话配置
+    max_conversation_history: int = Field(default=50, description="最大对话历史数")
+    max_history_tokens: int = Field(default=1000, description="提示词中对话历史的最大token数")
+    conversation_timeout_hours: int = Field(default=24, description="对话超时时间(小时)")
+    
+    # 系统提示词
+    system_prompt: str = Field(default=DEFAULT_SYSTEM_PROMPT, description="简化优化的系统提示词")
 
 
 class QueryAnalysis(BaseModel):
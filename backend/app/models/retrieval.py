@@ -1,7 +1,7 @@
 """
 增强检索功能的数据模型
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 from enum import Enum
@@ -69,6 +69,17 @@ class AdvancedSearchRequest(BaseModel):
     # 缓存配置
     use_cache: bool = Field(default=True, description="使用缓存")
 
+    @model_validator(mode="after")
+    def normalize_weights(self) -> "AdvancedSearchRequest":
+        """将关键词权重和语义权重归一化，使两者之和为1"""
+        total = self.keyword_weight + self.semantic_weight
+        if total <= 0:
+            self.keyword_weight = self.semantic_weight = 0.5
+        elif abs(total - 1.0) > 1e-9:
+            self.keyword_weight = self.keyword_weight / total
+            self.semantic_weight = 1.0 - self.keyword_weight
+        return self
+
 
 class SearchResult(BaseModel):
     """搜索结果项"""
@@ -2,10 +2,26 @@
 文档分块服务 - 智能文本分割
 """
 import re
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, NamedTuple, Iterator, Tuple
 from loguru import logger
 
 
+# 中英文句子分割（单一字符类，无分支；结束符后的空白由 strip 去掉）
+_SENT_RE = re.compile(r'[.!?。！？\n]+')
+# Markdown标题（# ## ### 等）前的换行
+_MD_HEADING_RE = re.compile(r'\n(?=#{1,6}\s)')
+# 多个空行
+_BLANK_RE = re.compile(r'\n\s*\n\s*\n+')
+# 连续的空格/制表符
+_WS_RE = re.compile(r'[ \t]+')
+
+
+class ChunkBatch(NamedTuple):
+    """分块结果：文本与元数据按下标一一对应的两个并行列表"""
+    texts: List[str]
+    metadatas: List[Dict[str, Any]]
+
+
 class ChunkingService:
     """文档分块服务"""
     
@@ -23,7 +39,7 @@ class ChunkingService:
         overlap: int = None,
         document_id: str = "",
         document_type: str = ""
-    ) -> List[Dict[str, Any]]:
+    ) -> ChunkBatch:
         """
         将文本分割成块
         
@@ -35,11 +51,31 @@ class ChunkingService:
             document_type: 文档类型
             
         Returns:
-            分块结果列表，每个元素包含文本和元数据
+            分块结果，文本列表和元数据列表按下标对应
+        """
+        batch = ChunkBatch([], [])
+        for chunk_text, metadata in self.iter_chunks(text, chunk_size, overlap, document_id, document_type):
+            batch.texts.append(chunk_text)
+            batch.metadatas.append(metadata)
+        return batch
+    
+    def iter_chunks(
+        self,
+        text: str,
+        chunk_size: int = None,
+        overlap: int = None,
+        document_id: str = "",
+        document_type: str = ""
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        逐块产出 (文本, 元数据)，下游可以边分块边处理
+        
+        元数据中的 total_chunks 在生成器耗尽时才回填到已产出的字典中，
+        需要该字段的调用方应在迭代结束后再读取
         """
         if not text or not text.strip():
             logger.warning("输入文本为空，跳过分块")
-            return []
+            return
         
         # 使用默认值
         chunk_size = chunk_size or self.default_chunk_size
@@ -56,132 +92,158 @@ class ChunkingService:
         
         # 根据文档类型选择分块策略
         if document_type.lower() == "md":
-            chunks = self._chunk_markdown(text, chunk_size, overlap)
+            chunks = self._iter_markdown_chunks(text, chunk_size, overlap)
         else:
-            chunks = self._chunk_by_sentences(text, chunk_size, overlap)
+            chunks = self._iter_sentence_chunks(text, chunk_size, overlap)
         
         # 生成元数据
-        chunk_data = []
+        emitted: List[Dict[str, Any]] = []
+        total_chunks = 0
         for i, chunk_text in enumerate(chunks):
-            if len(chunk_text.strip()) >= self.min_chunk_size:
-                chunk_data.append({
-                    "text": chunk_text.strip(),
-                    "metadata": {
-                        "document_id": document_id,
-                        "chunk_index": i,
-                        "chunk_size": len(chunk_text),
-                        "document_type": document_type,
-                        "total_chunks": len(chunks)
-                    }
-                })
-        
-        logger.info(f"文档分块完成: 生成 {len(chunk_data)} 个有效块")
-        return chunk_data
+            total_chunks = i + 1
+            stripped = chunk_text.strip()
+            if len(stripped) >= self.min_chunk_size:
+                metadata = {
+                    "document_id": document_id,
+                    "chunk_index": i,
+                    "chunk_size": len(stripped),
+                    "document_type": document_type,
+                    "total_chunks": 0
+                }
+                emitted.append(metadata)
+                yield stripped, metadata
+        
+        for metadata in emitted:
+            metadata["total_chunks"] = total_chunks
+        
+        logger.info(f"文档分块完成: 生成 {len(emitted)} 个有效块")
     
     def _preprocess_text(self, text: str) -> str:
         """预处理文本"""
-        # 统一换行符
-        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        # 统一换行符（已是 \n 换行的文本跳过）
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
         
         # 移除多余的空白字符，但保留段落结构
-        text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)  # 多个空行合并为两个
-        text = re.sub(r'[ \t]+', ' ', text)  # 多个空格/制表符合并为一个空格
+        text = _BLANK_RE.sub('\n\n', text)  # 多个空行合并为两个
+        if '\t' in text or '  ' in text:
+            text = _WS_RE.sub(' ', text)  # 多个空格/制表符合并为一个空格
         
         return text.strip()
     
     def _chunk_by_sentences(self, text: str, chunk_size: int, overlap: int) -> List[str]:
         """基于句子的智能分块"""
+        return list(self._iter_sentence_chunks(text, chunk_size, overlap))
+    
+    def _iter_sentence_chunks(self, text: str, chunk_size: int, overlap: int) -> Iterator[str]:
+        """基于句子的智能分块，逐块产出"""
         # 按句子分割
         sentences = self._split_into_sentences(text)
         
         if not sentences:
-            return [text]
+            yield text
+            return
         
-        chunks = []
-        current_chunk = ""
+        # 常见情况下没有超过块大小的句子，走不需要处理超长句的紧凑循环
+        if max(map(len, sentences)) <= chunk_size:
+            yield from self._pack_sentences(sentences, chunk_size, overlap)
+            return
+        
+        # 当前块的句子缓冲，块完成时才拼接，避免反复拼接字符串
+        buf: List[str] = []
         current_size = 0
         
-        i = 0
-        while i < len(sentences):
-            sentence = sentences[i]
+        for sentence in sentences:
             sentence_size = len(sentence)
             
             # 如果当前句子本身就超过块大小，直接作为一个块
             if sentence_size > chunk_size:
-                if current_chunk:
-                    chunks.append(current_chunk)
-                    current_chunk = ""
+                if buf:
+                    yield " ".join(buf)
+                    buf.clear()
                     current_size = 0
-                chunks.append(sentence)
-                i += 1
+                yield sentence
                 continue
             
             # 如果添加当前句子会超过块大小
             if current_size + sentence_size > chunk_size:
-                if current_chunk:
-                    chunks.append(current_chunk)
+                if buf:
+                    current_chunk = " ".join(buf)
+                    yield current_chunk
+                    buf.clear()
                     
                     # 处理重叠
-                    if overlap > 0:
-                        overlap_text = self._get_overlap_text(current_chunk, overlap)
-                        current_chunk = overlap_text + " " + sentence if overlap_text else sentence
-                        current_size = len(current_chunk)
+                    overlap_text = self._get_overlap_text(current_chunk, overlap) if overlap > 0 else ""
+                    if overlap_text:
+                        buf.append(overlap_text)
+                        current_size = len(overlap_text) + 1 + sentence_size
                     else:
-                        current_chunk = sentence
                         current_size = sentence_size
                 else:
-                    current_chunk = sentence
                     current_size = sentence_size
+                buf.append(sentence)
             else:
                 # 添加句子到当前块
-                if current_chunk:
-                    current_chunk += " " + sentence
-                else:
-                    current_chunk = sentence
-                current_size += sentence_size + (1 if current_chunk != sentence else 0)
-            
-            i += 1
+                current_size += sentence_size + (1 if buf else 0)
+                buf.append(sentence)
         
         # 添加最后一个块
-        if current_chunk:
-            chunks.append(current_chunk)
+        if buf:
+            yield " ".join(buf)
+    
+    def _pack_sentences(self, sentences: List[str], chunk_size: int, overlap: int) -> Iterator[str]:
+        """将都不超过块大小的句子贪心打包成块"""
+        buf: List[str] = []
+        current_size = 0
         
-        return chunks
+        for sentence in sentences:
+            sentence_size = len(sentence)
+            
+            # 添加当前句子会超过块大小时先产出当前块，新块以重叠部分开头
+            if buf and current_size + sentence_size > chunk_size:
+                current_chunk = " ".join(buf)
+                yield current_chunk
+                buf.clear()
+                current_size = 0
+                
+                overlap_text = self._get_overlap_text(current_chunk, overlap) if overlap > 0 else ""
+                if overlap_text:
+                    buf.append(overlap_text)
+                    current_size = len(overlap_text)
+            
+            current_size += sentence_size + (1 if buf else 0)
+            buf.append(sentence)
+        
+        if buf:
+            yield " ".join(buf)
     
     def _chunk_markdown(self, text: str, chunk_size: int, overlap: int) -> List[str]:
         """Markdown文档的智能分块"""
+        return list(self._iter_markdown_chunks(text, chunk_size, overlap))
+    
+    def _iter_markdown_chunks(self, text: str, chunk_size: int, overlap: int) -> Iterator[str]:
+        """Markdown文档的智能分块，逐块产出"""
         # 按标题层级分割
         sections = self._split_markdown_sections(text)
         
-        chunks = []
         for section in sections:
             if len(section) <= chunk_size:
-                chunks.append(section)
+                yield section
             else:
                 # 大段落继续按句子分块
-                sub_chunks = self._chunk_by_sentences(section, chunk_size, overlap)
-                chunks.extend(sub_chunks)
-        
-        return chunks
+                yield from self._iter_sentence_chunks(section, chunk_size, overlap)
     
     def _split_into_sentences(self, text: str) -> List[str]:
         """将文本分割成句子"""
-        # 中英文句子分割正则表达式
-        sentence_pattern = r'[.!?。！？]+[\s]*|[\n]+'
-        sentences = re.split(sentence_pattern, text)
-        
-        # 清理空句子
-        sentences = [s.strip() for s in sentences if s.strip()]
+        # 清理空句子（每个片段只 strip 一次）
+        sentences = [s for s in map(str.strip, _SENT_RE.split(text)) if s]
         
         return sentences
     
     def _split_markdown_sections(self, text: str) -> List[str]:
         """按Markdown标题分割文档"""
-        # 按标题分割（# ## ### 等）
-        sections = re.split(r'\n(?=#{1,6}\s)', text)
-        
-        # 清理空段落
-        sections = [s.strip() for s in sections if s.strip()]
+        # 按标题分割并清理空段落
+        sections = [s for s in map(str.strip, _MD_HEADING_RE.split(text)) if s]
         
         return sections
     
@@ -200,9 +262,9 @@ class ChunkingService:
         
         return overlap_text
     
-    def get_chunk_stats(self, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def get_chunk_stats(self, chunks: ChunkBatch) -> Dict[str, Any]:
         """获取分块统计信息"""
-        if not chunks:
+        if not chunks.texts:
             return {
                 "total_chunks": 0,
                 "total_characters": 0,
@@ -211,12 +273,13 @@ class ChunkingService:
                 "max_chunk_size": 0
             }
         
-        chunk_sizes = [len(chunk["text"]) for chunk in chunks]
+        chunk_sizes = list(map(len, chunks.texts))
+        total_characters = sum(chunk_sizes)
         
         return {
-            "total_chunks": len(chunks),
-            "total_characters": sum(chunk_sizes),
-            "avg_chunk_size": sum(chunk_sizes) // len(chunk_sizes),
+            "total_chunks": len(chunk_sizes),
+            "total_characters": total_characters,
+            "avg_chunk_size": total_characters // len(chunk_sizes),
             "min_chunk_size": min(chunk_sizes),
             "max_chunk_size": max(chunk_sizes)
         }
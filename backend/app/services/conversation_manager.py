@@ -3,23 +3,32 @@
 对话管理服务 - 从RAG服务中提取的对话相关功能
 """
 import uuid
-from typing import Dict, List, Optional
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from loguru import logger
 
 from app.models.rag import (
-    ConversationHistory, ChatMessage, ChatRole, RAGMetrics
+    ConversationHistory, ConversationRecord, ChatMessageRecord, ChatRole, RAGMetrics
 )
 
 
+# 每个对话最多保留的消息数
+MAX_MESSAGES_PER_CONVERSATION = 100
+
+
 class ConversationManager:
     """对话管理器"""
     
     def __init__(self, max_conversations: int = 1000, expire_hours: int = 24):
-        self.conversations: Dict[str, ConversationHistory] = {}
+        # 按更新时间从旧到新排列，更新时移到末尾
+        self.conversations: "OrderedDict[str, ConversationRecord]" = OrderedDict()
         self.max_conversations = max_conversations
         self.expire_hours = expire_hours
-        self.metrics = RAGMetrics()
+        self._reset_counters()
+        # 所有对话的消息总数，随添加/删除增量维护
+        self._total_messages = 0
         
         logger.info(f"对话管理器初始化完成，最大对话数: {max_conversations}")
     
@@ -29,11 +38,13 @@ class ConversationManager:
             conversation_id = str(uuid.uuid4())
         
         if conversation_id not in self.conversations:
-            self.conversations[conversation_id] = ConversationHistory(
+            now = datetime.now()
+            # 消息队列带长度上限，追加时自动丢弃最旧的消息
+            self.conversations[conversation_id] = ConversationRecord(
                 conversation_id=conversation_id,
-                messages=[],
-                created_at=datetime.now(),
-                updated_at=datetime.now()
+                messages=deque(maxlen=MAX_MESSAGES_PER_CONVERSATION),
+                created_at=now,
+                updated_at=now
             )
             logger.info(f"创建新对话: {conversation_id}")
         
@@ -47,66 +58,88 @@ class ConversationManager:
         metadata: Optional[Dict] = None
     ) -> bool:
         """添加消息到对话"""
+        return self.add_messages(conversation_id, [(role, content, metadata)])
+    
+    def add_messages(
+        self,
+        conversation_id: str,
+        entries: List[Tuple[ChatRole, str, Optional[Dict]]]
+    ) -> bool:
+        """批量添加消息到对话（如一轮问答），共用同一时间戳，只更新一次对话"""
         if conversation_id not in self.conversations:
             self.create_conversation(conversation_id)
         
         conversation = self.conversations[conversation_id]
-        message = ChatMessage(
-            role=role,
-            content=content,
-            timestamp=datetime.now(),
-            metadata=metadata or {}
-        )
-        
-        conversation.messages.append(message)
-        conversation.updated_at = datetime.now()
-        
-        # 限制消息数量
-        max_messages = 100  # 每个对话最多保留100条消息
-        if len(conversation.messages) > max_messages:
-            conversation.messages = conversation.messages[-max_messages:]
-        
-        logger.debug(f"添加消息到对话 {conversation_id}: {role.value}")
+        messages = conversation.messages
+        now = datetime.now()
+        
+        for role, content, metadata in entries:
+            # 队列已满时追加会挤掉最旧的消息，先扣除它的计数
+            if len(messages) == messages.maxlen:
+                self._count_message(conversation, messages[0].role, -1)
+            messages.append(ChatMessageRecord(
+                role=role,
+                content=content,
+                timestamp=now,
+                metadata=metadata or {}
+            ))
+            self._count_message(conversation, role, 1)
+        
+        conversation.updated_at = now
+        self.conversations.move_to_end(conversation_id)
+        
+        logger.debug(f"添加 {len(entries)} 条消息到对话 {conversation_id}")
         return True
     
+    def _count_message(self, conversation: ConversationRecord, role: ChatRole, delta: int):
+        """更新对话的分角色消息计数和消息总数"""
+        if role == ChatRole.USER:
+            conversation.user_msg_count += delta
+        elif role == ChatRole.ASSISTANT:
+            conversation.assistant_msg_count += delta
+        self._total_messages += delta
+    
     def get_conversation(self, conversation_id: str) -> Optional[ConversationHistory]:
-        """获取对话历史"""
-        return self.conversations.get(conversation_id)
+        """获取对话历史（按需转换为API模型）"""
+        conversation = self.conversations.get(conversation_id)
+        return conversation.to_pydantic() if conversation else None
     
     def get_recent_messages(
         self, 
         conversation_id: str, 
         limit: int = 10
-    ) -> List[ChatMessage]:
+    ) -> List[ChatMessageRecord]:
         """获取最近的消息"""
-        conversation = self.get_conversation(conversation_id)
+        conversation = self.conversations.get(conversation_id)
         if not conversation:
             return []
         
-        return conversation.messages[-limit:] if conversation.messages else []
+        # 从队尾倒序取 limit 条，避免遍历整个队列
+        recent = list(islice(reversed(conversation.messages), limit))
+        recent.reverse()
+        return recent
     
     def clear_conversation(self, conversation_id: str) -> bool:
         """清除对话历史"""
-        if conversation_id in self.conversations:
-            del self.conversations[conversation_id]
-            logger.info(f"清除对话: {conversation_id}")
-            return True
-        return False
+        conversation = self.conversations.pop(conversation_id, None)
+        if conversation is None:
+            return False
+        
+        self._total_messages -= len(conversation.messages)
+        logger.info(f"清除对话: {conversation_id}")
+        return True
     
     def get_conversation_summary(self, conversation_id: str) -> Dict:
         """获取对话摘要"""
-        conversation = self.get_conversation(conversation_id)
+        conversation = self.conversations.get(conversation_id)
         if not conversation:
             return {}
         
-        user_messages = [msg for msg in conversation.messages if msg.role == ChatRole.USER]
-        assistant_messages = [msg for msg in conversation.messages if msg.role == ChatRole.ASSISTANT]
-        
         return {
             'conversation_id': conversation_id,
             'total_messages': len(conversation.messages),
-            'user_messages': len(user_messages),
-            'assistant_messages': len(assistant_messages),
+            'user_messages': conversation.user_msg_count,
+            'assistant_messages': conversation.assistant_msg_count,
             'created_at': conversation.created_at.isoformat(),
             'updated_at': conversation.updated_at.isoformat(),
             'duration_minutes': (conversation.updated_at - conversation.created_at).total_seconds() / 60
@@ -114,11 +147,11 @@ class ConversationManager:
     
     def list_conversations(self, limit: int = 50) -> List[Dict]:
         """列出对话"""
-        conversations = []
-        for conv_id, conv in list(self.conversations.items())[-limit:]:
-            conversations.append(self.get_conversation_summary(conv_id))
-        
-        return sorted(conversations, key=lambda x: x['updated_at'], reverse=True)
+        # 对话已按更新时间排列，倒序取前 limit 个即为最近更新的对话
+        return [
+            self.get_conversation_summary(conv_id)
+            for conv_id in islice(reversed(self.conversations), limit)
+        ]
     
     def cleanup_expired_conversations(self) -> int:
         """清理过期的对话"""
@@ -126,36 +159,32 @@ class ConversationManager:
             return 0
         
         cutoff_time = datetime.now() - timedelta(hours=self.expire_hours)
-        expired_ids = []
-        
-        for conv_id, conversation in self.conversations.items():
-            if conversation.updated_at < cutoff_time:
-                expired_ids.append(conv_id)
+        expired_count = 0
         
-        for conv_id in expired_ids:
-            del self.conversations[conv_id]
+        # 对话按更新时间排列，遇到第一个未过期的即可停止
+        while self.conversations:
+            conversation = next(iter(self.conversations.values()))
+            if conversation.updated_at >= cutoff_time:
+                break
+            self.conversations.popitem(last=False)
+            self._total_messages -= len(conversation.messages)
+            expired_count += 1
         
-        if expired_ids:
-            logger.info(f"清理了 {len(expired_ids)} 个过期对话")
+        if expired_count:
+            logger.info(f"清理了 {expired_count} 个过期对话")
         
-        return len(expired_ids)
+        return expired_count
     
     def cleanup_excess_conversations(self) -> int:
         """清理超出限制的对话"""
         if len(self.conversations) <= self.max_conversations:
             return 0
         
-        # 按更新时间排序，删除最旧的对话
-        sorted_conversations = sorted(
-            self.conversations.items(),
-            key=lambda x: x[1].updated_at
-        )
-        
-        excess_count = len(self.conversations) - self.max_conversations
+        # 删除最旧的对话（位于开头）
         removed_count = 0
-        
-        for conv_id, _ in sorted_conversations[:excess_count]:
-            del self.conversations[conv_id]
+        while len(self.conversations) > self.max_conversations:
+            _, conversation = self.conversations.popitem(last=False)
+            self._total_messages -= len(conversation.messages)
             removed_count += 1
         
         if removed_count > 0:
@@ -173,8 +202,6 @@ class ConversationManager:
                 'active_conversations_24h': 0
             }
         
-        total_messages = sum(len(conv.messages) for conv in self.conversations.values())
-        
         # 24小时内活跃的对话
         cutoff_24h = datetime.now() - timedelta(hours=24)
         active_24h = sum(
@@ -184,32 +211,41 @@ class ConversationManager:
         
         return {
             'total_conversations': len(self.conversations),
-            'total_messages': total_messages,
-            'average_messages_per_conversation': total_messages / len(self.conversations),
+            'total_messages': self._total_messages,
+            'average_messages_per_conversation': self._total_messages / len(self.conversations),
             'active_conversations_24h': active_24h
         }
     
+    def _reset_counters(self):
+        """重置性能指标计数（以普通属性保存，读取时再生成 RAGMetrics）"""
+        self._total_requests = 0
+        self._successful_requests = 0
+        self._failed_requests = 0
+        self._total_response_time = 0.0
+    
     def update_metrics(self, response_time: float, success: bool):
         """更新性能指标"""
-        self.metrics.total_requests += 1
-        self.metrics.total_response_time += response_time
+        self._total_requests += 1
+        self._total_response_time += response_time
         
         if success:
-            self.metrics.successful_requests += 1
+            self._successful_requests += 1
         else:
-            self.metrics.failed_requests += 1
-        
-        # 更新平均响应时间
-        if self.metrics.total_requests > 0:
-            self.metrics.average_response_time = (
-                self.metrics.total_response_time / self.metrics.total_requests
-            )
+            self._failed_requests += 1
     
     def get_metrics(self) -> RAGMetrics:
-        """获取性能指标"""
-        return self.metrics
+        """获取性能指标快照"""
+        return RAGMetrics(
+            total_requests=self._total_requests,
+            successful_requests=self._successful_requests,
+            failed_requests=self._failed_requests,
+            total_response_time=self._total_response_time,
+            average_response_time=(
+                self._total_response_time / self._total_requests if self._total_requests else 0.0
+            )
+        )
     
     def reset_metrics(self):
         """重置性能指标"""
-        self.metrics = RAGMetrics()
+        self._reset_counters()
         logger.info("性能指标已重置")
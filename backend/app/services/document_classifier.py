@@ -5,12 +5,37 @@
 """
 import json
 import re
-from typing import List, Dict, Any, Optional, Tuple
+import time
+import asyncio
+import numpy as np
+from typing import List, Dict, Any, FrozenSet, Optional, Tuple
 from datetime import datetime
 from loguru import logger
 
 from app.core.llm_factory import get_llm_factory
+from app.core.micro_batcher import MicroBatcher
 from app.models.document import Document, DocumentMetadata
+from app.services.embedding_service import embedding_service
+
+# 单次LLM调用合并的最大文档数
+CLASSIFY_BATCH_SIZE = 4
+# 等待凑批的最长时间（秒）
+CLASSIFY_BATCH_WAIT = 0.02
+# 单文档分类和批量分类时每个文档的内容预览长度
+CLASSIFY_PREVIEW_LENGTH = 1200
+BATCH_PREVIEW_LENGTH = 1000
+# 批量分类时同时进行的分类任务数
+CLASSIFY_MAX_CONCURRENT = 16
+# 是否启用语义缓存（每次LLM分类前都要多一次嵌入请求，命中时省去LLM调用）
+CLASSIFY_CACHE_ENABLED = True
+# 语义缓存：最多缓存的分类结果数、复用结果的最低余弦相似度、有效期（秒）
+CLASSIFY_CACHE_SIZE = 512
+CLASSIFY_CACHE_THRESHOLD = 0.92
+CLASSIFY_CACHE_TTL = 24 * 3600
+
+# 行内连续空白、目录中的引导点
+_PREVIEW_WS_RE = re.compile(r'\s+')
+_PREVIEW_LEADER_RE = re.compile(r'(?:\.\s*){4,}|…{2,}|·{4,}')
 
 
 class ClassificationResult:
@@ -26,12 +51,74 @@ class ClassificationResult:
         self.reasoning: str = ""
 
 
+class SemanticClassificationCache:
+    """按内容预览嵌入向量的余弦相似度复用LLM分类结果（近似重复文档不再调用LLM）
+
+    只复用分类、标签等可在相似文档间共享的字段，摘要、关键词等逐文档字段不缓存
+    """
+
+    def __init__(self, max_size: int, threshold: float, ttl: float):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl
+        # 归一化后的向量按行保存在环形缓冲区中，一次矩阵乘法完成查找
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[Optional[Tuple[tuple, float]]] = [None] * max_size
+        self._next = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        """转换为单位向量，零向量返回 None"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def lookup(self, embedding: List[float]) -> Optional[ClassificationResult]:
+        """查找足够相似且未过期的缓存分类，返回只含共享字段的新结果"""
+        vector = self._normalize(embedding)
+        if vector is None or self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+            return None
+
+        similarities = self._vectors @ vector
+        now = time.monotonic()
+        for index in np.argsort(similarities)[::-1]:
+            if similarities[index] < self.threshold:
+                break
+            entry = self._entries[index]
+            if entry is not None and entry[1] > now:
+                result = ClassificationResult()
+                category, subcategory, confidence, auto_tags, language = entry[0]
+                result.category = category
+                result.subcategory = subcategory
+                result.confidence = confidence
+                result.auto_tags = list(auto_tags)
+                result.language = language
+                result.reasoning = "与语义相似的已分类文档一致"
+                return result
+        return None
+
+    def add(self, embedding: List[float], result: ClassificationResult):
+        """缓存分类结果，满了以后覆盖最旧的条目"""
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+
+        # 嵌入维度变化（如切换了嵌入模型）时清空缓存
+        if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+            self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+            self._entries = [None] * self.max_size
+            self._next = 0
+
+        self._vectors[self._next] = vector
+        shared = (result.category, result.subcategory, result.confidence, tuple(result.auto_tags), result.language)
+        self._entries[self._next] = (shared, time.monotonic() + self.ttl)
+        self._next = (self._next + 1) % self.max_size
+
+
 class DocumentClassifier:
     """文档自动分类器"""
 
     def __init__(self):
-        self.llm_factory = get_llm_factory()
-        
         # 预定义分类
         self.predefined_categories = {
             "tech-docs": {
@@ -71,10 +158,21 @@ class DocumentClassifier:
             }
         }
         
-        # 分类提示词模板
-        self.classification_prompt = """你是一个专业的文档分类专家。请根据以下文档内容进行智能分类。
-
-## 可选分类类别：
+        # 规则分类用的小写关键词和预编译正则，只在初始化时处理一次
+        self._category_rules: List[Tuple[str, FrozenSet[str], List[re.Pattern]]] = [
+            (
+                category_id,
+                frozenset(keyword.lower() for keyword in category_info["keywords"]),
+                [re.compile(pattern, re.IGNORECASE) for pattern in category_info["patterns"]]
+            )
+            for category_id, category_info in self.predefined_categories.items()
+        ]
+        # 所有分类的关键词去重后只在文档中各查找一次
+        self._rule_keywords = frozenset().union(*(keywords for _, keywords, _ in self._category_rules))
+        
+        # 分类提示词拆分为固定的系统提示词和只含文档信息的用户提示词，
+        # 固定前缀逐字节不变，本地推理服务可以跨请求复用其KV缓存
+        categories = """## 可选分类类别：
 1. tech-docs (技术文档) - API文档、技术规范、开发指南等
 2. research (研究报告) - 研究报告、调研分析、数据分析等  
 3. manual (操作手册) - 用户手册、操作指南、使用说明等
@@ -82,12 +180,11 @@ class DocumentClassifier:
 5. academic (学术论文) - 学术论文、期刊文章、会议论文等
 6. business (商业文档) - 商业计划、财务报告、合同等
 7. legal (法律文件) - 法律条文、合同协议、法规等
-8. other (其他) - 不属于以上类别的文档
+8. other (其他) - 不属于以上类别的文档"""
 
-## 文档信息：
-文件名: {filename}
-文件类型: {file_type}
-文档内容预览: {content_preview}
+        self.classification_system_prompt = f"""你是一个专业的文档分类专家。请根据用户提供的文档内容进行智能分类。
+
+{categories}
 
 ## 请按以下JSON格式返回分类结果：
 {{
@@ -108,6 +205,40 @@ class DocumentClassifier:
 5. summary生成简洁的文档摘要
 6. 如果无法确定分类，使用"other"并说明原因"""
 
+        self.classification_prompt = """## 文档信息：
+文件名: {filename}
+文件类型: {file_type}
+文档内容预览: {content_preview}"""
+
+        # 批量分类提示词（多个文档合并为一次LLM调用）
+        self.batch_classification_system_prompt = f"""你是一个专业的文档分类专家。请根据用户提供的多个文档的内容分别进行智能分类。
+
+{categories}
+
+## 请按以下JSON数组格式返回分类结果，每个文档一项，index为文档编号：
+[
+    {{
+        "index": 1,
+        "category": "分类ID",
+        "confidence": 0.95,
+        "reasoning": "分类理由",
+        "keywords": ["关键词1", "关键词2", "关键词3"],
+        "tags": ["标签1", "标签2", "标签3"],
+        "summary": "文档摘要（50字以内）",
+        "language": "zh"
+    }}
+]
+
+要求与单文档分类相同：confidence为0-1之间的浮点数，keywords提取3-5个关键词，tags生成2-4个描述性标签，无法确定分类时使用"other"。"""
+
+        self.batch_classification_prompt = """## 文档列表（共{count}个）：
+{documents}"""
+
+        # 并发的LLM分类请求合并为批量调用
+        self.llm_batcher = MicroBatcher(self._classify_batch_by_llm, CLASSIFY_BATCH_SIZE, CLASSIFY_BATCH_WAIT)
+        # 近似重复文档复用之前的LLM分类结果
+        self.llm_cache = SemanticClassificationCache(CLASSIFY_CACHE_SIZE, CLASSIFY_CACHE_THRESHOLD, CLASSIFY_CACHE_TTL)
+
     async def classify_document(self, document: Document) -> ClassificationResult:
         """对文档进行自动分类"""
         result = ClassificationResult()
@@ -133,6 +264,24 @@ class DocumentClassifier:
         
         return result
     
+    async def classify_documents(
+        self,
+        documents: List[Document],
+        max_concurrent: int = CLASSIFY_MAX_CONCURRENT
+    ) -> List[Any]:
+        """批量分类文档，结果（或异常）与输入顺序一致"""
+        # 并发的LLM分类请求由批处理器合并，每 CLASSIFY_BATCH_SIZE 个文档共用一次LLM调用
+        semaphore = asyncio.Semaphore(max_concurrent)
+        
+        async def classify_one(document: Document) -> ClassificationResult:
+            async with semaphore:
+                return await self.classify_document(document)
+        
+        return await asyncio.gather(
+            *(classify_one(document) for document in documents),
+            return_exceptions=True
+        )
+    
     def _classify_by_rules(self, document: Document) -> ClassificationResult:
         """基于规则的分类"""
         result = ClassificationResult()
@@ -144,18 +293,20 @@ class DocumentClassifier:
         max_score = 0
         best_category = "other"
         
+        # 先找出文档中出现的全部关键词（多个分类共有的关键词只查找一次）
+        found_keywords = {
+            keyword for keyword in self._rule_keywords
+            if keyword in content or keyword in filename
+        }
+        
         # 遍历所有预定义分类
-        for category_id, category_info in self.predefined_categories.items():
-            score = 0
-            
+        for category_id, keywords, patterns in self._category_rules:
             # 关键词匹配
-            for keyword in category_info["keywords"]:
-                if keyword.lower() in content or keyword.lower() in filename:
-                    score += 1
+            score = len(keywords & found_keywords)
             
             # 模式匹配
-            for pattern in category_info["patterns"]:
-                if re.search(pattern, content, re.IGNORECASE) or re.search(pattern, filename, re.IGNORECASE):
+            for pattern in patterns:
+                if pattern.search(content) or pattern.search(filename):
                     score += 2
             
             if score > max_score:
@@ -169,38 +320,97 @@ class DocumentClassifier:
         return result
     
     async def _classify_by_llm(self, document: Document) -> ClassificationResult:
-        """基于LLM的智能分类"""
+        """基于LLM的智能分类（先查语义缓存，未命中时经批处理器合并并发请求）"""
+        embedding = await self._preview_embedding(document) if CLASSIFY_CACHE_ENABLED else None
+        if embedding is not None:
+            cached = self.llm_cache.lookup(embedding)
+            if cached is not None:
+                logger.info(f"文档分类命中语义缓存: {document.filename}")
+                # 摘要按本文档内容生成，关键词留给规则分类结果
+                cached.summary = self.generate_summary(document.content or "")
+                return cached
+        
+        result = await self.llm_batcher.submit(document)
+        
+        # 只缓存LLM成功给出的分类
+        if embedding is not None and result.confidence > 0:
+            self.llm_cache.add(embedding, result)
+        return result
+    
+    async def _preview_embedding(self, document: Document) -> Optional[List[float]]:
+        """计算内容预览的嵌入向量，嵌入服务不可用时返回 None（不使用缓存）"""
+        preview = self._content_preview(document, CLASSIFY_PREVIEW_LENGTH)
+        if not preview.strip():
+            return None
+        try:
+            return await embedding_service.generate_embedding(preview)
+        except Exception as e:
+            logger.error(f"分类缓存嵌入生成失败: {str(e)}")
+            return None
+    
+    def _content_preview(self, document: Document, max_length: int) -> str:
+        """准备压缩后的内容预览（去掉目录引导点和多余空白以节省token）"""
+        content = document.content or ""
+        
+        # 长文档只取开头、中间、结尾三段窗口再压缩，不扫描全文
+        if len(content) > max_length * 2:
+            middle = (len(content) - max_length) // 2
+            content = " ".join((
+                content[:max_length],
+                content[middle:middle + max_length],
+                content[-max_length:]
+            ))
+        content = _PREVIEW_WS_RE.sub(' ', _PREVIEW_LEADER_RE.sub(' … ', content)).strip()
+        
+        if len(content) <= max_length:
+            return content
+        
+        # 过长时取开头、中间、结尾三段，分类信息主要集中在开头和结尾
+        part = max_length // 3
+        middle = (len(content) - part) // 2
+        return "\n...\n".join((
+            content[:part],
+            content[middle:middle + part],
+            content[-part:]
+        ))
+    
+    def _result_from_llm_data(self, classification_data: Dict[str, Any]) -> ClassificationResult:
+        """将LLM返回的分类数据转换为分类结果"""
+        result = ClassificationResult()
+        result.category = classification_data.get("category", "other")
+        result.confidence = float(classification_data.get("confidence", 0.0))
+        result.reasoning = classification_data.get("reasoning", "")
+        result.keywords = classification_data.get("keywords", [])
+        result.auto_tags = classification_data.get("tags", [])
+        result.summary = classification_data.get("summary", "")
+        result.language = classification_data.get("language", "zh")
+        return result
+    
+    async def _classify_single_by_llm(self, document: Document) -> ClassificationResult:
+        """单个文档的LLM分类"""
         result = ClassificationResult()
         
         try:
-            # 准备内容预览（限制长度以节省token）
-            content_preview = document.content[:2000] if document.content else ""
-            if len(document.content or "") > 2000:
-                content_preview += "..."
-            
             # 构建提示词
             prompt = self.classification_prompt.format(
                 filename=document.original_filename,
                 file_type=document.document_type,
-                content_preview=content_preview
+                content_preview=self._content_preview(document, CLASSIFY_PREVIEW_LENGTH)
             )
             
             # 调用LLM
-            llm_manager = await self.llm_factory.get_client()
-            response = await llm_manager.generate(prompt, max_tokens=500, temperature=0.1)
+            llm_manager = await get_llm_factory().get_client()
+            response = await llm_manager.generate(
+                prompt, max_tokens=500, temperature=0.1, system=self.classification_system_prompt
+            )
+            self._log_prompt_cache_usage(response)
             
             # 解析LLM响应
             response_text = response.get('text', '') if isinstance(response, dict) else str(response)
             classification_data = self._parse_llm_response(response_text)
             
             if classification_data:
-                result.category = classification_data.get("category", "other")
-                result.confidence = float(classification_data.get("confidence", 0.0))
-                result.reasoning = classification_data.get("reasoning", "")
-                result.keywords = classification_data.get("keywords", [])
-                result.auto_tags = classification_data.get("tags", [])
-                result.summary = classification_data.get("summary", "")
-                result.language = classification_data.get("language", "zh")
+                result = self._result_from_llm_data(classification_data)
             
         except Exception as e:
             logger.error(f"LLM分类失败: {str(e)}")
@@ -209,6 +419,65 @@ class DocumentClassifier:
         
         return result
     
+    async def _classify_batch_by_llm(self, documents: List[Document]) -> List[ClassificationResult]:
+        """多个文档合并为一次LLM调用进行分类，缺失的结果回退为单文档分类"""
+        if len(documents) == 1:
+            return [await self._classify_single_by_llm(documents[0])]
+        
+        batch_data: Dict[int, Dict[str, Any]] = {}
+        try:
+            document_sections = "\n\n".join(
+                f"### 文档 {index}\n"
+                f"文件名: {document.original_filename}\n"
+                f"文件类型: {document.document_type}\n"
+                f"文档内容预览: {self._content_preview(document, BATCH_PREVIEW_LENGTH)}"
+                for index, document in enumerate(documents, 1)
+            )
+            prompt = self.batch_classification_prompt.format(
+                count=len(documents),
+                documents=document_sections
+            )
+            
+            llm_manager = await get_llm_factory().get_client()
+            response = await llm_manager.generate(
+                prompt, max_tokens=500 * len(documents), temperature=0.1,
+                system=self.batch_classification_system_prompt
+            )
+            self._log_prompt_cache_usage(response)
+            
+            response_text = response.get('text', '') if isinstance(response, dict) else str(response)
+            for item in self._parse_llm_batch_response(response_text):
+                if isinstance(item, dict) and str(item.get("index", "")).isdigit():
+                    batch_data[int(item["index"])] = item
+                    
+        except Exception as e:
+            logger.error(f"LLM批量分类失败: {str(e)}")
+        
+        results: List[Optional[ClassificationResult]] = []
+        for index in range(1, len(documents) + 1):
+            try:
+                data = batch_data.get(index)
+                results.append(self._result_from_llm_data(data) if data else None)
+            except (TypeError, ValueError):
+                results.append(None)
+        
+        # 批量响应中缺失或无法解析的文档单独分类
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            fallback = await asyncio.gather(*(self._classify_single_by_llm(documents[i]) for i in missing))
+            for i, result in zip(missing, fallback):
+                results[i] = result
+        
+        return results
+    
+    def _log_prompt_cache_usage(self, response: Any):
+        """记录提示词前缀缓存命中的token数（服务端返回该信息时）"""
+        usage = response.get('usage') if isinstance(response, dict) else None
+        details = (usage or {}).get('prompt_tokens_details') or {}
+        cached_tokens = details.get('cached_tokens')
+        if cached_tokens:
+            logger.debug(f"分类提示词缓存命中 {cached_tokens}/{usage.get('prompt_tokens')} tokens")
+    
     def _parse_llm_response(self, response_text: str) -> Optional[Dict[str, Any]]:
         """解析LLM响应"""
         try:
@@ -222,6 +491,19 @@ class DocumentClassifier:
         
         return None
     
+    def _parse_llm_batch_response(self, response_text: str) -> List[Any]:
+        """解析LLM批量分类响应（JSON数组）"""
+        try:
+            json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
+            if json_match:
+                data = json.loads(json_match.group())
+                if isinstance(data, list):
+                    return data
+        except Exception as e:
+            logger.error(f"解析LLM批量响应失败: {str(e)}")
+        
+        return []
+    
     def _merge_classification_results(self, rule_result: ClassificationResult, llm_result: ClassificationResult) -> ClassificationResult:
         """融合规则分类和LLM分类结果"""
         result = ClassificationResult()
@@ -2,6 +2,8 @@
 文档处理服务
 """
 import os
+import re
+import asyncio
 import hashlib
 import mimetypes
 import json
@@ -12,18 +14,32 @@ import uuid
 
 from loguru import logger
 import chardet
-from PyPDF2 import PdfReader
 import pdfplumber
 from docx import Document as DocxDocument
 import markdown
 
 from app.core.config import get_settings
+from app.services.pdf_extract import extract_pdf_pages_text, get_pdf_executor, pdf_pages_text
 from app.models.document import (
     Document, DocumentType, DocumentStatus, DocumentMetadata,
     DocumentChunk
 )
 
 
+# 上传文件流式写入的块大小
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB
+# 文件哈希算法（与已存储的 file_hash 保持一致，更换算法需要回填已有记录）
+FILE_HASH_ALGORITHM = "md5"
+# 内容预览长度
+CONTENT_PREVIEW_LENGTH = 500
+
+# 页数达到该值时才用进程池并行提取PDF文本（页数少时进程开销大于收益）
+PDF_PARALLEL_MIN_PAGES = 8
+
+# 预编译正则
+_WHITESPACE_RE = re.compile(r'\s+')
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+
 class DocumentProcessor:
     """文档处理器"""
     
@@ -33,12 +49,9 @@ class DocumentProcessor:
         self.upload_dir.mkdir(parents=True, exist_ok=True)
     
     def get_file_hash(self, file_path: Path) -> str:
-        """计算文件哈希值"""
-        hash_md5 = hashlib.md5()
+        """计算已保存文件的哈希值（上传时的哈希在流式写入中完成）"""
         with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+            return hashlib.file_digest(f, FILE_HASH_ALGORITHM).hexdigest()
     
     def detect_document_type(self, filename: str, mime_type: str) -> DocumentType:
         """检测文档类型"""
@@ -59,8 +72,8 @@ class DocumentProcessor:
         else:
             return DocumentType.OTHER
     
-    def validate_file(self, filename: str, file_size: int) -> Tuple[bool, str]:
-        """验证文件"""
+    def validate_file(self, filename: str, file_size: Optional[int] = None) -> Tuple[bool, str]:
+        """验证文件（file_size为None时跳过大小检查，由流式保存时校验）"""
         # 检查文件扩展名
         ext = Path(filename).suffix.lower().lstrip('.')
         if ext not in self.settings.ALLOWED_EXTENSIONS:
@@ -75,7 +88,7 @@ class DocumentProcessor:
                 return False, f"暂不支持{ext.upper()}格式文件。支持的格式：PDF、DOCX、TXT、Markdown"
 
         # 检查文件大小
-        if file_size > self.settings.MAX_FILE_SIZE:
+        if file_size is not None and file_size > self.settings.MAX_FILE_SIZE:
             max_size_mb = self.settings.MAX_FILE_SIZE / (1024 * 1024)
             return False, f"文件大小超过限制: {max_size_mb}MB"
 
@@ -83,62 +96,85 @@ class DocumentProcessor:
     
     async def save_uploaded_file(
         self, 
-        file_content: bytes, 
+        upload_file, 
         original_filename: str
-    ) -> Tuple[str, str, str]:
-        """保存上传的文件"""
+    ) -> Tuple[str, str, str, int, str]:
+        """流式保存上传的文件，写入的同时计算哈希和大小
+
+        Args:
+            upload_file: 支持 ``await read(size)`` 的文件对象（如 UploadFile）
+            original_filename: 原始文件名
+
+        Returns:
+            (file_id, file_path, mime_type, file_size, file_hash)
+
+        Raises:
+            ValueError: 文件大小超过限制
+        """
         # 生成唯一文件名
         file_id = str(uuid.uuid4())
         ext = Path(original_filename).suffix
         filename = f"{file_id}{ext}"
         file_path = self.upload_dir / filename
         
-        # 保存文件
-        with open(file_path, "wb") as f:
-            f.write(file_content)
+        # 分块写入文件，同时更新哈希，内存占用与文件大小无关
+        max_size = self.settings.MAX_FILE_SIZE
+        hasher = hashlib.new(FILE_HASH_ALGORITHM)
+        file_size = 0
+
+        def write_chunk(f, chunk: bytes):
+            hasher.update(chunk)
+            f.write(chunk)
+
+        # 磁盘写入和哈希计算放到线程池，避免阻塞事件循环
+        f = await asyncio.to_thread(open, file_path, "wb")
+        try:
+            while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE):
+                file_size += len(chunk)
+                if file_size > max_size:
+                    max_size_mb = max_size / (1024 * 1024)
+                    raise ValueError(f"文件大小超过限制: {max_size_mb}MB")
+                await asyncio.to_thread(write_chunk, f, chunk)
+            await asyncio.to_thread(f.close)
+        except BaseException:
+            # 清理写入了一半的文件
+            f.close()
+            file_path.unlink(missing_ok=True)
+            raise
         
         # 获取MIME类型
         mime_type, _ = mimetypes.guess_type(str(file_path))
         if not mime_type:
             mime_type = "application/octet-stream"
         
-        logger.info(f"文件已保存: {filename} ({len(file_content)} bytes)")
-        return file_id, str(file_path), mime_type
+        logger.info(f"文件已保存: {filename} ({file_size} bytes)")
+        return file_id, str(file_path), mime_type, file_size, hasher.hexdigest()
     
-    def extract_text_from_pdf(self, file_path: Path) -> Tuple[str, DocumentMetadata]:
-        """从PDF提取文本和元数据"""
-        text_content = ""
-        metadata = DocumentMetadata()
-        
+    async def extract_text_from_pdf(self, file_path: Path) -> Tuple[str, DocumentMetadata]:
+        """从PDF提取文本和元数据（解析在线程或进程池中进行，不阻塞事件循环）"""
         try:
-            # 使用pdfplumber提取文本（更好的文本提取）
-            with pdfplumber.open(file_path) as pdf:
-                metadata.page_count = len(pdf.pages)
-                
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text_content += page_text + "\n"
+            text_content, metadata = await asyncio.to_thread(self._read_pdf, file_path)
             
-            # 使用PyPDF2提取元数据
-            with open(file_path, 'rb') as file:
-                pdf_reader = PdfReader(file)
-                if pdf_reader.metadata:
-                    metadata.title = pdf_reader.metadata.get('/Title')
-                    metadata.author = pdf_reader.metadata.get('/Author')
-                    metadata.subject = pdf_reader.metadata.get('/Subject')
-                    metadata.creator = pdf_reader.metadata.get('/Creator')
-                    metadata.producer = pdf_reader.metadata.get('/Producer')
-                    
-                    # 处理日期
-                    creation_date = pdf_reader.metadata.get('/CreationDate')
-                    if creation_date:
-                        try:
-                            # PDF日期格式通常是 D:YYYYMMDDHHmmSSOHH'mm'
-                            date_str = str(creation_date).replace("D:", "")[:14]
-                            metadata.creation_date = datetime.strptime(date_str, "%Y%m%d%H%M%S")
-                        except:
-                            pass
+            # 页数较多时按页范围分给进程池并行提取，按顺序拼接
+            if text_content is None:
+                executor = get_pdf_executor()
+                if executor is None:
+                    # 进程池未启用（如在Celery worker中）时在线程中提取全部页面
+                    text_content = await asyncio.to_thread(
+                        extract_pdf_pages_text, str(file_path), 0, metadata.page_count
+                    )
+                else:
+                    loop = asyncio.get_running_loop()
+                    workers = self.settings.PDF_EXTRACT_WORKERS
+                    step = (metadata.page_count + workers - 1) // workers
+                    parts = await asyncio.gather(*(
+                        loop.run_in_executor(
+                            executor, extract_pdf_pages_text,
+                            str(file_path), start, min(start + step, metadata.page_count)
+                        )
+                        for start in range(0, metadata.page_count, step)
+                    ))
+                    text_content = "".join(parts)
             
         except Exception as e:
             logger.error(f"PDF文本提取失败: {str(e)}")
@@ -146,6 +182,40 @@ class DocumentProcessor:
         
         return text_content.strip(), metadata
     
+    def _read_pdf(self, file_path: Path) -> Tuple[Optional[str], DocumentMetadata]:
+        """读取PDF元数据，页数较少时同时提取文本（页数较多时文本返回 None，交给进程池提取）"""
+        text_content = None
+        metadata = DocumentMetadata()
+        
+        # 使用pdfplumber提取文本（更好的文本提取）
+        with pdfplumber.open(file_path) as pdf:
+            metadata.page_count = len(pdf.pages)
+            
+            # 页数较少时直接逐页提取
+            if metadata.page_count < PDF_PARALLEL_MIN_PAGES:
+                text_content = pdf_pages_text(pdf.pages)
+            
+            # 元数据直接取自同一个解析器的文档信息字典，不再重新打开和解析文件
+            pdf_info = pdf.metadata
+            if pdf_info:
+                metadata.title = pdf_info.get('Title')
+                metadata.author = pdf_info.get('Author')
+                metadata.subject = pdf_info.get('Subject')
+                metadata.creator = pdf_info.get('Creator')
+                metadata.producer = pdf_info.get('Producer')
+                
+                # 处理日期
+                creation_date = pdf_info.get('CreationDate')
+                if creation_date:
+                    try:
+                        # PDF日期格式通常是 D:YYYYMMDDHHmmSSOHH'mm'
+                        date_str = str(creation_date).replace("D:", "")[:14]
+                        metadata.creation_date = datetime.strptime(date_str, "%Y%m%d%H%M%S")
+                    except:
+                        pass
+        
+        return text_content, metadata
+    
     def extract_text_from_docx(self, file_path: Path) -> Tuple[str, DocumentMetadata]:
         """从DOCX提取文本和元数据"""
         text_content = ""
@@ -247,8 +317,7 @@ class DocumentProcessor:
             # 转换为HTML然后提取纯文本
             html = markdown.markdown(md_content)
             # 简单的HTML标签移除（可以使用BeautifulSoup做更好的处理）
-            import re
-            text_content = re.sub(r'<[^>]+>', '', html)
+            text_content = _HTML_TAG_RE.sub('', html)
             
             # 基本统计
             metadata.word_count = len(text_content.split())
@@ -266,7 +335,7 @@ class DocumentProcessor:
     ) -> Tuple[str, DocumentMetadata]:
         """根据文档类型提取文本和元数据"""
         if document_type == DocumentType.PDF:
-            return self.extract_text_from_pdf(file_path)
+            return await self.extract_text_from_pdf(file_path)
         elif document_type == DocumentType.DOCX:
             return self.extract_text_from_docx(file_path)
         elif document_type == DocumentType.DOC:
@@ -283,7 +352,28 @@ class DocumentProcessor:
         else:
             raise Exception(f"未知的文档类型: {document_type}。支持的格式：PDF、DOCX、TXT、Markdown")
     
-    def create_content_preview(self, content: str, max_length: int = 500) -> str:
+    async def extract_clean_and_preview(
+        self,
+        file_path: Path,
+        document_type: DocumentType,
+        max_preview_length: int = CONTENT_PREVIEW_LENGTH
+    ) -> Tuple[str, str, DocumentMetadata]:
+        """提取文本并一次性完成清理和预览生成
+
+        原始文本只在清理时遍历一次，之后即被释放；预览直接从清理结果切片得到。
+
+        Returns:
+            (清理后的文本, 内容预览, 元数据)
+        """
+        content, metadata = await self.extract_text_and_metadata(file_path, document_type)
+        content = _WHITESPACE_RE.sub(' ', content).strip()
+        if len(content) > max_preview_length:
+            preview = content[:max_preview_length] + "..."
+        else:
+            preview = content
+        return content, preview, metadata
+    
+    def create_content_preview(self, content: str, max_length: int = CONTENT_PREVIEW_LENGTH) -> str:
         """创建内容预览"""
         if len(content) <= max_length:
             return content
@@ -292,8 +382,7 @@ class DocumentProcessor:
     def clean_text(self, text: str) -> str:
         """清理文本"""
         # 移除多余的空白字符
-        import re
-        text = re.sub(r'\s+', ' ', text)
+        text = _WHITESPACE_RE.sub(' ', text)
         text = text.strip()
         return text
 
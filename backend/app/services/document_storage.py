@@ -1,22 +1,43 @@
 """
 文档存储管理器
 """
-import json
+import orjson
+import time
 import sqlite3
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, AsyncIterator
 from datetime import datetime
 import uuid
 
 from loguru import logger
 
 from app.core.config import get_settings
-from app.models.document import Document, DocumentStatus, DocumentType, DocumentChunk
+from app.models.document import Document, DocumentStatus, DocumentType, DocumentChunk, ChunkRecord, ChunkMetadata
+
+
+# 未分类文档的分类名（旧数据中的空分类按此处理）
+UNCATEGORIZED = "未分类"
+
+# 可被相同内容的上传复用的文档状态（失败或已删除的文档允许重新上传）
+REUSABLE_HASH_STATUSES = (DocumentStatus.UPLOADING, DocumentStatus.PROCESSING, DocumentStatus.PROCESSED)
+_REUSABLE_HASH_FILTER = f"status IN ({','.join('?' * len(REUSABLE_HASH_STATUSES))})"
+_FIND_BY_HASH_SQL = (
+    f"SELECT * FROM documents WHERE file_hash = ? AND {_REUSABLE_HASH_FILTER} ORDER BY created_at LIMIT 1"
+)
 
 
 class DocumentStorage:
     """文档存储管理器 - 使用SQLite作为元数据存储"""
     
+    # 流式读取时每批查询的行数，以及单次流式读取的最大行数
+    STREAM_FETCH_SIZE = 100
+    STREAM_MAX_PAGE_SIZE = 10000
+    
+    # get_document 短时缓存（所有实例共享）: document_id -> (写入时间, 文档)
+    DOCUMENT_CACHE_TTL = 2  # 秒
+    DOCUMENT_CACHE_MAX_SIZE = 2048
+    _document_cache: Dict[str, tuple] = {}
+    
     def __init__(self):
         self.settings = get_settings()
         self.db_path = Path(self.settings.UPLOAD_DIR).parent / "documents.db"
@@ -69,12 +90,23 @@ class DocumentStorage:
             conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(status)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_type ON documents(document_type)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_created ON documents(created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents(file_hash)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_document ON document_chunks(document_id)")
             
             conn.commit()
         
         logger.info(f"文档数据库已初始化: {self.db_path}")
     
+    def _cache_document(self, document: Document):
+        """写入文档短时缓存"""
+        if len(self._document_cache) >= self.DOCUMENT_CACHE_MAX_SIZE:
+            self._document_cache.clear()
+        self._document_cache[document.id] = (time.monotonic(), document)
+    
+    def _invalidate_document(self, document_id: str):
+        """文档写入或删除后使缓存失效"""
+        self._document_cache.pop(document_id, None)
+    
     def _dict_factory(self, cursor, row):
         """SQLite行工厂函数"""
         d = {}
@@ -86,9 +118,13 @@ class DocumentStorage:
         """从字典创建Document对象"""
         # 解析JSON字段
         if data.get('metadata'):
-            data['metadata'] = json.loads(data['metadata'])
+            data['metadata'] = orjson.loads(data['metadata'])
         if data.get('processing_info'):
-            data['processing_info'] = json.loads(data['processing_info'])
+            data['processing_info'] = orjson.loads(data['processing_info'])
+        
+        # 旧数据中的空分类使用模型默认值
+        if not data.get('category'):
+            data.pop('category', None)
         
         # 转换时间戳
         for field in ['created_at', 'updated_at', 'processed_at']:
@@ -97,36 +133,43 @@ class DocumentStorage:
         
         return Document(**data)
     
+    _UPSERT_DOCUMENT_SQL = """
+        INSERT OR REPLACE INTO documents (
+            id, filename, original_filename, file_path, file_size, file_hash,
+            document_type, mime_type, status, content, content_preview,
+            metadata, processing_info, error_message, is_vectorized,
+            vector_collection, chunk_count, created_at, updated_at, processed_at,
+            category, subcategory, auto_tags, manual_tags, classification_confidence,
+            classification_method, keywords, summary, language, classification_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    def _document_params(self, document: Document) -> tuple:
+        """将Document转换为写入参数"""
+        return (
+            document.id, document.filename, document.original_filename,
+            document.file_path, document.file_size, document.file_hash,
+            document.document_type, document.mime_type, document.status,
+            document.content, document.content_preview,
+            document.metadata.model_dump_json(),
+            orjson.dumps(document.processing_info, default=str).decode(),
+            document.error_message, document.is_vectorized,
+            document.vector_collection, document.chunk_count,
+            document.created_at.isoformat(), document.updated_at.isoformat(),
+            document.processed_at.isoformat() if document.processed_at else None,
+            document.category, document.subcategory, document.auto_tags, document.manual_tags,
+            document.classification_confidence, document.classification_method,
+            document.keywords, document.summary, document.language,
+            document.classification_at.isoformat() if document.classification_at else None
+        )
+
     async def save_document(self, document: Document) -> bool:
         """保存文档"""
         try:
             with sqlite3.connect(self.db_path) as conn:
-                conn.execute("""
-                    INSERT OR REPLACE INTO documents (
-                        id, filename, original_filename, file_path, file_size, file_hash,
-                        document_type, mime_type, status, content, content_preview,
-                        metadata, processing_info, error_message, is_vectorized,
-                        vector_collection, chunk_count, created_at, updated_at, processed_at,
-                        category, subcategory, auto_tags, manual_tags, classification_confidence,
-                        classification_method, keywords, summary, language, classification_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    document.id, document.filename, document.original_filename,
-                    document.file_path, document.file_size, document.file_hash,
-                    document.document_type, document.mime_type, document.status,
-                    document.content, document.content_preview,
-                    json.dumps(document.metadata.model_dump(), default=str),
-                    json.dumps(document.processing_info, default=str),
-                    document.error_message, document.is_vectorized,
-                    document.vector_collection, document.chunk_count,
-                    document.created_at.isoformat(), document.updated_at.isoformat(),
-                    document.processed_at.isoformat() if document.processed_at else None,
-                    document.category, document.subcategory, document.auto_tags, document.manual_tags,
-                    document.classification_confidence, document.classification_method,
-                    document.keywords, document.summary, document.language,
-                    document.classification_at.isoformat() if document.classification_at else None
-                ))
+                conn.execute(self._UPSERT_DOCUMENT_SQL, self._document_params(document))
                 conn.commit()
+            self._invalidate_document(document.id)
             
             logger.info(f"文档已保存: {document.id}")
             return True
@@ -134,9 +177,85 @@ class DocumentStorage:
         except Exception as e:
             logger.error(f"保存文档失败: {str(e)}")
             return False
+
+    async def insert_document_if_new(self, document: Document) -> Optional[str]:
+        """内容相同的可复用文档不存在时插入新文档，返回最终使用的文档ID（失败返回 None）
+        
+        查重和插入在同一个写事务中完成，多个进程同时上传相同文件时只会插入一份
+        """
+        try:
+            with sqlite3.connect(self.db_path, isolation_level=None) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = conn.execute(
+                        f"SELECT id FROM documents WHERE file_hash = ? AND {_REUSABLE_HASH_FILTER} "
+                        "ORDER BY created_at LIMIT 1",
+                        (document.file_hash, *REUSABLE_HASH_STATUSES)
+                    ).fetchone()
+                    if row:
+                        conn.execute("ROLLBACK")
+                        return row[0]
+                    conn.execute(self._UPSERT_DOCUMENT_SQL, self._document_params(document))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            self._invalidate_document(document.id)
+            
+            logger.info(f"文档已保存: {document.id}")
+            return document.id
+            
+        except Exception as e:
+            logger.error(f"保存文档失败: {str(e)}")
+            return None
+
+    async def update_classifications_bulk(self, documents: List[Document]) -> bool:
+        """批量更新文档的分类字段（单个事务）
+        
+        只更新分类相关的列，分类期间被修改的其他字段不会被覆盖，已删除的文档也不会被重新插入
+        """
+        if not documents:
+            return True
+
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.executemany(
+                    """
+                    UPDATE documents SET
+                        category = ?, subcategory = ?, classification_confidence = ?,
+                        classification_method = ?, classification_at = ?,
+                        auto_tags = ?, keywords = ?, summary = ?, language = ?
+                    WHERE id = ?
+                    """,
+                    [
+                        (
+                            document.category, document.subcategory, document.classification_confidence,
+                            document.classification_method,
+                            document.classification_at.isoformat() if document.classification_at else None,
+                            document.auto_tags, document.keywords, document.summary, document.language,
+                            document.id
+                        )
+                        for document in documents
+                    ]
+                )
+                conn.commit()
+            for document in documents:
+                self._invalidate_document(document.id)
+
+            logger.info(f"已批量更新 {len(documents)} 个文档的分类")
+            return True
+
+        except Exception as e:
+            logger.error(f"批量更新文档分类失败: {str(e)}")
+            return False
     
     async def get_document(self, document_id: str) -> Optional[Document]:
         """获取文档"""
+        cached = self._document_cache.get(document_id)
+        if cached and time.monotonic() - cached[0] < self.DOCUMENT_CACHE_TTL:
+            # 返回深拷贝，调用方修改字段或嵌套的元数据都不会影响缓存
+            return cached[1].model_copy(deep=True)
+        
         try:
             with sqlite3.connect(self.db_path) as conn:
                 conn.row_factory = self._dict_factory
@@ -144,20 +263,91 @@ class DocumentStorage:
                 row = cursor.fetchone()
                 
                 if row:
-                    return self._document_from_dict(row)
+                    document = self._document_from_dict(row)
+                    self._cache_document(document)
+                    return document.model_copy(deep=True)
                 return None
                 
         except Exception as e:
             logger.error(f"获取文档失败: {str(e)}")
             return None
     
+    async def find_by_hash(self, file_hash: str) -> Optional[Document]:
+        """按文件哈希查找可复用的已有文档"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.row_factory = self._dict_factory
+                cursor = conn.execute(_FIND_BY_HASH_SQL, (file_hash, *REUSABLE_HASH_STATUSES))
+                row = cursor.fetchone()
+                
+                if row:
+                    return self._document_from_dict(row)
+                return None
+                
+        except Exception as e:
+            logger.error(f"按哈希查找文档失败: {str(e)}")
+            return None
+    
+    async def get_documents(self, document_ids: List[str]) -> Dict[str, Document]:
+        """批量获取文档，返回 id -> 文档 的映射"""
+        if not document_ids:
+            return {}
+        try:
+            ids = list(dict.fromkeys(document_ids))
+            placeholders = ",".join("?" * len(ids))
+            with sqlite3.connect(self.db_path) as conn:
+                conn.row_factory = self._dict_factory
+                cursor = conn.execute(
+                    f"SELECT * FROM documents WHERE id IN ({placeholders})", ids
+                )
+                return {row["id"]: self._document_from_dict(row) for row in cursor.fetchall()}
+
+        except Exception as e:
+            logger.error(f"批量获取文档失败: {str(e)}")
+            return {}
+    
+    def _build_list_filters(
+        self,
+        status: Optional[DocumentStatus] = None,
+        document_type: Optional[DocumentType] = None,
+        search_query: Optional[str] = None,
+        category: Optional[str] = None
+    ) -> Tuple[str, list]:
+        """构建文档列表查询的WHERE子句和参数"""
+        conditions = []
+        params = []
+        
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+
+        if document_type:
+            conditions.append("document_type = ?")
+            params.append(document_type)
+
+        if category == UNCATEGORIZED:
+            # 与分类统计一致：空分类的旧数据也算作未分类
+            conditions.append("(category = ? OR category IS NULL OR category = '')")
+            params.append(category)
+        elif category:
+            conditions.append("category = ?")
+            params.append(category)
+        
+        if search_query:
+            conditions.append("(original_filename LIKE ? OR content LIKE ?)")
+            params.extend([f"%{search_query}%", f"%{search_query}%"])
+        
+        where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where_clause, params
+    
     async def list_documents(
         self,
         page: int = 1,
         page_size: int = 20,
         status: Optional[DocumentStatus] = None,
         document_type: Optional[DocumentType] = None,
-        search_query: Optional[str] = None
+        search_query: Optional[str] = None,
+        category: Optional[str] = None
     ) -> tuple[List[Document], int]:
         """列出文档"""
         try:
@@ -165,22 +355,7 @@ class DocumentStorage:
                 conn.row_factory = self._dict_factory
                 
                 # 构建查询条件
-                conditions = []
-                params = []
-                
-                if status:
-                    conditions.append("status = ?")
-                    params.append(status)
-
-                if document_type:
-                    conditions.append("document_type = ?")
-                    params.append(document_type)
-                
-                if search_query:
-                    conditions.append("(original_filename LIKE ? OR content LIKE ?)")
-                    params.extend([f"%{search_query}%", f"%{search_query}%"])
-                
-                where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
+                where_clause, params = self._build_list_filters(status, document_type, search_query, category)
                 
                 # 获取总数
                 count_query = f"SELECT COUNT(*) as total FROM documents{where_clause}"
@@ -204,6 +379,71 @@ class DocumentStorage:
             logger.error(f"列出文档失败: {str(e)}")
             return [], 0
     
+    async def iter_documents(
+        self,
+        page: int = 1,
+        page_size: Optional[int] = None,
+        status: Optional[DocumentStatus] = None,
+        document_type: Optional[DocumentType] = None,
+        search_query: Optional[str] = None,
+        category: Optional[str] = None
+    ) -> AsyncIterator[Document]:
+        """逐行迭代文档，不一次性加载整个结果集
+        
+        按 (created_at, id) 键集分批查询，每批读完即关闭连接，向慢速客户端输出时不长期占用读事务
+        """
+        page_size = min(page_size or self.STREAM_MAX_PAGE_SIZE, self.STREAM_MAX_PAGE_SIZE)
+        where_clause, params = self._build_list_filters(status, document_type, search_query, category)
+        keyset_clause = (" AND " if where_clause else " WHERE ") + "(created_at < ? OR (created_at = ? AND id < ?))"
+        
+        remaining = page_size
+        offset = (page - 1) * page_size
+        last_key = None
+        while remaining > 0:
+            limit = min(self.STREAM_FETCH_SIZE, remaining)
+            if last_key is None:
+                # 第一批按页码偏移定位，之后从上一批最后一行继续
+                query = f"SELECT * FROM documents{where_clause} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?"
+                query_params = params + [limit, offset]
+            else:
+                query = f"SELECT * FROM documents{where_clause}{keyset_clause} ORDER BY created_at DESC, id DESC LIMIT ?"
+                query_params = params + [last_key[0], last_key[0], last_key[1], limit]
+            
+            with sqlite3.connect(self.db_path) as conn:
+                conn.row_factory = self._dict_factory
+                rows = conn.execute(query, query_params).fetchall()
+            
+            for row in rows:
+                last_key = (row['created_at'], row['id'])
+                yield self._document_from_dict(row)
+            if len(rows) < limit:
+                break
+            remaining -= len(rows)
+    
+    async def get_category_stats(self) -> List[Dict[str, Any]]:
+        """按分类聚合文档统计（数据库侧GROUP BY）"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.row_factory = self._dict_factory
+                cursor = conn.execute("""
+                    SELECT COALESCE(NULLIF(category, ''), ?) AS category,
+                           COUNT(*) AS count,
+                           COALESCE(SUM(file_size), 0) AS total_size,
+                           MAX(updated_at) AS latest_update
+                    FROM documents
+                    GROUP BY 1
+                """, (UNCATEGORIZED,))
+                rows = cursor.fetchall()
+
+            for row in rows:
+                if row['latest_update']:
+                    row['latest_update'] = datetime.fromisoformat(row['latest_update'])
+            return rows
+
+        except Exception as e:
+            logger.error(f"获取分类统计失败: {str(e)}")
+            return []
+    
     async def update_document_status(
         self, 
         document_id: str, 
@@ -229,6 +469,7 @@ class DocumentStorage:
                 query = f"UPDATE documents SET {', '.join(update_fields)} WHERE id = ?"
                 conn.execute(query, params)
                 conn.commit()
+            self._invalidate_document(document_id)
             
             logger.info(f"文档状态已更新: {document_id} -> {status}")
             return True
@@ -262,6 +503,7 @@ class DocumentStorage:
                 query = f"UPDATE documents SET {', '.join(update_fields)} WHERE id = ?"
                 conn.execute(query, params)
                 conn.commit()
+            self._invalidate_document(document.id)
 
             logger.info(f"文档信息已更新: {document.id}")
             return True
@@ -279,6 +521,7 @@ class DocumentStorage:
                 # 删除文档
                 conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
                 conn.commit()
+            self._invalidate_document(document_id)
             
             logger.info(f"文档已删除: {document_id}")
             return True
@@ -287,22 +530,36 @@ class DocumentStorage:
             logger.error(f"删除文档失败: {str(e)}")
             return False
     
-    async def save_document_chunks(self, chunks: List[DocumentChunk]) -> bool:
+    async def save_document_chunks(self, chunks: List[ChunkRecord]) -> bool:
         """保存文档块"""
         try:
+            # 同一文档的块通常共享同一个元数据对象和创建时间，只序列化一次
+            metadata_json: Dict[int, str] = {}
+            created_at_iso: Dict[int, str] = {}
+            rows = []
+            for chunk in chunks:
+                serialized = metadata_json.get(id(chunk.metadata))
+                if serialized is None:
+                    serialized = chunk.metadata.model_dump_json()
+                    metadata_json[id(chunk.metadata)] = serialized
+                created_at = created_at_iso.get(id(chunk.created_at))
+                if created_at is None:
+                    created_at = chunk.created_at.isoformat()
+                    created_at_iso[id(chunk.created_at)] = created_at
+                rows.append((
+                    chunk.chunk_id, chunk.document_id, chunk.content,
+                    chunk.chunk_index, chunk.start_char, chunk.end_char,
+                    serialized, created_at
+                ))
+            
+            # 单个事务内批量写入
             with sqlite3.connect(self.db_path) as conn:
-                for chunk in chunks:
-                    conn.execute("""
-                        INSERT OR REPLACE INTO document_chunks (
-                            chunk_id, document_id, content, chunk_index,
-                            start_char, end_char, metadata, created_at
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        chunk.chunk_id, chunk.document_id, chunk.content,
-                        chunk.chunk_index, chunk.start_char, chunk.end_char,
-                        json.dumps(chunk.metadata, default=str),
-                        chunk.created_at.isoformat()
-                    ))
+                conn.executemany("""
+                    INSERT OR REPLACE INTO document_chunks (
+                        chunk_id, document_id, content, chunk_index,
+                        start_char, end_char, metadata, created_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, rows)
                 conn.commit()
             
             logger.info(f"已保存 {len(chunks)} 个文档块")
@@ -326,8 +583,8 @@ class DocumentStorage:
                 
                 chunks = []
                 for row in rows:
-                    if row.get('metadata'):
-                        row['metadata'] = json.loads(row['metadata'])
+                    # 元数据JSON直接校验为模型，不经过中间字典
+                    row['metadata'] = ChunkMetadata.model_validate_json(row['metadata'] or '{}')
                     if row.get('created_at'):
                         row['created_at'] = datetime.fromisoformat(row['created_at'])
                     chunks.append(DocumentChunk(**row))
@@ -2,17 +2,30 @@
 嵌入服务 - 集成Ollama嵌入模型
 """
 import asyncio
+import hashlib
 import aiohttp
 import json
-from typing import List, Optional, Dict, Any
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Dict, Any
 from loguru import logger
 
 from app.core.config import get_settings
+from app.core.micro_batcher import MicroBatcher
 
 
 class EmbeddingService:
     """嵌入向量生成服务"""
 
+    # 查询嵌入LRU缓存容量
+    QUERY_EMBEDDING_CACHE_SIZE = 1024
+    # 单次嵌入请求合并的最大文本数和等待凑批时间（秒）
+    EMBEDDING_BATCH_SIZE = 32
+    EMBEDDING_BATCH_WAIT = 0.01
+    # 单次嵌入请求的文本总字符数上限，避免长分块凑满一批时请求体过大
+    EMBEDDING_BATCH_MAX_CHARS = 256_000
+    # 同时进行中的嵌入请求上限
+    EMBEDDING_MAX_CONCURRENT = 3
+
     def __init__(self):
         """初始化嵌入服务"""
         self.settings = get_settings()
@@ -28,6 +41,12 @@ class EmbeddingService:
 
         self.max_chunk_size = 8192  # 最大文本长度
         self._model_loaded = False
+        self._query_embedding_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        # 并发的单条嵌入请求合并为一次多输入请求
+        self._embedding_batcher = MicroBatcher(
+            self._generate_embeddings_multi, self.EMBEDDING_BATCH_SIZE, self.EMBEDDING_BATCH_WAIT,
+            max_batch_weight=self.EMBEDDING_BATCH_MAX_CHARS, weight=len
+        )
 
         logger.info(f"Embedding服务初始化: 提供者={self.provider}, 模型={self.embedding_model}")
     
@@ -121,10 +140,108 @@ class EmbeddingService:
             text = text[:self.max_chunk_size]
             logger.warning(f"文本过长，已截断到 {self.max_chunk_size} 字符")
 
-        if self.provider == "lm_studio":
-            return await self._generate_embedding_lm_studio(text)
-        else:
-            return await self._generate_embedding_ollama(text)
+        return await self._embedding_batcher.submit(text)
+
+    async def _generate_embeddings_multi(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """一次请求生成多个文本的嵌入向量，批量接口不可用时逐条生成"""
+        if len(texts) > 1:
+            if self.provider == "lm_studio":
+                embeddings = await self._generate_embeddings_lm_studio_multi(texts)
+            else:
+                embeddings = await self._generate_embeddings_ollama_multi(texts)
+            if embeddings is not None:
+                return embeddings
+
+        semaphore = asyncio.Semaphore(self.EMBEDDING_MAX_CONCURRENT)
+        generate_single = (
+            self._generate_embedding_lm_studio if self.provider == "lm_studio"
+            else self._generate_embedding_ollama
+        )
+
+        async def generate_with_semaphore(text: str) -> Optional[List[float]]:
+            async with semaphore:
+                return await generate_single(text)
+
+        return list(await asyncio.gather(*(generate_with_semaphore(text) for text in texts)))
+
+    async def _generate_embeddings_lm_studio_multi(self, texts: List[str]) -> Optional[List[Optional[List[float]]]]:
+        """使用LM Studio一次生成多个嵌入向量"""
+        try:
+            async with aiohttp.ClientSession() as session:
+                embed_data = {
+                    "model": self.embedding_model,
+                    "input": texts
+                }
+
+                async with session.post(
+                    f"{self.lm_studio_base_url}/v1/embeddings",
+                    json=embed_data,
+                    timeout=aiohttp.ClientTimeout(total=60)
+                ) as response:
+                    if response.status != 200:
+                        error_text = await response.text()
+                        logger.warning(f"LM Studio批量嵌入失败，改为逐条生成: {response.status}, {error_text}")
+                        return None
+
+                    result = await response.json()
+                    data = result.get("data", [])
+                    if len(data) != len(texts):
+                        logger.warning(f"LM Studio批量嵌入返回数量不符: {len(data)}/{len(texts)}")
+                        return None
+
+                    data = sorted(data, key=lambda item: item.get("index", 0))
+                    logger.debug(f"LM Studio批量生成 {len(texts)} 个嵌入向量")
+                    return [item.get("embedding") or None for item in data]
+        except Exception as e:
+            logger.warning(f"LM Studio批量嵌入异常，改为逐条生成: {str(e)}")
+            return None
+
+    async def _generate_embeddings_ollama_multi(self, texts: List[str]) -> Optional[List[Optional[List[float]]]]:
+        """使用Ollama批量接口（/api/embed）一次生成多个嵌入向量"""
+        try:
+            async with aiohttp.ClientSession() as session:
+                embed_data = {
+                    "model": self.embedding_model,
+                    "input": texts
+                }
+
+                async with session.post(
+                    f"{self.ollama_base_url}/api/embed",
+                    json=embed_data,
+                    timeout=aiohttp.ClientTimeout(total=60)
+                ) as response:
+                    if response.status != 200:
+                        error_text = await response.text()
+                        logger.warning(f"Ollama批量嵌入失败，改为逐条生成: {response.status}, {error_text}")
+                        return None
+
+                    result = await response.json()
+                    embeddings = result.get("embeddings", [])
+                    if len(embeddings) != len(texts):
+                        logger.warning(f"Ollama批量嵌入返回数量不符: {len(embeddings)}/{len(texts)}")
+                        return None
+
+                    logger.debug(f"Ollama批量生成 {len(texts)} 个嵌入向量")
+                    return [embedding or None for embedding in embeddings]
+        except Exception as e:
+            logger.warning(f"Ollama批量嵌入异常，改为逐条生成: {str(e)}")
+            return None
+
+    async def generate_query_embedding(self, query: str) -> Optional[List[float]]:
+        """生成查询的嵌入向量（LRU缓存，重复查询不再调用嵌入模型）"""
+        cache_key = hashlib.sha256(f"{self.embedding_model}\0{query}".encode("utf-8")).hexdigest()
+        
+        cached = self._query_embedding_cache.get(cache_key)
+        if cached is not None:
+            self._query_embedding_cache.move_to_end(cache_key)
+            return cached
+        
+        embedding = await self.generate_embedding(query)
+        if embedding:
+            self._query_embedding_cache[cache_key] = embedding
+            if len(self._query_embedding_cache) > self.QUERY_EMBEDDING_CACHE_SIZE:
+                self._query_embedding_cache.popitem(last=False)
+        return embedding
 
     async def _generate_embedding_lm_studio(self, text: str) -> Optional[List[float]]:
         """使用LM Studio生成嵌入向量"""
@@ -189,21 +306,32 @@ class EmbeddingService:
             logger.error(f"Ollama生成嵌入向量异常: {str(e)}")
             return None
     
-    async def generate_embeddings_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
-        """批量生成嵌入向量"""
-        if not texts:
-            return []
-        
-        logger.info(f"开始批量生成 {len(texts)} 个文本的嵌入向量")
-        
-        # 并发生成嵌入向量（限制并发数避免过载）
-        semaphore = asyncio.Semaphore(3)  # 最多3个并发请求
+    async def generate_embeddings_batch(self, texts: Iterable[str]) -> List[Optional[List[float]]]:
+        """批量生成嵌入向量，texts 可以是边产出边消费的迭代器（如分块生成器）"""
+        # 并发提交，由批处理器合并为多输入请求（同时处理多个文档时跨文档合并）
+        semaphore = asyncio.Semaphore(self.EMBEDDING_BATCH_SIZE * self.EMBEDDING_MAX_CONCURRENT)
         
         async def generate_with_semaphore(text: str) -> Optional[List[float]]:
             async with semaphore:
                 return await self.generate_embedding(text)
         
-        tasks = [generate_with_semaphore(text) for text in texts]
+        tasks = []
+        try:
+            for text in texts:
+                tasks.append(asyncio.ensure_future(generate_with_semaphore(text)))
+                if len(tasks) % self.EMBEDDING_BATCH_SIZE == 0:
+                    # 每凑满一批让出事件循环，先发出嵌入请求，等待响应期间继续产出后续文本
+                    await asyncio.sleep(0)
+        except BaseException:
+            # 产出文本出错时取消已提交的请求
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        if not tasks:
+            return []
+        
+        logger.info(f"开始批量生成 {len(tasks)} 个文本的嵌入向量")
         embeddings = await asyncio.gather(*tasks, return_exceptions=True)
         
         # 处理异常结果
@@ -220,7 +348,7 @@ class EmbeddingService:
                 processed_embeddings.append(embedding)
                 success_count += 1
         
-        logger.info(f"批量嵌入生成完成: {success_count}/{len(texts)} 成功")
+        logger.info(f"批量嵌入生成完成: {success_count}/{len(tasks)} 成功")
         return processed_embeddings
     
     async def health_check(self) -> Dict[str, Any]:
@@ -1,11 +1,18 @@
 """
 LLM提供者基类
 """
+import asyncio
+import time
 from abc import ABC, abstractmethod
 from typing import Dict, List, Optional, AsyncGenerator
 from pydantic import BaseModel
 
 
+# 可用性缓存：超过有效期同步重新探测，超过刷新时间则先返回旧值并在后台刷新
+AVAILABILITY_TTL = 10.0  # 秒
+AVAILABILITY_REFRESH_AFTER = 5.0  # 秒
+
+
 class LLMResponse(BaseModel):
     """LLM响应模型"""
     content: str
@@ -29,6 +36,8 @@ class BaseLLMProvider(ABC):
         self.api_key = api_key
         self.model_name = model_name
         self._is_available = None
+        self._checked_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
     
     @abstractmethod
     async def generate(
@@ -36,9 +45,10 @@ class BaseLLMProvider(ABC):
         prompt: str, 
         max_tokens: int = 1000,
         temperature: float = 0.7,
-        stream: bool = False
+        stream: bool = False,
+        system: Optional[str] = None
     ) -> LLMResponse:
-        """生成文本"""
+        """生成文本（system 为可选的系统提示词）"""
         pass
     
     @abstractmethod
@@ -71,11 +81,29 @@ class BaseLLMProvider(ABC):
         pass
     
     async def is_available(self) -> bool:
-        """检查提供者是否可用"""
-        if self._is_available is None:
+        """检查提供者是否可用（带短期缓存）"""
+        age = time.monotonic() - self._checked_at
+        if self._is_available is None or age >= AVAILABILITY_TTL:
+            await asyncio.shield(self._start_refresh())
+        elif age >= AVAILABILITY_REFRESH_AFTER:
+            self._start_refresh()
+        return bool(self._is_available)
+    
+    def _start_refresh(self) -> asyncio.Task:
+        """发起健康检查，并发调用共享同一个探测任务"""
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_availability())
+        return self._refresh_task
+    
+    async def _refresh_availability(self):
+        """执行健康检查并记录结果"""
+        try:
             self._is_available = await self.health_check()
-        return self._is_available
+            self._checked_at = time.monotonic()
+        finally:
+            self._refresh_task = None
     
     def reset_availability(self):
-        """重置可用性状态"""
+        """重置可用性状态，下次调用立即重新检查"""
         self._is_available = None
+        self._checked_at = 0.0
@@ -22,14 +22,19 @@ class LMStudioProvider(BaseLLMProvider):
         prompt: str, 
         max_tokens: int = 1000,
         temperature: float = 0.7,
-        stream: bool = False
+        stream: bool = False,
+        system: Optional[str] = None
     ) -> LLMResponse:
         """生成文本"""
         url = f"{self.base_url}/v1/chat/completions"
         
+        messages = [{"role": "user", "content": prompt}]
+        if system:
+            messages.insert(0, {"role": "system", "content": system})
+        
         payload = {
             "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": messages,
             "max_tokens": max_tokens,
             "temperature": temperature,
             "stream": stream
@@ -22,7 +22,8 @@ class OllamaProvider(BaseLLMProvider):
         prompt: str, 
         max_tokens: int = 1000,
         temperature: float = 0.7,
-        stream: bool = False
+        stream: bool = False,
+        system: Optional[str] = None
     ) -> LLMResponse:
         """生成文本"""
         url = f"{self.base_url}/api/generate"
@@ -36,6 +37,8 @@ class OllamaProvider(BaseLLMProvider):
             },
             "stream": stream
         }
+        if system:
+            payload["system"] = system
         
         headers = {
             "Content-Type": "application/json"
@@ -0,0 +1,66 @@
+"""
+PDF页面文本提取（供进程池子进程使用）
+
+本模块只依赖 pdfplumber，forkserver 进程只预加载本模块，子进程无需导入应用的其他部分
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from loguru import logger
+import pdfplumber
+
+
+# PDF文本提取进程池（由应用生命周期创建和关闭）
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+
+
+def pdf_pages_text(pages) -> str:
+    """按顺序拼接页面文本，跳过没有文本的页面"""
+    parts = []
+    for page in pages:
+        page_text = page.extract_text()
+        if page_text:
+            parts.append(page_text + "\n")
+    return "".join(parts)
+
+
+def extract_pdf_pages_text(file_path: str, start: int, end: int) -> str:
+    """在子进程中提取PDF指定页范围 [start, end) 的文本"""
+    with pdfplumber.open(file_path) as pdf:
+        return pdf_pages_text(pdf.pages[start:end])
+
+
+def start_pdf_executor(max_workers: int) -> Optional[ProcessPoolExecutor]:
+    """创建PDF文本提取进程池（max_workers 不大于 0 时不启用）
+
+    优先使用 forkserver 且只预加载本模块；不支持 forkserver 的平台使用 spawn，
+    两者都不会在多线程的服务进程中直接 fork
+    """
+    global _pdf_executor
+    if max_workers <= 0 or _pdf_executor is not None:
+        return _pdf_executor
+
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context("forkserver")
+        mp_context.set_forkserver_preload([__name__])
+    else:
+        mp_context = multiprocessing.get_context("spawn")
+
+    _pdf_executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
+    logger.info(f"PDF文本提取进程池已创建: {max_workers} 个进程")
+    return _pdf_executor
+
+
+def get_pdf_executor() -> Optional[ProcessPoolExecutor]:
+    """获取PDF文本提取进程池（未创建时返回 None）"""
+    return _pdf_executor
+
+
+def shutdown_pdf_executor() -> None:
+    """关闭PDF文本提取进程池"""
+    global _pdf_executor
+    if _pdf_executor is not None:
+        _pdf_executor.shutdown(cancel_futures=True)
+        _pdf_executor = None
+        logger.info("PDF文本提取进程池已关闭")
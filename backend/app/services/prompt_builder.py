@@ -8,11 +8,16 @@ from datetime import datetime
 from loguru import logger
 
 from app.models.rag import (
-    ChatMessage, ChatRole, RetrievalContext, ContextWindow, 
+    ChatMessageRecord, ChatRole, RetrievalContext, ContextWindow, 
     QueryAnalysis, ContextStrategy
 )
 
 
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的token数"""
+    return int(len(text.split()) * 1.3)
+
+
 class PromptBuilder:
     """Prompt构建器"""
     
@@ -83,10 +88,17 @@ class PromptBuilder:
         
         return "\n\n".join(context_parts)
     
+    def message_tokens(self, message: ChatMessageRecord) -> int:
+        """获取消息的估算token数，首次计算后缓存在消息上"""
+        if message.token_count is None:
+            message.token_count = estimate_tokens(message.content)
+        return message.token_count
+    
     def build_conversation_context(
         self, 
-        messages: List[ChatMessage], 
-        max_messages: int = 10
+        messages: List[ChatMessageRecord], 
+        max_messages: int = 10,
+        max_tokens: Optional[int] = None
     ) -> str:
         """构建对话上下文"""
         if not messages:
@@ -95,6 +107,17 @@ class PromptBuilder:
         # 获取最近的消息
         recent_messages = messages[-max_messages:]
         
+        # 按token预算从最新的消息往前保留
+        if max_tokens is not None:
+            used_tokens = 0
+            start = len(recent_messages)
+            while start > 0:
+                used_tokens += self.message_tokens(recent_messages[start - 1])
+                if used_tokens > max_tokens:
+                    break
+                start -= 1
+            recent_messages = recent_messages[start:]
+        
         context_parts = []
         for msg in recent_messages:
             role_name = "用户" if msg.role == ChatRole.USER else "助手"
@@ -106,9 +129,10 @@ class PromptBuilder:
         self,
         user_query: str,
         retrieval_context: Optional[RetrievalContext] = None,
-        conversation_history: Optional[List[ChatMessage]] = None,
+        conversation_history: Optional[List[ChatMessageRecord]] = None,
         prompt_type: str = 'default',
-        strategy: ContextStrategy = ContextStrategy.RANKED
+        strategy: ContextStrategy = ContextStrategy.RANKED,
+        max_history_tokens: Optional[int] = None
     ) -> str:
         """构建完整的提示词"""
         prompt_parts = []
@@ -124,7 +148,9 @@ class PromptBuilder:
         
         # 3. 对话历史
         if conversation_history:
-            history_context = self.build_conversation_context(conversation_history)
+            history_context = self.build_conversation_context(
+                conversation_history, max_tokens=max_history_tokens
+            )
             if history_context:
                 prompt_parts.append(f"对话历史:\n{history_context}")
         
@@ -167,7 +193,7 @@ class PromptBuilder:
     ) -> str:
         """优化提示词长度"""
         # 简单的长度控制，实际应该使用tokenizer
-        estimated_tokens = len(prompt.split()) * 1.3  # 粗略估算
+        estimated_tokens = estimate_tokens(prompt)
         
         if estimated_tokens <= max_tokens:
             return prompt
@@ -192,7 +218,7 @@ class PromptBuilder:
             important_sections.append('\n'.join(current_section))
         
         # 如果还是太长，进一步缩短文档内容部分
-        if len('\n\n'.join(important_sections).split()) * 1.3 > max_tokens:
+        if estimate_tokens('\n\n'.join(important_sections)) > max_tokens:
             for i, section in enumerate(important_sections):
                 if '相关文档内容:' in section:
                     # 缩短文档内容
@@ -65,7 +65,8 @@ class RAGService:
                 user_query=request.message,
                 retrieval_context=retrieval_context,
                 conversation_history=conversation_history,
-                prompt_type='default'
+                prompt_type='default',
+                max_history_tokens=self.config.max_history_tokens
             )
             
             # 4. 生成回答
@@ -73,8 +74,10 @@ class RAGService:
             logger.info(f"回答生成完成: {len(response_text)} 字符")
             
             # 5. 更新对话历史
-            self.conversation_manager.add_message(conversation_id, ChatRole.USER, request.message)
-            self.conversation_manager.add_message(conversation_id, ChatRole.ASSISTANT, response_text)
+            self.conversation_manager.add_messages(conversation_id, [
+                (ChatRole.USER, request.message, None),
+                (ChatRole.ASSISTANT, response_text, None)
+            ])
             
             # 6. 构建响应
             response_time = time.time() - start_time
@@ -137,7 +140,8 @@ class RAGService:
                 user_query=request.message,
                 retrieval_context=retrieval_context,
                 conversation_history=conversation_history,
-                prompt_type='default'
+                prompt_type='default',
+                max_history_tokens=self.config.max_history_tokens
             )
             
             # 4. 流式生成回答
@@ -160,8 +164,10 @@ class RAGService:
             )
             
             # 6. 更新对话历史
-            self.conversation_manager.add_message(conversation_id, ChatRole.USER, request.message)
-            self.conversation_manager.add_message(conversation_id, ChatRole.ASSISTANT, full_response)
+            self.conversation_manager.add_messages(conversation_id, [
+                (ChatRole.USER, request.message, None),
+                (ChatRole.ASSISTANT, full_response, None)
+            ])
             
             logger.info("流式RAG聊天完成")
             
@@ -284,7 +290,7 @@ class RAGService:
                     if document:
                         filename = document.original_filename
                         document_type = document.document_type
-                        document_category = document.category or '未分类'
+                        document_category = document.category
                         author = document.metadata.author if document.metadata else None
                         title = document.metadata.title if document.metadata else None
                         created_at = document.created_at.isoformat() if document.created_at else None
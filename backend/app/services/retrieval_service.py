@@ -6,7 +6,10 @@ from typing import List, Dict, Any, Optional, Tuple, Set
 from datetime import datetime, timedelta
 from loguru import logger
 import re
+import time
 import asyncio
+import bisect
+import heapq
 from collections import defaultdict, Counter
 
 from app.services.vector_storage import vector_storage
@@ -21,6 +24,8 @@ class RetrievalService:
     def __init__(self):
         self.document_storage = DocumentStorage()
         self.search_history = []  # 搜索历史
+        self.query_counts = Counter()  # 历史查询频次
+        self._sorted_queries: List[str] = []  # 按字典序排列的去重查询，用于前缀查找
         self.query_cache = {}  # 查询缓存
         self.cache_ttl = 300  # 缓存5分钟
         
@@ -58,7 +63,7 @@ class RetrievalService:
             include_metadata: 包含元数据
             deduplicate: 去重
         """
-        start_time = datetime.now()
+        start_ns = time.perf_counter_ns()
         
         try:
             # 记录搜索历史
@@ -84,7 +89,7 @@ class RetrievalService:
             )
             
             if not candidate_documents:
-                return self._empty_search_result(query, start_time)
+                return self._empty_search_result(query, start_ns)
             
             candidate_doc_ids = [doc.id for doc in candidate_documents]
             
@@ -133,7 +138,7 @@ class RetrievalService:
                 'query': query,
                 'results': results,
                 'total_results': len(results),
-                'search_time': (datetime.now() - start_time).total_seconds(),
+                'search_time': (time.perf_counter_ns() - start_ns) / 1e9,
                 'search_strategy': {
                     'semantic_enabled': enable_semantic_search,
                     'keyword_enabled': enable_keyword_search,
@@ -149,15 +154,13 @@ class RetrievalService:
             return response
             
         except Exception as e:
-            logger.error(f"混合搜索失败: {str(e)}")
-            import traceback
-            logger.error(f"详细错误: {traceback.format_exc()}")
+            logger.opt(exception=True).error(f"混合搜索失败: {str(e)}")
             return {
                 'success': False,
                 'query': query,
                 'results': [],
                 'total_results': 0,
-                'search_time': (datetime.now() - start_time).total_seconds(),
+                'search_time': (time.perf_counter_ns() - start_ns) / 1e9,
                 'error': str(e)
             }
     
@@ -170,31 +173,35 @@ class RetrievalService:
         """语义搜索"""
         try:
             # 生成查询嵌入
-            query_embedding = await embedding_service.generate_embedding(query)
+            query_embedding = await embedding_service.generate_query_embedding(query)
             if not query_embedding:
                 logger.warning("查询嵌入生成失败，跳过语义搜索")
                 return []
             
-            # 执行向量搜索
-            search_results = vector_storage.search_similar_chunks(
+            # 执行向量搜索（同步的向量库查询放到线程池，避免阻塞事件循环）
+            search_results = await asyncio.to_thread(
+                vector_storage.search_similar_chunks,
                 query_embedding=query_embedding,
                 n_results=n_results,
                 document_ids=document_ids
             )
             
             # 格式化结果
-            results = []
-            for i in range(len(search_results["chunks"])):
-                result = {
-                    "text": search_results["chunks"][i],
-                    "metadata": search_results["metadata"][i],
-                    "similarity_score": 1 - search_results["distances"][i],
-                    "distance": search_results["distances"][i],
+            results = [
+                {
+                    "text": text,
+                    "metadata": metadata,
+                    "similarity_score": similarity,
+                    "distance": distance,
                     "search_type": "semantic",
-                    "chunk_id": search_results["metadata"][i].get("chunk_id", f"chunk_{i}"),
-                    "document_id": search_results["metadata"][i].get("document_id", "unknown")
+                    "chunk_id": metadata.get("chunk_id", f"chunk_{i}"),
+                    "document_id": metadata.get("document_id", "unknown")
                 }
-                results.append(result)
+                for i, (text, metadata, distance, similarity) in enumerate(zip(
+                    search_results["chunks"], search_results["metadata"],
+                    search_results["distances"], search_results["similarities"]
+                ))
+            ]
             
             logger.info(f"语义搜索完成: 返回 {len(results)} 个结果")
             return results
@@ -216,38 +223,8 @@ class RetrievalService:
             if not keywords:
                 return []
             
-            results = []
-            
-            for doc in documents:
-                if not doc.content:
-                    continue
-                
-                # 计算关键词匹配分数
-                keyword_score = self._calculate_keyword_score(doc.content, keywords)
-                if keyword_score > 0:
-                    # 找到匹配的文本片段
-                    matched_snippets = self._find_matching_snippets(doc.content, keywords)
-                    
-                    for snippet in matched_snippets[:3]:  # 每个文档最多3个片段
-                        result = {
-                            "text": snippet["text"],
-                            "metadata": {
-                                "document_id": doc.id,
-                                "filename": doc.filename,
-                                "document_type": doc.document_type,
-                                "matched_keywords": snippet["matched_keywords"]
-                            },
-                            "similarity_score": keyword_score,
-                            "search_type": "keyword",
-                            "document_id": doc.id,
-                            "snippet_start": snippet["start"],
-                            "snippet_end": snippet["end"]
-                        }
-                        results.append(result)
-            
-            # 按关键词匹配分数排序
-            results = sorted(results, key=lambda x: x["similarity_score"], reverse=True)
-            results = results[:n_results]
+            # 逐文档的匹配计算是纯CPU操作，放到线程池执行
+            results = await asyncio.to_thread(self._match_keywords_in_documents, documents, keywords, n_results)
             
             logger.info(f"关键词搜索完成: 返回 {len(results)} 个结果")
             return results
@@ -256,6 +233,48 @@ class RetrievalService:
             logger.error(f"关键词搜索失败: {str(e)}")
             return []
 
+    def _match_keywords_in_documents(
+        self,
+        documents: List[Document],
+        keywords: List[str],
+        n_results: int
+    ) -> List[Dict[str, Any]]:
+        """在文档中匹配关键词并按分数排序"""
+        results = []
+        
+        for doc in documents:
+            if not doc.content:
+                continue
+            
+            # 计算关键词匹配分数
+            keyword_score = self._calculate_keyword_score(doc.content, keywords)
+            if keyword_score > 0:
+                # 找到匹配的文本片段
+                matched_snippets = self._find_matching_snippets(doc.content, keywords)
+                
+                for snippet in matched_snippets[:3]:  # 每个文档最多3个片段
+                    result = {
+                        "text": snippet["text"],
+                        "metadata": {
+                            "document_id": doc.id,
+                            "filename": doc.filename,
+                            "document_type": doc.document_type,
+                            "matched_keywords": snippet["matched_keywords"]
+                        },
+                        "similarity_score": keyword_score,
+                        "search_type": "keyword",
+                        "document_id": doc.id,
+                        "snippet_start": snippet["start"],
+                        "snippet_end": snippet["end"]
+                    }
+                    results.append(result)
+        
+        # 按关键词匹配分数排序
+        results = sorted(results, key=lambda x: x["similarity_score"], reverse=True)
+        results = results[:n_results]
+        
+        return results
+
     def _extract_keywords(self, query: str) -> List[str]:
         """提取查询中的关键词"""
         # 简单的关键词提取，可以后续使用更高级的NLP技术
@@ -281,6 +300,8 @@ class RetrievalService:
             return 0.0
 
         content_lower = content.lower()
+        # 文档词数与关键词无关，只统计一次
+        word_count = len(content.split())
         total_score = 0.0
 
         for keyword in keywords:
@@ -289,7 +310,7 @@ class RetrievalService:
             count = content_lower.count(keyword_lower)
             if count > 0:
                 # 基于TF-IDF的简单评分
-                tf = count / len(content.split())
+                tf = count / word_count
                 score = tf * (1 + len(keyword) / 10)  # 长词权重更高
                 total_score += score
 
@@ -488,10 +509,30 @@ class RetrievalService:
             'timestamp': datetime.now(),
             'params': params
         })
+        if query not in self.query_counts:
+            bisect.insort(self._sorted_queries, query)
+        self.query_counts[query] += 1
 
         # 保持历史记录在合理范围内
         if len(self.search_history) > 1000:
             self.search_history = self.search_history[-500:]
+            self.query_counts = Counter(item['query'] for item in self.search_history)
+            self._sorted_queries = sorted(self.query_counts)
+
+    def get_history_suggestions(self, prefix: str, limit: int) -> List[Tuple[str, int]]:
+        """按前缀匹配历史查询，返回频次最高的 (查询, 次数)"""
+        if not prefix or limit <= 0:
+            return []
+
+        # 有序列表上二分定位前缀区间，只扫描匹配的查询
+        index = bisect.bisect_left(self._sorted_queries, prefix)
+        matches = []
+        while index < len(self._sorted_queries) and self._sorted_queries[index].startswith(prefix):
+            query = self._sorted_queries[index]
+            matches.append((query, self.query_counts[query]))
+            index += 1
+
+        return heapq.nlargest(limit, matches, key=lambda item: item[1])
 
     def _generate_cache_key(self, *args) -> str:
         """生成缓存键"""
@@ -527,14 +568,14 @@ class RetrievalService:
             for key in expired_keys:
                 del self.query_cache[key]
 
-    def _empty_search_result(self, query: str, start_time: datetime) -> Dict[str, Any]:
+    def _empty_search_result(self, query: str, start_ns: int) -> Dict[str, Any]:
         """返回空搜索结果"""
         return {
             'success': True,
             'query': query,
             'results': [],
             'total_results': 0,
-            'search_time': (datetime.now() - start_time).total_seconds(),
+            'search_time': (time.perf_counter_ns() - start_ns) / 1e9,
             'message': '没有找到匹配的文档'
         }
 
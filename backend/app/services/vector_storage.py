@@ -5,6 +5,7 @@ import os
 import uuid
 from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
+import numpy as np
 import chromadb
 from chromadb.config import Settings
 from loguru import logger
@@ -113,11 +114,13 @@ class VectorStorage:
                 include=["documents", "metadatas", "distances"]
             )
             
-            # 格式化结果
+            # 格式化结果，相似度分数一次性向量化计算
+            distances = results["distances"][0] if results["distances"] else []
             formatted_results = {
                 "chunks": results["documents"][0] if results["documents"] else [],
                 "metadata": results["metadatas"][0] if results["metadatas"] else [],
-                "distances": results["distances"][0] if results["distances"] else [],
+                "distances": distances,
+                "similarities": (1.0 - np.asarray(distances, dtype=np.float64)).tolist(),
                 "total_results": len(results["documents"][0]) if results["documents"] else 0
             }
             
@@ -126,7 +129,7 @@ class VectorStorage:
             
         except Exception as e:
             logger.error(f"向量搜索失败: {str(e)}")
-            return {"chunks": [], "metadata": [], "distances": [], "total_results": 0}
+            return {"chunks": [], "metadata": [], "distances": [], "similarities": [], "total_results": 0}
     
     def delete_document_chunks(self, document_id: str) -> bool:
         """删除指定文档的所有分块"""
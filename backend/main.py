@@ -3,6 +3,7 @@
 """
 import os
 import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 # 添加项目根目录到Python路径
@@ -11,15 +12,52 @@ sys.path.insert(0, str(project_root))
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from loguru import logger
 import uvicorn
 
 from app.core.config import get_settings
+from app.core.dependencies import init_services
 from app.core.llm_factory import get_llm_manager
+from app.services.pdf_extract import start_pdf_executor, shutdown_pdf_executor
 from app.api import documents, vectorization, retrieval, rag
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时创建服务实例并检查LLM提供者"""
+    logger.info("智能文档助理系统启动中...")
+    
+    # 创建服务单例，请求依赖直接读取 app.state
+    init_services(app)
+    
+    # 创建PDF文本提取进程池
+    start_pdf_executor(get_settings().PDF_EXTRACT_WORKERS)
+    
+    # 检查LLM提供者状态
+    llm_manager = get_llm_manager()
+    provider_status = await llm_manager.get_provider_status()
+    
+    logger.info("LLM提供者状态:")
+    for provider, status in provider_status.items():
+        status_text = "可用" if status else "不可用"
+        logger.info(f"  {provider}: {status_text}")
+    
+    # 检查是否有可用的提供者
+    if not any(provider_status.values()):
+        logger.warning("警告: 没有可用的LLM提供者！")
+    else:
+        logger.info(f"当前使用的提供者: {llm_manager.get_current_provider_name()}")
+    
+    logger.info("智能文档助理系统启动完成!")
+    
+    yield
+    
+    logger.info("智能文档助理系统正在关闭...")
+    shutdown_pdf_executor()
+
+
 def create_app() -> FastAPI:
     """创建FastAPI应用"""
     settings = get_settings()
@@ -28,7 +66,9 @@ def create_app() -> FastAPI:
         title=settings.APP_NAME,
         version=settings.APP_VERSION,
         description="基于LlamaIndex和LM Studio/Ollama的智能文档助理系统",
-        debug=settings.DEBUG
+        debug=settings.DEBUG,
+        default_response_class=ORJSONResponse,
+        lifespan=lifespan
     )
     
     # 配置CORS
@@ -74,35 +114,6 @@ def create_app() -> FastAPI:
 app = create_app()
 
 
-@app.on_event("startup")
-async def startup_event():
-    """应用启动事件"""
-    logger.info("智能文档助理系统启动中...")
-    
-    # 检查LLM提供者状态
-    llm_manager = get_llm_manager()
-    provider_status = await llm_manager.get_provider_status()
-    
-    logger.info("LLM提供者状态:")
-    for provider, status in provider_status.items():
-        status_text = "可用" if status else "不可用"
-        logger.info(f"  {provider}: {status_text}")
-    
-    # 检查是否有可用的提供者
-    if not any(provider_status.values()):
-        logger.warning("警告: 没有可用的LLM提供者！")
-    else:
-        logger.info(f"当前使用的提供者: {llm_manager.get_current_provider_name()}")
-    
-    logger.info("智能文档助理系统启动完成!")
-
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """应用关闭事件"""
-    logger.info("智能文档助理系统正在关闭...")
-
-
 @app.get("/")
 async def root():
     """根路径"""
@@ -0,0 +1,13 @@
+-- 分类列表查询优化迁移脚本
+-- 版本: 002
+-- 描述: 回填未分类文档的默认分类，并为按分类分页查询添加复合索引
+
+-- 1. 回填默认分类，使按分类查询可以直接命中索引
+UPDATE documents SET category = '未分类' WHERE category IS NULL OR category = '';
+
+-- 2. 创建分类+创建时间复合索引（与文档列表按 created_at 倒序分页的查询一致）
+CREATE INDEX IF NOT EXISTS idx_documents_category_created ON documents(category, created_at);
+
+-- 迁移完成标记
+INSERT OR IGNORE INTO system_config (key, value, description) VALUES
+('migration.002_category_listing_index', 'completed', '分类列表索引迁移完成标记');
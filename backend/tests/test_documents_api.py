@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+文档API单元测试
+"""
+import asyncio
+import hashlib
+import sqlite3
+import httpx
+import pytest
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import documents
+from app.core.config import get_settings
+from app.core.migration_manager import MigrationManager
+from app.models.document import Document, DocumentStatus, DocumentType
+from app.services.document_processor import FILE_HASH_ALGORITHM
+from app.services.document_storage import DocumentStorage
+
+
+@pytest.fixture
+def document_storage(tmp_path):
+    """使用临时数据库的文档存储（已应用全部迁移）"""
+    settings = get_settings().model_copy(update={"UPLOAD_DIR": str(tmp_path / "uploads")})
+    with patch("app.services.document_storage.get_settings", return_value=settings), \
+         patch("app.core.migration_manager.get_settings", return_value=settings):
+        storage = DocumentStorage()
+        MigrationManager().apply_all_pending_migrations()
+    DocumentStorage._document_cache.clear()
+
+    with patch.object(documents, "document_storage", storage):
+        yield storage
+    DocumentStorage._document_cache.clear()
+
+
+@pytest.fixture
+def upload_dir(tmp_path):
+    """临时上传目录"""
+    path = tmp_path / "uploads"
+    path.mkdir()
+    with patch.object(documents.document_processor, "upload_dir", path):
+        yield path
+
+
+@pytest.fixture
+def app(document_storage):
+    """只挂载文档路由的应用"""
+    app = FastAPI()
+    app.include_router(documents.router)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """测试客户端"""
+    return TestClient(app)
+
+
+class TestBatchDocuments:
+    """批量接口测试类"""
+
+    @pytest.fixture
+    def sample_document(self, document_storage, tmp_path):
+        """已入库的示例文档"""
+        document = Document(
+            id="doc1",
+            filename="doc1.txt",
+            original_filename="test1.txt",
+            file_path=str(tmp_path / "doc1.txt"),
+            file_size=100,
+            file_hash="hash-doc1",
+            document_type=DocumentType.TXT,
+            mime_type="text/plain",
+            status=DocumentStatus.PROCESSED
+        )
+        assert asyncio.run(document_storage.insert_document_if_new(document)) == document.id
+        return document
+
+    def test_mixed_get_and_post_batch(self, client, sample_document):
+        """GET 和 POST 子请求混合时按请求顺序返回各自的结果"""
+        response = client.post("/api/documents/batch", json={
+            "requests": [
+                {"id": "detail", "method": "GET", "url": f"/api/documents/{sample_document.id}"},
+                {"id": "process", "method": "POST", "url": "/api/documents/missing/process", "body": {}},
+                {"id": "stats", "method": "GET", "url": "/api/documents/categories/stats"}
+            ]
+        })
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        assert [sub["id"] for sub in data["responses"]] == ["detail", "process", "stats"]
+
+        detail, process, stats = data["responses"]
+        assert detail["status"] == 200
+        assert detail["body"]["document"]["id"] == sample_document.id
+        assert process["status"] == 404
+        assert stats["status"] == 200
+
+    def test_duplicate_sub_request_ids(self, client):
+        """子请求ID重复时整个批量请求返回 422"""
+        response = client.post("/api/documents/batch", json={
+            "requests": [
+                {"id": "same", "method": "GET", "url": "/api/documents/doc1"},
+                {"id": "same", "method": "GET", "url": "/api/documents/doc2"}
+            ]
+        })
+
+        assert response.status_code == 422
+
+    def test_sub_request_not_found(self, client, sample_document):
+        """单个子请求 404 不影响其他子请求"""
+        response = client.post("/api/documents/batch", json={
+            "requests": [
+                {"id": "missing", "method": "GET", "url": "/api/documents/missing"},
+                {"id": "found", "method": "GET", "url": f"/api/documents/{sample_document.id}"}
+            ]
+        })
+
+        assert response.status_code == 200
+        missing, found = response.json()["responses"]
+        assert missing == {"id": "missing", "status": 404, "body": {"detail": "文档不存在"}}
+        assert found["status"] == 200
+
+
+class TestUploadDeduplication:
+    """上传去重测试类"""
+
+    CONTENT = "相同内容的测试文档".encode("utf-8")
+
+    def _count_rows(self, document_storage, file_hash: str) -> int:
+        """统计指定哈希的文档记录数"""
+        with sqlite3.connect(document_storage.db_path) as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM documents WHERE file_hash = ?", (file_hash,)
+            ).fetchone()[0]
+
+    async def _upload(self, client: httpx.AsyncClient) -> httpx.Response:
+        """上传测试文档（不自动处理）"""
+        return await client.post(
+            "/api/documents/upload",
+            files={"file": ("test.txt", self.CONTENT, "text/plain")},
+            data={"auto_process": "false"}
+        )
+
+    @pytest.mark.asyncio
+    async def test_concurrent_uploads_of_same_content(self, app, document_storage, upload_dir):
+        """并发上传相同内容只保留一条记录和一个文件"""
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first, second = await asyncio.gather(self._upload(client), self._upload(client))
+
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert first.json()["document_id"] == second.json()["document_id"]
+
+        file_hash = hashlib.new(FILE_HASH_ALGORITHM, self.CONTENT).hexdigest()
+        assert self._count_rows(document_storage, file_hash) == 1
+        assert len(list(upload_dir.iterdir())) == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_document_does_not_block_reupload(self, app, document_storage, upload_dir):
+        """相同哈希的失败记录不影响重新上传"""
+        file_hash = hashlib.new(FILE_HASH_ALGORITHM, self.CONTENT).hexdigest()
+        failed = Document(
+            id="failed-doc",
+            filename="failed-doc.txt",
+            original_filename="test.txt",
+            file_path=str(upload_dir / "failed-doc.txt"),
+            file_size=len(self.CONTENT),
+            file_hash=file_hash,
+            document_type=DocumentType.TXT,
+            mime_type="text/plain",
+            status=DocumentStatus.FAILED
+        )
+        assert await document_storage.insert_document_if_new(failed) == failed.id
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await self._upload(client)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["document_id"] != failed.id
+        assert data["message"] == "文件上传成功"
+        assert self._count_rows(document_storage, file_hash) == 2
+        assert await document_storage.get_document(data["document_id"]) is not None
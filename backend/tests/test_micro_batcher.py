@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+微批处理器单元测试
+"""
+import pytest
+import asyncio
+
+from app.core.micro_batcher import MicroBatcher
+
+
+class TestMicroBatcher:
+    """微批处理器测试类"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_submits_are_batched(self):
+        """并发提交按批次大小合并，结果按提交顺序返回"""
+        batch_sizes = []
+
+        async def process_batch(items):
+            batch_sizes.append(len(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(process_batch, max_batch_size=4, max_wait=0.01)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+
+        assert results == [i * 2 for i in range(10)]
+        assert batch_sizes == [4, 4, 2]
+
+    @pytest.mark.asyncio
+    async def test_single_submit_flushes_after_wait(self):
+        """单个请求在等待时间到期后单独执行"""
+        batcher = MicroBatcher(lambda items: asyncio.sleep(0, result=items), max_batch_size=8, max_wait=0.01)
+
+        assert await batcher.submit("query") == "query"
+
+    @pytest.mark.asyncio
+    async def test_batches_are_bounded_by_total_weight(self):
+        """设置总大小上限时按大小切分批次，单个超大请求单独成批"""
+        batches = []
+
+        async def process_batch(items):
+            batches.append(list(items))
+            return items
+
+        batcher = MicroBatcher(process_batch, max_batch_size=8, max_wait=0.01, max_batch_weight=10, weight=len)
+        items = ["aaaa", "bbbb", "cccc", "d" * 12, "ee"]
+        results = await asyncio.gather(*(batcher.submit(item) for item in items))
+
+        assert results == items
+        assert batches == [["aaaa", "bbbb"], ["cccc"], ["d" * 12], ["ee"]]
+
+    @pytest.mark.asyncio
+    async def test_batch_error_propagates_to_all_waiters(self):
+        """批量调用失败时所有等待者收到异常"""
+        async def process_batch(items):
+            raise RuntimeError("batch failed")
+
+        batcher = MicroBatcher(process_batch, max_batch_size=2, max_wait=0.01)
+        results = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    @pytest.mark.asyncio
+    async def test_exception_results_fail_only_their_waiter(self):
+        """批量结果中的异常实例只传给对应的等待者"""
+        async def process_batch(items):
+            return [ValueError(item) if item < 0 else item for item in items]
+
+        batcher = MicroBatcher(process_batch, max_batch_size=3, max_wait=0.01)
+        results = await asyncio.gather(
+            batcher.submit(1), batcher.submit(-1), batcher.submit(2), return_exceptions=True
+        )
+
+        assert results[0] == 1 and results[2] == 2
+        assert isinstance(results[1], ValueError)
+
+    @pytest.mark.asyncio
+    async def test_missing_results_fail_waiters(self):
+        """批处理返回的结果数量不符时等待者收到异常而不是一直挂起"""
+        async def process_batch(items):
+            return items[:1]
+
+        batcher = MicroBatcher(process_batch, max_batch_size=2, max_wait=0.01)
+        results = await asyncio.wait_for(
+            asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True), timeout=1
+        )
+
+        assert all(isinstance(result, RuntimeError) for result in results)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+数据库迁移管理器单元测试
+"""
+import shutil
+import pytest
+from pathlib import Path
+from unittest.mock import patch
+
+from app.core.config import get_settings
+from app.core.migration_manager import MigrationManager
+from app.services.document_storage import DocumentStorage
+
+
+MIGRATIONS_DIR = Path(__file__).parent.parent / "migrations"
+
+
+class TestMigrationManager:
+    """迁移管理器测试类"""
+
+    @pytest.fixture
+    def migration_manager(self, tmp_path):
+        """使用临时数据库和迁移目录副本的迁移管理器（数据库已创建基础表结构）"""
+        settings = get_settings().model_copy(update={"UPLOAD_DIR": str(tmp_path / "uploads")})
+        with patch("app.services.document_storage.get_settings", return_value=settings), \
+             patch("app.core.migration_manager.get_settings", return_value=settings):
+            DocumentStorage()
+            manager = MigrationManager()
+
+        manager.migrations_dir = tmp_path / "migrations"
+        shutil.copytree(MIGRATIONS_DIR, manager.migrations_dir)
+        yield manager
+        if manager._conn is not None:
+            manager._conn.close()
+
+    @pytest.fixture
+    def migration_names(self):
+        """仓库中的迁移名列表"""
+        return [file_path.stem for file_path in sorted(MIGRATIONS_DIR.glob("*.sql"))]
+
+    def _history(self, manager: MigrationManager):
+        """读取迁移历史: 迁移名 -> (是否成功, 内容哈希)"""
+        cursor = manager._get_connection().execute(
+            "SELECT migration_name, success, content_hash FROM migration_history"
+        )
+        return {name: (bool(success), content_hash) for name, success, content_hash in cursor.fetchall()}
+
+    def _schema_object_exists(self, manager: MigrationManager, name: str) -> bool:
+        """检查表或索引是否存在"""
+        return manager._get_connection().execute(
+            "SELECT 1 FROM sqlite_master WHERE name = ?", (name,)
+        ).fetchone() is not None
+
+    def test_apply_all_pending_migrations(self, migration_manager, migration_names):
+        """全部迁移在一个事务中应用，并记录内容哈希"""
+        result = migration_manager.apply_all_pending_migrations()
+
+        assert result["success"] is True
+        assert result["applied"] == migration_names
+        assert migration_manager.get_pending_migrations() == []
+
+        history = self._history(migration_manager)
+        for migration_name in migration_names:
+            migration_file = migration_manager.migrations_dir / f"{migration_name}.sql"
+            assert history[migration_name] == (True, MigrationManager._hash_sql_file(migration_file))
+
+        columns = {row[1] for row in migration_manager._get_connection().execute("PRAGMA table_info(documents)")}
+        assert "category" in columns
+        assert self._schema_object_exists(migration_manager, "idx_documents_category_created")
+
+        # 再次执行没有待应用的迁移
+        assert migration_manager.apply_all_pending_migrations()["applied"] == []
+
+    def test_failing_migration_rolls_back_and_falls_back(self, migration_manager, migration_names):
+        """批量应用失败时整体回滚，再逐个应用并记录失败的迁移"""
+        broken = "999_broken_migration"
+        (migration_manager.migrations_dir / f"{broken}.sql").write_text(
+            "CREATE TABLE partial_table (id INTEGER PRIMARY KEY);\n"
+            "ALTER TABLE missing_table ADD COLUMN name TEXT;\n",
+            encoding="utf-8"
+        )
+
+        result = migration_manager.apply_all_pending_migrations()
+
+        assert result["success"] is False
+        assert result["applied"] == migration_names
+        assert result["failed"] == [broken]
+
+        # 失败迁移中已执行的语句随事务回滚
+        assert not self._schema_object_exists(migration_manager, "partial_table")
+        assert self._schema_object_exists(migration_manager, "idx_documents_category_created")
+
+        history = self._history(migration_manager)
+        assert history[broken] == (False, None)
+        assert all(history[migration_name][0] for migration_name in migration_names)
+        assert migration_manager.get_pending_migrations() == [broken]
+
+    def test_modified_migration_reported_as_drifted(self, migration_manager, migration_names):
+        """已应用的迁移文件被修改后报告为漂移，且不会重新执行"""
+        migration_manager.apply_all_pending_migrations()
+        assert migration_manager.get_drifted_migrations() == []
+
+        edited = migration_names[-1]
+        migration_file = migration_manager.migrations_dir / f"{edited}.sql"
+        with open(migration_file, "a", encoding="utf-8") as f:
+            f.write("\nCREATE INDEX IF NOT EXISTS idx_documents_edited ON documents(filename);\n")
+
+        assert migration_manager.get_drifted_migrations() == [edited]
+        assert migration_manager.get_migration_status()["drifted_migrations"] == [edited]
+
+        result = migration_manager.apply_all_pending_migrations()
+        assert result["applied"] == []
+        assert not self._schema_object_exists(migration_manager, "idx_documents_edited")
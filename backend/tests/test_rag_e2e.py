@@ -24,8 +24,9 @@ class TestRAGEndToEnd:
     
     @pytest.fixture(scope="class")
     def client(self):
-        """测试客户端"""
-        return TestClient(app)
+        """测试客户端（进入上下文以执行应用生命周期）"""
+        with TestClient(app) as client:
+            yield client
     
     @pytest.fixture(scope="class")
     def base_url(self):
@@ -275,6 +275,24 @@ class TestRetrievalService:
         assert len(stats['popular_queries']) > 0
         assert stats['popular_queries'][0]['query'] == '测试1'  # 最热门的查询
         assert stats['popular_queries'][0]['count'] == 2
+    
+    @pytest.fixture
+    def history_service(self):
+        """创建只使用搜索历史的检索服务实例（不连接文档数据库）"""
+        with patch('app.services.retrieval_service.DocumentStorage'):
+            return RetrievalService()
+    
+    def test_history_suggestions(self, history_service):
+        """测试历史查询前缀建议"""
+        for query in ['机器学习', '机器学习算法', '机器学习', '深度学习', '机器人']:
+            history_service._record_search_history(query, {})
+        
+        suggestions = history_service.get_history_suggestions('机器学', 5)
+        
+        # 只返回前缀匹配的查询，按频次排序
+        assert suggestions == [('机器学习', 2), ('机器学习算法', 1)]
+        assert history_service.get_history_suggestions('机器', 1) == [('机器学习', 2)]
+        assert history_service.get_history_suggestions('自然语言', 5) == []
 
 
 if __name__ == "__main__":